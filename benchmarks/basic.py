@@ -0,0 +1,91 @@
+""" BASIC ROM benchmark.
+
+Boots ROM.HEX, answers the memory size prompt, types in and runs a short
+BASIC program, then reports instructions per second with and without the
+decode cache and the cache's hit/miss/invalidation counters.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/basic.py
+"""
+import os
+from time import perf_counter
+
+from z80 import registers, instructions, bus
+from z80.aot import read_hex
+
+ROM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "roms", "ROM.HEX")
+SCRIPT = ("20000\r"
+          "10 S=0\r"
+          "20 FOR I=1 TO 30\r"
+          "30 S=S+I*I\r"
+          "40 NEXT I\r"
+          "50 PRINT S;SQR(S)\r"
+          "RUN\r")
+STEPS = 300000
+POLL = 2000
+
+
+class Terminal(bus.Bus):
+    """ The 6850 ACIA ports, fed from a script """
+    def __init__(self, memory, script):
+        super(Terminal, self).__init__(memory)
+        self.script = list(script)
+        self.pending = None
+        self.output = []
+
+    def in8(self, port):
+        port &= 0xFF
+        if port == 0x80:
+            return (1 << 1) | (self.pending is not None)
+        if self.pending is not None:
+            value, self.pending = self.pending, None
+            return value
+        return 0x13
+
+    def out8(self, port, value):
+        if port & 0xFF == 0x81:
+            self.output.append(chr(value))
+
+
+def run(cached):
+    memory = bytearray(64 * 1024)
+    read_hex(ROM, memory)
+    regs = registers.Registers()
+    instruction_set = instructions.InstructionSet(regs)
+    terminal = Terminal(memory, SCRIPT)
+    cache = instruction_set.enable_cache(terminal) if cached else None
+    step = instruction_set.step
+    interrupted = False
+    t = perf_counter()
+    for n in range(STEPS):
+        if n % POLL == 0 and terminal.pending is None and terminal.script:
+            terminal.pending = ord(terminal.script.pop(0))
+            interrupted = True
+        if interrupted and regs.IFF:
+            # IM 1, what the machine feeds the CPU is CALL 0038H
+            interrupted = False
+            regs.IFF = False
+            ins, args = instruction_set << 0xCD
+            ins, args = instruction_set << 0x38
+            ins, args = instruction_set << 0x00
+            ins.handler(regs, terminal, args)
+        else:
+            step(terminal)
+    t = perf_counter() - t
+    return t, terminal, cache
+
+
+if __name__ == '__main__':
+    t_plain, terminal, _ = run(False)
+    t_cached, terminal_cached, cache = run(True)
+    assert terminal.output == terminal_cached.output
+    print("".join(terminal.output).strip())
+    print("")
+    print("steps:               %10d" % STEPS)
+    print("decode every step:   %10.0f ins/s" % (STEPS / t_plain))
+    print("decode cache:        %10.0f ins/s" % (STEPS / t_cached))
+    stats = cache.stats()
+    print("cache hits:          %10d" % stats["hits"])
+    print("cache misses:        %10d" % stats["misses"])
+    print("cache invalidations: %10d" % stats["invalidations"])
+    print("cache hit rate:      %10.2f%%" % (100 * stats["hit_rate"]))
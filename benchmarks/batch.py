@@ -0,0 +1,45 @@
+""" Batch runner benchmark.
+
+Runs the same batch of BASIC jobs on pools of 1, 2, 4, ... workers up to
+the host's cores and reports jobs a second and the speedup over one
+worker. Each pool runs a batch first to start and boot its workers, so
+what is timed is the jobs alone.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/batch.py
+"""
+import os
+from time import perf_counter
+
+from z80 import batch
+
+PROGRAM = b"10 S=0:FOR I=1 TO %d:S=S+I*I:NEXT\r20 PRINT S\rRUN\r"
+
+# Jobs a batch per core
+PER_CORE = 4
+
+
+def sizes(cores):
+    n = 1
+    while n < cores:
+        yield n
+        n *= 2
+    yield cores
+
+
+if __name__ == '__main__':
+    cores = os.cpu_count() or 1
+    jobs = [batch.Job("job%d" % i, PROGRAM % (200 + i)) for i in range(PER_CORE * cores)]
+    base = None
+    for workers in sizes(cores):
+        with batch.Pool(workers=workers) as pool:
+            list(pool.run(jobs[:workers]))
+            t = perf_counter()
+            results = list(pool.run(jobs))
+            seconds = perf_counter() - t
+        assert all(result.reason == batch.DONE for result in results)
+        rate = len(jobs) / seconds
+        base = base or rate
+        tstates = sum(result.tstates for result in results)
+        print("%3d workers: %3d jobs %7.2f s  %6.1f jobs/s  %6.1f MT/s  %5.2fx" % (
+            workers, len(jobs), seconds, rate, tstates / seconds / 1e6, rate / base))
@@ -0,0 +1,72 @@
+""" Block instruction benchmark.
+
+Moves and scans 1K with LDIR, LDDR, CPIR and CPDR, and transfers 256
+bytes to and from a device with INIR and OTIR, first going round an
+instruction at a time as before (a bus budget of 0), then in one go,
+through the device's read_block and write_block.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/blocks.py
+"""
+from time import perf_counter
+
+from z80 import registers, instructions, bus, devices
+
+SIZE = 1024
+REPEATS = 20
+
+CODE = [("LDIR", [0xED, 0xB0], 0x1000, 0x4000),
+        ("LDDR", [0xED, 0xB8], 0x13FF, 0x43FF),
+        ("CPIR", [0xED, 0xB1], 0x1000, 0),
+        ("CPDR", [0xED, 0xB9], 0x13FF, 0)]
+
+IO = [("INIR", [0xED, 0xB2]),
+      ("OTIR", [0xED, 0xB3])]
+
+
+class Disk(devices.IO):
+    """ A data port reading zeros and throwing writes away """
+    _addresses = [0x10]
+    def read(self, address):
+        return 0
+    def write(self, address, value):
+        pass
+    def read_block(self, address, n):
+        return bytes(n)
+    def write_block(self, address, buffer):
+        pass
+
+
+def run(instruction_set, regs, memory_bus, code, hl, de, bc=SIZE):
+    memory_bus.memory[0x8000:0x8002] = bytes(code)
+    times = []
+    for _ in range(REPEATS):
+        regs.PC, regs.HL, regs.DE, regs.BC, regs.A = 0x8000, hl, de, bc, 0xFF
+        t = perf_counter()
+        while regs.PC == 0x8000:
+            instruction_set.step(memory_bus)
+        times.append(perf_counter() - t)
+    return min(times)
+
+
+if __name__ == '__main__':
+    regs = registers.Registers()
+    instruction_set = instructions.InstructionSet(regs)
+    iomap = devices.IOMap()
+    iomap.addDevice(Disk())
+    memory_bus = bus.Bus(bytearray(64 * 1024), iomap)
+    instruction_set.enable_cache(memory_bus)
+    for name, code, hl, de in CODE:
+        memory_bus.budget = 0
+        t_stepped = run(instruction_set, regs, memory_bus, code, hl, de)
+        memory_bus.budget = bus.UNLIMITED
+        t_bulk = run(instruction_set, regs, memory_bus, code, hl, de)
+        print("%s %dK:  stepped %8.1f us  bulk %6.1f us  %6.0fx" % (
+            name, SIZE // 1024, t_stepped * 1e6, t_bulk * 1e6, t_stepped / t_bulk))
+    for name, code in IO:
+        memory_bus.budget = 0
+        t_stepped = run(instruction_set, regs, memory_bus, code, 0x1000, 0, 0x0010)
+        memory_bus.budget = bus.UNLIMITED
+        t_bulk = run(instruction_set, regs, memory_bus, code, 0x1000, 0, 0x0010)
+        print("%s 256: stepped %8.1f us  bulk %6.1f us  %6.0fx" % (
+            name, t_stepped * 1e6, t_bulk * 1e6, t_stepped / t_bulk))
@@ -0,0 +1,125 @@
+""" Decode throughput benchmark.
+
+Sweeps the code in ROM.HEX and decodes every instruction found three ways:
+through Trie, a small copy of the nested-dict decoder InstructionSet had
+before the flat tables, kept here as the baseline; by feeding bytes one at
+a time through InstructionSet.__lshift__; and with InstructionSet.decode.
+The last two read the flat tables, so the trie against decode is the
+before and after, and << against decode the cost of the byte-at-a-time
+composer alone.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/decode.py
+"""
+import os
+from time import perf_counter
+
+from z80 import registers, instructions
+from z80.aot import read_hex
+
+ROM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "roms", "ROM.HEX")
+ROM_SIZE = 0x2000
+REPEATS = 5
+
+
+class Trie(object):
+    """ The old decoder: a dict per byte, operand bytes being 256 keys on
+        one shared dict, walked from the top for every byte fed in. Built
+        here from the flat tables; the lone index prefixes, instructions of
+        one byte in front of another, are left out as the old one had them """
+    def __init__(self, instruction_set):
+        self.root = {}
+        self.composer = []
+        for prefix in instructions.PREFIXES:
+            at = 3 if len(prefix) == 2 else len(prefix)
+            for op, ins in enumerate(instruction_set._tables[prefix]):
+                if ins is None or ins.length <= at:
+                    continue
+                code = list(prefix) + ["-"] * (ins.length - len(prefix))
+                code[at] = op
+                self._insert(code, ins)
+
+    def _insert(self, code, ins):
+        d = self.root
+        for byte in code[:-1]:
+            if byte == "-":
+                if not d:
+                    shared = {}
+                    for i in range(256):
+                        d[i] = shared
+                d = d[0]
+            else:
+                d = d.setdefault(byte, {})
+        for i in (range(256) if code[-1] == "-" else [code[-1]]):
+            d[i] = ins
+
+    def __lshift__(self, op):
+        self.composer.append(op)
+        q = self.root
+        for i in self.composer:
+            q = q[i]
+        if isinstance(q, dict):
+            return False, 0
+        ops = tuple(self.composer)
+        self.composer = []
+        return q, ops
+
+
+def sweep(instruction_set, memory):
+    """ Linear sweep of the ROM, returns the address of every instruction """
+    addresses = []
+    pc = 0
+    while pc < ROM_SIZE:
+        ins, operands = instruction_set.decode(memory, pc)
+        addresses.append(pc)
+        pc += ins.length
+    return addresses
+
+
+def composer(instruction_set, memory, addresses):
+    for pc in addresses:
+        ins = False
+        while not ins:
+            ins, args = instruction_set << memory[pc]
+            pc += 1
+
+
+def trie(decoder, memory, addresses):
+    for pc in addresses:
+        ins = False
+        while not ins:
+            ins, args = decoder << memory[pc]
+            pc += 1
+
+
+def table(instruction_set, memory, addresses):
+    decode = instruction_set.decode
+    for pc in addresses:
+        decode(memory, pc)
+
+
+def best(f, *args):
+    times = []
+    for _ in range(REPEATS):
+        t = perf_counter()
+        f(*args)
+        times.append(perf_counter() - t)
+    return min(times)
+
+
+if __name__ == '__main__':
+    memory = bytearray(64 * 1024)
+    read_hex(ROM, memory)
+    instruction_set = instructions.InstructionSet(registers.Registers())
+    addresses = sweep(instruction_set, memory)
+
+    n = len(addresses)
+    t_trie = best(trie, Trie(instruction_set), memory, addresses)
+    t_composer = best(composer, instruction_set, memory, addresses)
+    t_table = best(table, instruction_set, memory, addresses)
+    print("instructions decoded: %d" % n)
+    print("nested-dict trie:    %10.0f ins/s" % (n / t_trie))
+    print("byte composer (<<):  %10.0f ins/s" % (n / t_composer))
+    print("table decode:        %10.0f ins/s" % (n / t_table))
+    print("decode over trie:     %10.1fx" % (t_trie / t_table))
+    print("decode over <<:       %10.1fx" % (t_composer / t_table))
@@ -0,0 +1,83 @@
+""" Lazy flags benchmark.
+
+Runs the BASIC ROM benchmark's script on the interpreter, once with F
+worked out by every ALU operation and once with LazyRegisters, and
+reports instructions per second for both and how many of the deferred
+operations ever had their flags read. The table driven ALU in z80/alu.py
+sets F directly either way, so only what is left in z80/util.py defers.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/flags.py
+"""
+from time import perf_counter
+
+from z80 import registers, instructions
+from z80.aot import read_hex
+from basic import ROM, SCRIPT, STEPS, POLL, Terminal
+
+
+class CountingRegisters(registers.LazyRegisters):
+    """ LazyRegisters counting deferred operations and F being built """
+    __slots__ = ["deferred", "built"]
+
+    def __init__(self):
+        self.deferred = 0
+        self.built = 0
+        super(CountingRegisters, self).__init__()
+
+    def defer(self, *arg):
+        self.deferred += 1
+        super(CountingRegisters, self).defer(*arg)
+
+    @property
+    def F(self):
+        if self._pending is not None:
+            self.built += 1
+        return registers.LazyRegisters.F.__get__(self)
+
+    @F.setter
+    def F(self, val):
+        registers.LazyRegisters.F.__set__(self, val)
+
+
+def run(make_registers):
+    memory = bytearray(64 * 1024)
+    read_hex(ROM, memory)
+    regs = make_registers()
+    instruction_set = instructions.InstructionSet(regs)
+    terminal = Terminal(memory, SCRIPT)
+    instruction_set.enable_cache(terminal)
+    step = instruction_set.step
+    interrupted = False
+    t = perf_counter()
+    for n in range(STEPS):
+        if n % POLL == 0 and terminal.pending is None and terminal.script:
+            terminal.pending = ord(terminal.script.pop(0))
+            interrupted = True
+        if interrupted and regs.IFF:
+            # IM 1, what the machine feeds the CPU is CALL 0038H
+            interrupted = False
+            regs.IFF = False
+            ins, args = instruction_set << 0xCD
+            ins, args = instruction_set << 0x38
+            ins, args = instruction_set << 0x00
+            ins.handler(regs, terminal, args)
+        else:
+            step(terminal)
+    t = perf_counter() - t
+    return t, terminal, regs
+
+
+if __name__ == '__main__':
+    t_eager, terminal, _ = run(registers.Registers)
+    t_lazy, terminal_lazy, _ = run(registers.LazyRegisters)
+    _, terminal_counted, counted = run(CountingRegisters)
+    assert terminal.output == terminal_lazy.output == terminal_counted.output
+    print("".join(terminal.output).strip())
+    print("")
+    print("steps:             %10d" % STEPS)
+    print("eager flags:       %10.0f ins/s" % (STEPS / t_eager))
+    print("lazy flags:        %10.0f ins/s" % (STEPS / t_lazy))
+    print("speedup:           %10.2fx" % (t_eager / t_lazy))
+    print("deferred:          %10d" % counted.deferred)
+    print("F built:           %10d (%.1f%%)" % (counted.built, 100.0 * counted.built / counted.deferred))
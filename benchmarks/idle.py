@@ -0,0 +1,49 @@
+""" Idle session benchmark.
+
+Boots BASIC to its Ok prompt, then runs it at real speed and flat out on
+a thread the way z80sbc.py does, and measures the host CPU used while it
+waits for input, and how long a typed character takes to wake it.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/idle.py
+"""
+import threading
+import time
+
+from z80 import machine, devices, pacing, idle
+
+IDLE = 2.0
+TYPED = b"PRINT 1\r"
+
+
+def session(m, acia, spec):
+    pacer = pacing.pacer(spec)
+    worker = threading.Thread(target=m.run_paced, args=(pacer,))
+    cpu = time.process_time()
+    worker.start()
+    time.sleep(IDLE)
+    cpu = time.process_time() - cpu
+    for char in TYPED:
+        while not acia.receive(char):
+            time.sleep(0.001)
+        time.sleep(0.01)
+    time.sleep(0.2)
+    m.stop()
+    worker.join()
+    return cpu, pacer
+
+
+if __name__ == '__main__':
+    m = machine.Machine()
+    acia = m.add_device(devices.Acia(m))
+    m.run(2000000)
+    acia.type(b"\r", m.scheduler)
+    m.run(60000000)
+    assert bytes(acia.output).endswith(b"Ok\r\n")
+    for spec in ["real", "max"]:
+        m.idle = idle.Idle()
+        cpu, pacer = session(m, acia, spec)
+        assert bytes(acia.output).endswith(b" 1 \r\nOk\r\n")
+        print("%-5s idle CPU:    %6.1f%%" % (spec, 100.0 * cpu / IDLE))
+        print("%-5s %s" % (spec, pacer.report()))
+        print("%-5s %s" % (spec, m.idle.report()))
@@ -0,0 +1,81 @@
+""" Import time of the core modules.
+
+Imports each module in a fresh interpreter with -X importtime and
+reports the time it took, its own and with everything it pulled in,
+then how long building a headless Machine takes and whether Qt was
+loaded on the way, and last the cold start: from launching a fresh
+interpreter to the first instruction run, with a bare InstructionSet and
+with a Machine, against launching one that does nothing.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/imports.py
+"""
+import subprocess
+import sys
+import time
+
+MODULES = ["z80.trace", "z80.registers", "z80.alu", "z80.util", "z80.bus",
+           "z80.instructions", "z80.recompiler", "z80.aot", "z80.runner",
+           "z80.devices", "z80.machine"]
+
+STARTUP = """
+from time import perf_counter
+t = perf_counter()
+from z80 import machine
+imported = perf_counter() - t
+t = perf_counter()
+machine.Machine()
+print(imported, perf_counter() - t, "PySide2" in __import__("sys").modules)
+"""
+
+# Each prints the wall clock time once its first instruction has run
+COLD = [("nothing", "import time; print(time.time())"),
+        ("InstructionSet", "import time\n"
+                           "from z80 import registers, instructions, bus\n"
+                           "i = instructions.InstructionSet(registers.Registers())\n"
+                           "i.step(bus.Bus(bytearray(64 * 1024)))\n"
+                           "print(time.time())"),
+        ("Machine", "import time\n"
+                    "from z80 import machine\n"
+                    "machine.Machine().step_instruction()\n"
+                    "print(time.time())")]
+
+REPEATS = 5
+
+
+def import_time(module):
+    """ Own and cumulative microseconds importing module took """
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                         stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    for line in err.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[0].split(":")[1]), int(fields[1])
+
+
+def cold_start(code):
+    """ Fewest seconds from launching an interpreter running code to its
+        first instruction """
+    times = []
+    for _ in range(REPEATS):
+        t = time.time()
+        out = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True).stdout
+        times.append(float(out.split()[-1]) - t)
+    return min(times)
+
+
+if __name__ == '__main__':
+    print("%-20s %10s %12s" % ("module", "self us", "cumulative"))
+    for module in MODULES:
+        own, cumulative = import_time(module)
+        print("%-20s %10d %12d" % (module, own, cumulative))
+    out = subprocess.run([sys.executable, "-c", STARTUP], stdout=subprocess.PIPE,
+                         universal_newlines=True, check=True).stdout.split()
+    print("")
+    print("import z80.machine: %8.1f ms" % (float(out[0]) * 1000))
+    print("Machine():          %8.1f ms" % (float(out[1]) * 1000))
+    print("Qt loaded:          %8s" % out[2])
+    print("")
+    for name, code in COLD:
+        print("launch to first instruction, %-15s %8.1f ms" % (name + ":", cold_start(code) * 1000))
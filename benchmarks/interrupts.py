@@ -0,0 +1,59 @@
+""" Interrupt acceptance benchmark.
+
+Takes an IM 1 interrupt over and over, first the old way, feeding CALL
+0038H through InstructionSet.__lshift__ and running its handler, then
+with Interrupts.accept(), which pushes PC and jumps without decoding.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/interrupts.py
+"""
+from time import perf_counter
+
+from z80 import registers, instructions, bus, interrupts
+
+COUNT = 100000
+REPEATS = 5
+
+
+def composer(regs, instruction_set, memory_bus):
+    for _ in range(COUNT):
+        regs.SP = 0x8000
+        regs.IFF = False
+        ins, args = instruction_set << 0xCD
+        ins, args = instruction_set << 0x38
+        ins, args = instruction_set << 0x00
+        ins.handler(regs, memory_bus, args)
+
+
+def accept(regs, controller):
+    interrupt = controller.interrupt
+    accept = controller.accept
+    for _ in range(COUNT):
+        regs.SP = 0x8000
+        regs.IFF = True
+        interrupt()
+        accept()
+
+
+def best(f, *args):
+    times = []
+    for _ in range(REPEATS):
+        t = perf_counter()
+        f(*args)
+        times.append(perf_counter() - t)
+    return min(times)
+
+
+if __name__ == '__main__':
+    regs = registers.Registers()
+    regs.IM = 1
+    instruction_set = instructions.InstructionSet(regs)
+    memory_bus = bus.Bus(bytearray(64 * 1024))
+    controller = interrupts.Interrupts(regs, memory_bus, instruction_set.step)
+
+    t_composer = best(composer, regs, instruction_set, memory_bus)
+    t_accept = best(accept, regs, controller)
+    print("interrupts:        %10d" % COUNT)
+    print("composer:          %10.0f /s" % (COUNT / t_composer))
+    print("accept:            %10.0f /s" % (COUNT / t_accept))
+    print("speedup:           %10.2fx" % (t_composer / t_accept))
@@ -0,0 +1,89 @@
+""" Lockstep benchmark.
+
+Runs the same loop, over 256 bytes of data different in each machine,
+on N machines: as N independent interpreters, one InstructionSet and
+Bus each stepped to the HALT in turn, and as the N lanes of one
+Lockstep. Reports the instructions a second of all the machines
+together, and for Lockstep the steps and the share of instructions run
+vectorised. The loop branches on the data, so the lanes part and come
+back together. Needs NumPy; each lane has 64K of memory of its own.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/lockstep.py
+"""
+import random
+from time import perf_counter
+
+from z80 import registers, instructions, bus, lockstep
+
+COUNTS = [1, 10, 100, 1000]
+
+PROGRAM = 0x8000
+DATA = 0x9000
+
+# Adds up the bytes at DATA into DE, those from 80H up inverted first
+CODE = bytes([0x21, 0x00, 0x90,  #       LD HL,9000H
+              0x11, 0x00, 0x00,  #       LD DE,0000H
+              0x06, 0x00,        #       LD B,00H
+              0x7E,              # loop: LD A,(HL)
+              0xFE, 0x80,        #       CP 80H
+              0x38, 0x01,        #       JR C,add
+              0x2F,              #       CPL
+              0x83,              # add:  ADD A,E
+              0x5F,              #       LD E,A
+              0x30, 0x01,        #       JR NC,next
+              0x14,              #       INC D
+              0x23,              # next: INC HL
+              0x10, 0xF2,        #       DJNZ loop
+              0x76])             #       HALT
+
+
+def inputs(count):
+    rng = random.Random(count)
+    return [bytes(rng.randrange(256) for _ in range(256)) for _ in range(count)]
+
+
+def interpreters(data):
+    """ Seconds and instructions running each on a machine of its own """
+    machines = []
+    for block in data:
+        regs = registers.Registers()
+        memory = bytearray(0x10000)
+        memory[PROGRAM:PROGRAM + len(CODE)] = CODE
+        memory[DATA:DATA + len(block)] = block
+        regs.PC = PROGRAM
+        machines.append((regs, instructions.InstructionSet(regs), bus.Bus(memory)))
+    executed = 0
+    t = perf_counter()
+    for regs, instruction_set, memory_bus in machines:
+        step = instruction_set.step
+        while not regs.HALT:
+            step(memory_bus)
+            executed += 1
+    return perf_counter() - t, executed, [regs.DE for regs, _, _ in machines]
+
+
+def lanes(data):
+    """ Seconds, instructions and steps running them all as lanes """
+    machines = lockstep.Lockstep(len(data), CODE, PROGRAM)
+    for lane, block in enumerate(data):
+        machines.memory[lane, DATA:DATA + len(block)] = list(block)
+    machines.set("PC", PROGRAM)
+    t = perf_counter()
+    machines.run(1 << 30)
+    seconds = perf_counter() - t
+    return seconds, int(machines.executed.sum()), machines
+
+
+if __name__ == '__main__':
+    # the decode tables are built once, before anything is timed
+    instructions.InstructionSet(registers.Registers())
+    for count in COUNTS:
+        data = inputs(count)
+        t_one, executed, results = interpreters(data)
+        t_all, lane_executed, machines = lanes(data)
+        assert lane_executed == executed and list(machines.get("DE")) == results
+        print("N=%-5d interpreters %8.0f ins/s   lockstep %9.0f ins/s  %6.2fx"
+              "   %5d steps, %3.0f%% vectorised" % (
+                  count, executed / t_one, executed / t_all, t_one / t_all,
+                  machines.steps, 100.0 * machines.vectorised / executed))
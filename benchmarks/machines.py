@@ -0,0 +1,51 @@
+""" Many machines in one process.
+
+Makes 1, 100 and 1000 interpreted Machines and bare InstructionSets and
+reports the time each took to make and the memory each holds on to. The
+decode tables are built with the first one made in the process and
+shared by the rest, their cost is reported on its own first.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/machines.py
+"""
+import gc
+import tracemalloc
+from time import perf_counter
+
+from z80 import machine, instructions, registers
+
+COUNTS = [1, 100, 1000]
+
+KINDS = [("InstructionSet", lambda: instructions.InstructionSet(registers.Registers())),
+         ("Machine", lambda: machine.Machine(translate=False))]
+
+
+def make(kind, count):
+    """ Seconds and bytes per instance making count of kind, timed
+        without tracemalloc slowing it down """
+    gc.collect()
+    t = perf_counter()
+    kept = [kind() for _ in range(count)]
+    seconds = perf_counter() - t
+    del kept
+    gc.collect()
+    tracemalloc.start()
+    kept = [kind() for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return seconds / count, size / count
+
+
+if __name__ == '__main__':
+    t = perf_counter()
+    instructions.InstructionSet._build()
+    seconds = perf_counter() - t
+    tracemalloc.start()
+    instructions.InstructionSet._shared()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("%-15s %6s %8.2f ms  %8.1f KB" % ("tables", "", seconds * 1e3, size / 1024))
+    for name, kind in KINDS:
+        for count in COUNTS:
+            seconds, size = make(kind, count)
+            print("%-15s x%-5d %8.2f ms  %8.1f KB each" % (name, count, seconds * 1e3, size / 1024))
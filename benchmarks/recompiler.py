@@ -0,0 +1,93 @@
+""" Recompiler benchmark.
+
+Boots ROM.HEX and runs a BASIC loop long enough for the ROM's arithmetic
+to dominate, once stepping the interpreter, once running blocks translated
+as they are reached and once with the ROM translated ahead of time (RAM
+left to the interpreter), and reports emulated T-states per second.
+
+The recompiler comes out at about 3 to 4 times the interpreter and the
+ROM translated ahead of time at about 4 to 5 times, not the 10 times
+aimed for: with the ALU, the CB group, DAA and ADC/SBC HL translated
+inline, most of the time left goes on getting from one block to the
+next, a step() and a dictionary lookup for every few instructions.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/recompiler.py
+"""
+from time import perf_counter
+
+from z80 import registers, instructions, recompiler, aot
+from basic import ROM, Terminal
+
+SCRIPT = ("20000\r"
+          "10 S=0\r"
+          "20 FOR I=1 TO 300\r"
+          "30 S=S+I*I/7\r"
+          "40 NEXT I\r"
+          "50 PRINT S\r"
+          "RUN\r")
+POLL = 20000
+ROM_SIZE = 0x2000
+
+
+def run(mode):
+    memory = bytearray(64 * 1024)
+    aot.read_hex(ROM, memory)
+    regs = registers.Registers()
+    instruction_set = instructions.InstructionSet(regs)
+    terminal = Terminal(memory, SCRIPT)
+    if mode == "recompiler":
+        engine = recompiler.Recompiler(instruction_set, terminal)
+        step = engine.step
+    elif mode == "aot":
+        engine = recompiler.Recompiler(instruction_set, terminal, dynamic=False)
+        aot.load(engine, ROM_SIZE)
+        step = engine.step
+    else:
+        engine = None
+        def step():
+            return instruction_set.step(terminal)
+    tstates = 0
+    poll = 0
+    interrupted = False
+    t = perf_counter()
+    while True:
+        if tstates >= poll:
+            poll += POLL
+            if terminal.pending is None and terminal.script:
+                terminal.pending = ord(terminal.script.pop(0))
+                interrupted = True
+            elif not terminal.script and "".join(terminal.output).count("Ok\r\n") == 2:
+                # the prompt after boot, then the one after RUN
+                break
+        if interrupted and regs.IFF:
+            # IM 1, what the machine feeds the CPU is CALL 0038H
+            interrupted = False
+            regs.IFF = False
+            ins, args = instruction_set << 0xCD
+            ins, args = instruction_set << 0x38
+            ins, args = instruction_set << 0x00
+            ins.handler(regs, terminal, args)
+            tstates += ins.tstates
+        else:
+            tstates += step()
+    t = perf_counter() - t
+    return t, tstates, terminal, engine
+
+
+if __name__ == '__main__':
+    t_plain, tstates_plain, terminal, _ = run("interpreter")
+    t_blocks, tstates_blocks, terminal_blocks, engine = run("recompiler")
+    t_aot, tstates_aot, terminal_aot, _ = run("aot")
+    assert terminal.output == terminal_blocks.output == terminal_aot.output
+    print("".join(terminal.output).strip())
+    print("")
+    print("interpreter:   %10.0f T-states/s (%d in %.2fs)" % (tstates_plain / t_plain, tstates_plain, t_plain))
+    print("recompiler:    %10.0f T-states/s (%d in %.2fs)" % (tstates_blocks / t_blocks, tstates_blocks, t_blocks))
+    print("ahead of time: %10.0f T-states/s (%d in %.2fs)" % (tstates_aot / t_aot, tstates_aot, t_aot))
+    print("speedup:       %10.2fx" % ((tstates_blocks / t_blocks) / (tstates_plain / t_plain)))
+    print("speedup (aot): %10.2fx" % ((tstates_aot / t_aot) / (tstates_plain / t_plain)))
+    stats = engine.stats()
+    print("blocks:        %10d" % stats["blocks"])
+    print("translations:  %10d" % stats["translations"])
+    print("invalidations: %10d" % stats["invalidations"])
@@ -0,0 +1,47 @@
+""" Register file micro-benchmark.
+
+Times single accesses to a Registers: an 8 bit register, a 16 bit
+register, a pair made of two 8 bit ones, half of an index register and
+a flag bit, each read and written, and the same through the registers["A"]
+style the older code uses. Reports nanoseconds per access with the cost
+of the timing loop itself, shown first, taken off; a plain slot read is
+about as cheap as the loop and comes out near zero.
+
+    cd src
+    PYTHONPATH=`pwd`:$PYTHONPATH python ../benchmarks/registers.py
+"""
+import timeit
+
+from z80 import registers
+
+NUMBER = 200000
+REPEAT = 3
+
+ACCESSES = [
+    ("read A", "r.A"),
+    ("write A", "r.A = 1"),
+    ("read SP", "r.SP"),
+    ("write SP", "r.SP = 1"),
+    ("read HL", "r.HL"),
+    ("write HL", "r.HL = 0x1234"),
+    ("read IXH", "r.IXH"),
+    ("write IXH", "r.IXH = 0x12"),
+    ("read flag Z", "r.condition.Z"),
+    ("write flag C", "r.condition.C = 1"),
+    ('read r["A"]', 'r["A"]'),
+    ('write r["A"]', 'r["A"] = 1'),
+    ('read r["HL"]', 'r["HL"]'),
+]
+
+
+def per_access(statement, r):
+    best = min(timeit.repeat(statement, number=NUMBER, repeat=REPEAT, globals={"r": r}))
+    return best / NUMBER * 1e9
+
+
+if __name__ == '__main__':
+    r = registers.Registers()
+    empty = per_access("r", r)
+    print("%-16s %8.1f ns" % ("timing loop", empty))
+    for name, statement in ACCESSES:
+        print("%-16s %8.1f ns" % (name, max(0.0, per_access(statement, r) - empty)))
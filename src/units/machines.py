@@ -0,0 +1,64 @@
+""" What the unit tests build machines from: registers, an InstructionSet
+    and a bus over 64K, without the rest of z80.machine """
+from z80 import registers, instructions, bus, aot
+import os
+
+ROM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "roms", "ROM.HEX")
+
+
+class PortBus(bus.Bus):
+    """ Ports answer with a value made from the port, what goes in and out
+        is logged """
+    def __init__(self, memory):
+        super(PortBus, self).__init__(memory)
+        self.log = []
+
+    def in8(self, port):
+        self.log.append(port)
+        return (port * 7 + 3) & 0xFF
+
+    def out8(self, port, value):
+        self.log.append((port, value))
+
+
+class Terminal(bus.Bus):
+    """ The 6850 ACIA with nothing typed, output kept """
+    def __init__(self, memory):
+        super(Terminal, self).__init__(memory)
+        self.output = []
+
+    def in8(self, port):
+        return 0x02 if port & 0xFF == 0x80 else 0
+
+    def out8(self, port, value):
+        self.output.append((port & 0xFF, value))
+
+
+class Machine(object):
+    """ make_registers() and make_bus(memory) give the parts; rom loads
+        ROM.HEX, end being the address after it """
+    def __init__(self, make_registers=registers.Registers, make_bus=PortBus, rom=False):
+        self.registers = make_registers()
+        self.instructions = instructions.InstructionSet(self.registers)
+        self.mem = bytearray(64*1024)
+        self.end = aot.read_hex(ROM, self.mem) if rom else 0
+        self.bus = make_bus(self.mem)
+
+    def load(self, state, memory):
+        self.mem[:] = memory
+        self.registers.reset()
+        for name, value in state.items():
+            self.registers[name] = value
+        self.bus.log = []
+
+    def state(self):
+        return [self.registers[name] for name in registers.NAMES], bytes(self.mem), self.bus.log
+
+
+def random_state(rng, **fixed):
+    """ Every register random, those in fixed set as given """
+    state = dict((name, rng.randrange(0x10000 if len(name) == 2 and name[0] in "PSI" else 0x100))
+                 for name in registers.NAMES)
+    state.update(IFF=False, IFF2=False, IM=1, HALT=False, EI_DELAY=False)
+    state.update(fixed)
+    return state
@@ -0,0 +1,51 @@
+from z80 import alu
+import unittest
+
+
+class TestAlu(unittest.TestCase):
+
+    def test_sizes(self):
+        self.assertEqual(len(alu.ADD_F), 2 * 256 * 256)
+        self.assertEqual(len(alu.DAA_A), 8 * 256)
+        self.assertEqual(len(alu.SHIFT_F), 8 * 2 * 256)
+        self.assertLess(alu.footprint(), 300 * 1024)
+
+    def test_add_sub(self):
+        # 7F + 01: overflow and half carry, result 80
+        self.assertEqual(alu.ADD_F[0x7F << 8 | 0x01], alu.S | alu.H | alu.PV)
+        # FF + 00 + carry: zero with carry out
+        self.assertEqual(alu.ADD_F[1 << 16 | 0xFF << 8 | 0x00], alu.Z | alu.H | alu.C)
+        # 00 - 01: borrow, result FF
+        self.assertEqual(alu.SUB_F[0x00 << 8 | 0x01],
+                         alu.S | alu.F5 | alu.H | alu.F3 | alu.N | alu.C)
+        # 80 - 01: overflow
+        self.assertEqual(alu.SUB_F[0x80 << 8 | 0x01], alu.F5 | alu.H | alu.F3 | alu.PV | alu.N)
+
+    def test_inc_dec(self):
+        self.assertEqual(alu.INC_F[0x7F], alu.S | alu.H | alu.PV)
+        self.assertEqual(alu.DEC_F[0x01], alu.Z | alu.N)
+        self.assertFalse(any(f & alu.C for f in alu.INC_F + alu.DEC_F))
+
+    def test_daa(self):
+        # 15 + 27 = 3C, adjusted to 42
+        self.assertEqual(alu.DAA_A[0x3C], 0x42)
+        # 42 - 15 = 2D with half borrow, adjusted to 27
+        i = (alu.N | alu.H >> 2) << 8 | 0x2D
+        self.assertEqual(alu.DAA_A[i], 0x27)
+        self.assertEqual(alu.DAA_F[i] & (alu.N | alu.C), alu.N)
+
+    def test_shift(self):
+        self.assertEqual(alu.SHIFT_R[alu.RLC | 0x81], 0x03)
+        self.assertEqual(alu.SHIFT_F[alu.RLC | 0x81], alu.PV | alu.C)
+        self.assertEqual(alu.SHIFT_R[alu.RL | 1 << 8 | 0x00], 0x01)
+        self.assertEqual(alu.SHIFT_R[alu.SRA | 0x80], 0xC0)
+        self.assertEqual(alu.SHIFT_R[alu.SLL | 0x00], 0x01)
+        self.assertEqual(alu.SHIFT_F[alu.SRL | 0x01], alu.Z | alu.PV | alu.C)
+
+    def test_bit(self):
+        self.assertEqual(alu.BIT_F[7 << 8 | 0x80], alu.S | alu.H)
+        self.assertEqual(alu.BIT_F[0 << 8 | 0x28], alu.Z | alu.F5 | alu.H | alu.F3 | alu.PV)
+
+
+if __name__ == '__main__':
+    unittest.main()
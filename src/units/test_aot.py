@@ -0,0 +1,86 @@
+from z80 import registers, recompiler, aot
+from machines import Machine, Terminal
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def build(directory):
+    machine = Machine(make_bus=Terminal, rom=True)
+    return aot.build(machine.instructions, machine.mem, machine.end, directory)
+
+
+class TestAot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tables_are_found(self):
+        machine = Machine(make_bus=Terminal, rom=True)
+        found = aot.entries(machine.mem, machine.end)
+        # the reset and RST vectors, 37 keywords and 28 functions less
+        # PSET, RESET, USR and POINT, which jump to RAM
+        self.assertEqual(len(found), 8 + 37 + 28 - 4)
+        # END, the first keyword
+        self.assertIn(0x099F, found)
+
+    def test_boot_matches_interpreter(self):
+        interpreter = Machine(make_bus=Terminal, rom=True)
+        translated = Machine(make_bus=Terminal, rom=True)
+        engine = recompiler.Recompiler(translated.instructions, translated.bus, dynamic=False)
+        count = aot.load(engine, translated.end, self.directory)
+        self.assertGreater(count, 1000)
+        name = aot._module_name(aot.digest(translated.mem, translated.end)) + ".py"
+        self.assertTrue(os.path.exists(os.path.join(self.directory, name)))
+        taken = 0
+        while taken < 300000:
+            taken += interpreter.instructions.step(interpreter.bus)
+        self.assertEqual(engine.run(300000), taken)
+        self.assertEqual(engine.translations, 0)
+        self.assertEqual([translated.registers[name] for name in registers.NAMES],
+                         [interpreter.registers[name] for name in registers.NAMES])
+        self.assertEqual(translated.mem, interpreter.mem)
+        self.assertEqual(translated.bus.output, interpreter.bus.output)
+        self.assertTrue(interpreter.bus.output)
+
+    def test_module_is_reused(self):
+        machine = Machine(make_bus=Terminal, rom=True)
+        path = aot.build(machine.instructions, machine.mem, machine.end, self.directory)
+        modified = os.path.getmtime(path)
+        engine = recompiler.Recompiler(machine.instructions, machine.bus, dynamic=False)
+        aot.load(engine, machine.end, self.directory)
+        self.assertEqual(os.path.getmtime(path), modified)
+
+    def test_older_modules_are_removed(self):
+        machine = Machine(make_bus=Terminal, rom=True)
+        rom_digest = aot.digest(machine.mem, machine.end)
+        os.makedirs(os.path.join(self.directory, "__pycache__"))
+        older = ["rom_%s_00000000.py" % rom_digest,
+                 os.path.join("__pycache__", "rom_%s_00000000.cpython-311.pyc" % rom_digest)]
+        other = ["rom_%s_00000000.py" % ("0" * 40)]
+        for name in older + other:
+            open(os.path.join(self.directory, name), "w").close()
+        path = aot.build(machine.instructions, machine.mem, machine.end, self.directory)
+        self.assertTrue(os.path.exists(path))
+        for name in older:
+            self.assertFalse(os.path.exists(os.path.join(self.directory, name)))
+        for name in other:
+            self.assertTrue(os.path.exists(os.path.join(self.directory, name)))
+
+    def test_builds_at_once(self):
+        with concurrent.futures.ProcessPoolExecutor(8) as pool:
+            paths = list(pool.map(build, [self.directory] * 8))
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(paths[0])])
+        machine = Machine(make_bus=Terminal, rom=True)
+        engine = recompiler.Recompiler(machine.instructions, machine.bus, dynamic=False)
+        self.assertGreater(aot.load(engine, machine.end, self.directory), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+from z80 import batch, runner, aot
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+PROGRAM = b"10 FOR I=1 TO 100:S=S+I:NEXT\r20 PRINT S\rRUN\r"
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_jobs_start_afresh(self):
+        m, state = batch.boot()
+        first = batch.run_job(m, state, batch.Job("first", b"A=5\rPRINT A\r"))
+        self.assertEqual(first.reason, batch.DONE)
+        self.assertTrue(first.output.endswith(b" 5 \r\nOk\r\n"))
+        second = batch.run_job(m, state, batch.Job("second", b"PRINT A\r"))
+        self.assertEqual(second.output, b"PRINT A\r\n 0 \r\nOk\r\n")
+        self.assertLess(second.tstates, first.tstates)
+
+    def test_cycle_limit(self):
+        m, state = batch.boot()
+        result = batch.run_job(m, state, batch.Job("loop", b"10 GOTO 10\rRUN\r", 3000000, capture=False))
+        self.assertEqual(result.reason, runner.CYCLES)
+        self.assertGreaterEqual(result.tstates, 3000000)
+        self.assertLess(result.tstates, 3000000 + 100)
+        self.assertIsNone(result.output)
+
+    def test_pool(self):
+        jobs = [batch.Job("job%d" % i, b"PRINT %d*3\r" % i) for i in range(6)] + \
+               [batch.Job("program", PROGRAM)]
+        results = dict((result.name, result) for result in batch.run(jobs, workers=2))
+        self.assertEqual(sorted(results), sorted(job.name for job in jobs))
+        for i in range(6):
+            self.assertTrue(results["job%d" % i].output.endswith(b" %d \r\nOk\r\n" % (i * 3)))
+        self.assertTrue(results["program"].output.endswith(b" 5050 \r\nOk\r\n"))
+        self.assertLessEqual(len(set(result.worker for result in results.values())), 2)
+
+    def test_pool_builds_translation_once(self):
+        # a fresh checkout: the workers find the module the pool built
+        directory = tempfile.mkdtemp()
+        try:
+            with mock.patch.object(aot, "DIRECTORY", directory):
+                with batch.Pool(workers=4) as pool:
+                    modules = os.listdir(directory)
+                    self.assertEqual(len(modules), 1)
+                    jobs = [batch.Job("job%d" % i, b"PRINT %d\r" % i) for i in range(4)]
+                    results = list(pool.run(jobs))
+                self.assertEqual([result.reason for result in results], [batch.DONE] * 4)
+                self.assertEqual([name for name in os.listdir(directory) if name.endswith(".py")], modules)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+from z80 import registers, instructions, bus, devices
+from z80.registers import NAMES
+import random
+import unittest
+
+LDIR = [0xED, 0xB0]
+LDDR = [0xED, 0xB8]
+CPIR = [0xED, 0xB1]
+CPDR = [0xED, 0xB9]
+INIR = [0xED, 0xB2]
+INDR = [0xED, 0xBA]
+OTIR = [0xED, 0xB3]
+OTDR = [0xED, 0xBB]
+
+
+class Port(devices.IO):
+    """ Counts out what is read, keeps what is written """
+    _addresses = [0x10]
+    def __init__(self):
+        self.next = 0
+        self.written = []
+
+    def read(self, address):
+        self.next = (self.next + 7) & 0xFF
+        return self.next
+
+    def write(self, address, value):
+        self.written.append(value)
+
+
+class PortBus(bus.Bus):
+    """ Logs the whole port of every read and write """
+    def __init__(self, memory):
+        bus.Bus.__init__(self, memory)
+        self.log = []
+
+    def in8(self, port):
+        self.log.append(port)
+        return port & 0xFF
+
+    def out8(self, port, value):
+        self.log.append((port, value))
+
+
+class BlockPort(Port):
+    def __init__(self):
+        Port.__init__(self)
+        self.calls = 0
+        self.views = []
+
+    def read_block(self, address, n):
+        self.calls += 1
+        return bytes(self.read(address) for _ in range(n))
+
+    def write_block(self, address, buffer):
+        self.calls += 1
+        self.views.append(isinstance(buffer, memoryview))
+        self.written.extend(bytes(buffer))
+
+
+class TestBlocks(unittest.TestCase):
+    """ Block instructions going round in one go against going round an
+        instruction at a time """
+
+    def setUp(self):
+        self.random = random.Random(19)
+
+    def cpu(self, code, hl, de, bc, a=0):
+        regs = registers.Registers()
+        mem = bytearray(self.random.getrandbits(8) for _ in range(64*1024))
+        mem[0x8000:0x8000 + len(code)] = bytes(code)
+        regs.PC = 0x8000
+        regs.HL, regs.DE, regs.BC, regs.A = hl, de, bc, a
+        instruction_set = instructions.InstructionSet(regs)
+        memory_bus = bus.Bus(mem)
+        instruction_set.enable_cache(memory_bus)
+        return regs, instruction_set, memory_bus
+
+    def run_both(self, code, hl, de, bc, a=0, budget=bus.UNLIMITED):
+        state = self.random.getstate()
+        results = []
+        for each in [budget, 0]:
+            self.random.setstate(state)
+            regs, instruction_set, memory_bus = self.cpu(code, hl, de, bc, a)
+            memory_bus.budget = each
+            taken = 0
+            while regs.PC == 0x8000 and taken < budget:
+                taken += instruction_set.step(memory_bus)
+            results.append(([getattr(regs, name) for name in NAMES], memory_bus.memory, taken))
+        return results
+
+    def check(self, code, hl, de, bc, a=0, budget=bus.UNLIMITED):
+        bulk, stepped = self.run_both(code, hl, de, bc, a, budget)
+        self.assertEqual(bulk[0], stepped[0])
+        self.assertEqual(bulk[2], stepped[2])
+        self.assertTrue(bulk[1] == stepped[1])
+
+    def test_ldir(self):
+        self.check(LDIR, 0x1000, 0x2000, 0x0400)
+        # overlapping, copying forwards fills with the bytes between
+        self.check(LDIR, 0x1000, 0x1003, 0x0100)
+        self.check(LDIR, 0x1003, 0x1000, 0x0100)
+        # round the top of memory
+        self.check(LDIR, 0xFFF0, 0x4000, 0x0040)
+        self.check(LDIR, 0x4000, 0xFFF8, 0x0040)
+
+    def test_lddr(self):
+        self.check(LDDR, 0x2000, 0x3000, 0x0400)
+        self.check(LDDR, 0x1003, 0x1000, 0x0100)
+        self.check(LDDR, 0x1000, 0x1003, 0x0100)
+        self.check(LDDR, 0x0010, 0x4000, 0x0040)
+
+    def test_cpir(self):
+        for a in [0x00, 0x55, 0xFF]:
+            self.check(CPIR, 0x1000, 0, 0x0800, a)
+            self.check(CPIR, 0xFF00, 0, 0x0400, a)
+        regs, instruction_set, memory_bus = self.cpu(CPIR, 0x1000, 0, 0x0100, 0x55)
+        memory_bus.memory[0x1000:0x1100] = bytes(0x100)
+        memory_bus.memory[0x1040] = 0x55
+        self.assertEqual(instruction_set.step(memory_bus), 64 * 21 + 16)
+        self.assertEqual(regs.HL, 0x1041)
+        self.assertEqual(regs.BC, 0x00BF)
+        self.assertEqual(regs.PC, 0x8002)
+        self.assertTrue(regs.condition.Z)
+
+    def test_cpdr(self):
+        for a in [0x00, 0x55, 0xFF]:
+            self.check(CPDR, 0x1000, 0, 0x0800, a)
+            self.check(CPDR, 0x0100, 0, 0x0400, a)
+
+    def test_budget(self):
+        # stops going round once past the budget, as stepping would
+        for budget in [1, 21, 22, 1000]:
+            self.check(LDIR, 0x1000, 0x2000, 0x0400, budget=budget)
+            self.check(CPDR, 0x1000, 0, 0x0400, 0x10, budget=budget)
+
+    def test_code_overwritten(self):
+        # LDIR / LD A,01H, copied over by LD A,02H
+        regs, instruction_set, memory_bus = self.cpu(LDIR + [0x3E, 0x01], 0x1000, 0x8002, 2)
+        memory_bus.memory[0x1000:0x1002] = bytes([0x3E, 0x02])
+        memory_bus.memory[0x8002:0x8004] = bytes([0x3E, 0x01])
+        instruction_set.cache.lookup(0x8002)
+        instruction_set.step(memory_bus)
+        instruction_set.step(memory_bus)
+        self.assertEqual(regs.A, 2)
+
+
+class TestBlockIO(unittest.TestCase):
+
+    def run_io(self, device, code, hl, b):
+        regs = registers.Registers()
+        mem = bytearray(range(256)) * 256
+        mem[0x8000:0x8002] = bytes(code)
+        regs.PC, regs.HL, regs.B, regs.C = 0x8000, hl, b, 0x10
+        iomap = devices.IOMap()
+        iomap.addDevice(device)
+        memory_bus = bus.Bus(mem, iomap)
+        instruction_set = instructions.InstructionSet(regs)
+        taken = 0
+        while regs.PC == 0x8000:
+            taken += instruction_set.step(memory_bus)
+        return [getattr(regs, name) for name in NAMES], mem, taken
+
+    def test_against_bytes(self):
+        for code in [INIR, INDR, OTIR, OTDR]:
+            for hl, b in [(0x1000, 0x80), (0xFFF0, 0x40), (0x0010, 0x40), (0x2000, 0)]:
+                plain, block = Port(), BlockPort()
+                expected = self.run_io(plain, code, hl, b)
+                got = self.run_io(block, code, hl, b)
+                self.assertEqual(got[0], expected[0])
+                self.assertEqual(got[2], expected[2])
+                self.assertTrue(got[1] == expected[1])
+                self.assertEqual(block.written, plain.written)
+                self.assertLessEqual(block.calls, 2)
+                self.assertTrue(all(block.views))
+
+    def test_ports_count_down(self):
+        # with no device the bus is asked byte by byte, B going down
+        for code in [INIR, INDR, OTIR, OTDR]:
+            for b in [0x03, 0x80, 0]:
+                logs = []
+                for budget in [bus.UNLIMITED, 0]:
+                    regs = registers.Registers()
+                    mem = bytearray(range(256)) * 256
+                    mem[0x8000:0x8002] = bytes(code)
+                    regs.PC, regs.HL, regs.B, regs.C = 0x8000, 0x1000, b, 0x10
+                    memory_bus = PortBus(mem)
+                    memory_bus.budget = budget
+                    instruction_set = instructions.InstructionSet(regs)
+                    while regs.PC == 0x8000:
+                        instruction_set.step(memory_bus)
+                    logs.append(memory_bus.log)
+                self.assertEqual(logs[0], logs[1])
+                self.assertEqual(len(logs[0]), b or 0x100)
+                self.assertEqual(len(set(logs[0])), b or 0x100)
+
+
+class TestMove(unittest.TestCase):
+
+    def test_against_bytes(self):
+        rand = random.Random(20)
+        for _ in range(200):
+            mem = bytearray(rand.getrandbits(8) for _ in range(64*1024))
+            expected = bytearray(mem)
+            source = rand.choice([rand.randrange(0x10000), 0xFFF0, 0x0008])
+            destination = (source + rand.randrange(-40, 40)) & 0xFFFF
+            count = rand.randrange(1, 300)
+            step = rand.choice([1, -1])
+            s, d = source, destination
+            for _ in range(count):
+                expected[d] = expected[s]
+                s = (s + step) & 0xFFFF
+                d = (d + step) & 0xFFFF
+            bus.Bus(mem).move(destination, source, count, step)
+            self.assertTrue(mem == expected, (source, destination, count, step))
+
+    def test_find(self):
+        mem = bytearray(64*1024)
+        mem[0x0005] = 1
+        mem[0xFFFA] = 2
+        memory_bus = bus.Bus(mem)
+        self.assertEqual(memory_bus.find(1, 0xFFF0, 100), 0x15)
+        self.assertEqual(memory_bus.find(1, 0xFFF0, 0x15), None)
+        self.assertEqual(memory_bus.find(2, 0x0010, 100, -1), 0x16)
+        self.assertEqual(memory_bus.find(2, 0x0010, 0x16, -1), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
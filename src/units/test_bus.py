@@ -0,0 +1,88 @@
+from z80 import registers, instructions, bus
+import itertools
+import tracemalloc
+import unittest
+
+# LD HL,0080H / LD B,10H / loop: LD A,(HL) / INC A / LD (HL),A / INC HL /
+# DJNZ loop / JP 0000H
+LOOP = [0x21, 0x80, 0x00, 0x06, 0x10, 0x7E, 0x3C, 0x77, 0x23, 0x10, 0xFA,
+        0xC3, 0x00, 0x00]
+
+class TestBus(unittest.TestCase):
+
+    def setUp(self):
+        self.registers = registers.Registers()
+        self.instructions = instructions.InstructionSet(self.registers)
+        self.mem = bytearray(64*1024)
+        self.bus = bus.Bus(self.mem)
+
+    def test_word_access_wraps(self):
+        self.bus.write16(0xFFFF, 0x1234)
+        self.assertEqual(self.mem[0xFFFF], 0x34)
+        self.assertEqual(self.mem[0x0000], 0x12)
+        self.assertEqual(self.bus.read16(0xFFFF), 0x1234)
+
+    def test_single_pass(self):
+        self.mem[0:len(LOOP)] = bytes(LOOP)
+        for i in range(2 + 5 * 0x10):
+            self.instructions.step(self.bus)
+        self.assertEqual(list(self.mem[0x80:0x90]), [1] * 0x10)
+        self.assertEqual(self.registers.PC, 0x0B)
+
+    def test_step_tstates(self):
+        self.mem[0:len(LOOP)] = bytes(LOOP)
+        taken = [self.instructions.step(self.bus) for i in range(2 + 5 * 0x10 + 1)]
+        # LD HL,nn, LD B,n, then DJNZ going back 15 times and on once
+        self.assertEqual(taken[:2], [10, 7])
+        self.assertEqual(taken[6::5], [13] * 0xF + [8])
+        self.assertEqual(taken[-1], 10)
+        djnz, args = self.instructions.decode(self.mem, 9)
+        self.assertEqual((djnz.tstates, djnz.skipped), (13, 8))
+
+    def test_two_pass_adapter(self):
+        self.registers.HL = 0x1234
+        self.registers.A = 0x56
+        self.mem[0] = 0x77 # LD (HL),A
+        ins, args = self.instructions.fetch(self.mem)
+        self.assertEqual(ins.get_read_list(self.registers, args), [])
+        self.assertEqual(ins.execute(self.registers, [], args), [(0x1234, 0x56)])
+
+        self.registers.SP = 0x8000
+        self.mem[1] = 0xC1 # POP BC
+        ins, args = self.instructions.fetch(self.mem)
+        self.assertEqual(ins.get_read_list(self.registers, args), [0x8000, 0x8001])
+        self.assertEqual(self.registers.SP, 0x8000)
+        self.assertEqual(ins.execute(self.registers, [0x78, 0x56], args), [])
+        self.assertEqual(self.registers.BC, 0x5678)
+        self.assertEqual(self.registers.SP, 0x8002)
+
+        self.mem[2:4] = bytes([0xDB, 0x81]) # IN A,(81H)
+        ins, args = self.instructions.fetch(self.mem)
+        self.assertEqual(ins.get_read_list(self.registers, args), [0x10000 + 0x5681])
+
+    def test_step_loop_allocates_nothing(self):
+        self.mem[0:len(LOOP)] = bytes(LOOP)
+        step = self.instructions.step
+        for _ in itertools.repeat(None, 1000):
+            step(self.bus)
+        tracemalloc.start()
+        try:
+            peaks = []
+            for n in [1000, 10000]:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                for _ in itertools.repeat(None, n):
+                    step(self.bus)
+                current, peak = tracemalloc.get_traced_memory()
+                # nothing is kept per instruction ...
+                self.assertEqual(current, before)
+                peaks.append(peak - before)
+        finally:
+            tracemalloc.stop()
+        # ... and there are no per instruction buffers building up either,
+        # ten times the steps peaks no higher
+        self.assertEqual(peaks[0], peaks[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
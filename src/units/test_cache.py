@@ -0,0 +1,46 @@
+from z80 import registers, instructions, bus
+import unittest
+
+# LD A,01H / INC A / LD (0001H),A / JP 0000H
+# rewrites the operand of its own first instruction every time round
+SELF_MODIFYING = [0x3E, 0x01, 0x3C, 0x32, 0x01, 0x00, 0xC3, 0x00, 0x00]
+
+class TestDecodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.registers = registers.Registers()
+        self.instructions = instructions.InstructionSet(self.registers)
+        self.mem = bytearray(64*1024)
+        self.bus = bus.Bus(self.mem)
+        self.cache = self.instructions.enable_cache(self.bus)
+
+    def test_hits_and_misses(self):
+        self.mem[0:3] = bytes([0xC3, 0x00, 0x00]) # JP 0000H
+        for i in range(10):
+            self.instructions.step(self.bus)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 9)
+        self.assertEqual(self.cache.invalidations, 0)
+
+    def test_self_modifying_code(self):
+        self.mem[0:len(SELF_MODIFYING)] = bytes(SELF_MODIFYING)
+        for i in range(3 * 4):
+            self.instructions.step(self.bus)
+        self.assertEqual(self.registers.A, 4)
+        self.assertEqual(self.mem[1], 4)
+        self.assertEqual(self.cache.invalidations, 3)
+        # the last rewrite is not fetched again yet
+        self.assertEqual(self.cache.misses, 4 + 2)
+
+    def test_write_outside_code_keeps_entries(self):
+        self.mem[0:3] = bytes([0xC3, 0x00, 0x00])
+        self.instructions.step(self.bus)
+        self.bus.write8(0x0003, 0xFF)
+        self.bus.write16(0x8000, 0x1234)
+        self.assertEqual(self.cache.invalidations, 0)
+        self.bus.write16(0x0002, 0x0000)
+        self.assertEqual(self.cache.invalidations, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+from z80 import registers, util
+from machines import Machine, random_state
+import random
+import unittest
+
+
+class TestLazyFlags(unittest.TestCase):
+
+    def setUp(self):
+        self.eager = Machine(registers.Registers)
+        self.lazy = Machine(registers.LazyRegisters)
+
+    def test_every_opcode(self):
+        rng = random.Random(7)
+        memory = bytearray(rng.randrange(256) for _ in range(64*1024))
+        for prefix, table in self.eager.instructions._tables.items():
+            for op, ins in enumerate(table):
+                if ins is None:
+                    continue
+                for trial in range(4):
+                    state = random_state(rng)
+                    pc = state["PC"]
+                    code = list(prefix) + [op] + [rng.randrange(256) for _ in range(ins.operand_count)]
+                    if prefix in [(0xDD, 0xCB), (0xFD, 0xCB)]:
+                        code = list(prefix) + [rng.randrange(256), op]
+                    for n, b in enumerate(code):
+                        memory[(pc + n) & 0xFFFF] = b
+                    self.eager.load(state, memory)
+                    self.lazy.load(state, memory)
+                    self.eager.instructions.step(self.eager.bus)
+                    self.lazy.instructions.step(self.lazy.bus)
+                    self.assertEqual(self.lazy.state(), self.eager.state(),
+                                     "%s from %r" % (ins.assembler(), state))
+
+    def test_chains(self):
+        # Flag setting instructions one after the other, F read only at
+        # the end: INC/DEC and the rotates keep bits of what came before
+        rng = random.Random(3)
+        ops = [0x3C, 0x04, 0x05, 0x0D, 0x87, 0x90, 0x98, 0x88, 0xA0, 0xB0,
+               0xA8, 0xB8, 0x34, 0x35]
+        for trial in range(200):
+            code = []
+            for _ in range(12):
+                if rng.random() < 0.3:
+                    code += [0xCB, rng.randrange(0x40)]
+                else:
+                    code.append(rng.choice(ops))
+            memory = bytearray(64*1024)
+            memory[0:len(code)] = bytes(code)
+            state = dict((name, rng.randrange(0x100)) for name in "AFBCDEHL")
+            state["SP"] = 0xFF00
+            self.eager.load(state, memory)
+            self.lazy.load(state, memory)
+            while self.eager.registers.PC < len(code):
+                self.eager.instructions.step(self.eager.bus)
+                self.lazy.instructions.step(self.lazy.bus)
+            self.assertEqual(self.lazy.state(), self.eager.state(), bytes(code).hex())
+
+    def test_writing_f_drops_pending(self):
+        r = registers.LazyRegisters()
+        r.A = 0x7F
+        util.add8(r.A, 1, r)
+        self.assertIsNotNone(r._pending)
+        r.F = 0x12
+        self.assertEqual(r.F, 0x12)
+        self.assertEqual(r.condition.Z, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+from z80 import machine, devices, idle
+import threading
+import time
+import unittest
+
+# DI / waitForChar: LD A,(5000H) / CP 00H / JR Z,waitForChar / HALT
+WAIT = [0xF3, 0x3A, 0x00, 0x50, 0xFE, 0x00, 0x28, 0xF9, 0x76]
+
+# DI / LD HL,5000H / spin: INC (HL) / JR spin
+SPIN = [0xF3, 0x21, 0x00, 0x50, 0x34, 0x18, 0xFD]
+
+
+class TestIdle(unittest.TestCase):
+
+    def machine(self, code, translate=False):
+        m = machine.Machine(translate=translate)
+        m.add_device(devices.Acia(m))
+        m.memory[0x4000:0x4000 + len(code)] = bytes(code)
+        m.registers.PC = 0x4000
+        return m
+
+    def stepped(self, code, tstates):
+        m = self.machine(code)
+        taken = 0
+        while taken < tstates:
+            taken += m.instructions.step(m._bus)
+        return m, taken
+
+    def test_probe(self):
+        m = self.machine(WAIT)
+        m.run_until(pc=0x4001)
+        m.idle.watch(0x4001, 0x4008)
+        taken, loop = m.idle.probe(m)
+        self.assertEqual(loop, (32, 3))
+        self.assertEqual(m.registers.PC, 0x4001)
+        m = self.machine(SPIN)
+        m.run_until(pc=0x4004)
+        m.idle.watch(0x4004, 0x4007)
+        taken, loop = m.idle.probe(m)
+        self.assertIsNone(loop)
+
+    def test_infer(self):
+        m = self.machine(WAIT)
+        m.run(1000000)
+        self.assertGreater(m.idle.loops, 0)
+        m = self.machine(WAIT)
+        m.idle.infer = False
+        m.run(1000000)
+        self.assertEqual(m.idle.loops, 0)
+
+    def test_same_as_stepping(self):
+        reference, taken = self.stepped(WAIT, 1000000)
+        for translate in [False, True]:
+            m = self.machine(WAIT, translate)
+            self.assertEqual(m.run(1000000).tstates, taken)
+            self.assertEqual(m.registers.PC, reference.registers.PC)
+            self.assertEqual(m.registers.R, reference.registers.R)
+            self.assertGreater(m.idle.loops, 0)
+
+    def test_event_ends_loop(self):
+        m = self.machine(WAIT)
+        m.scheduler.at(500000, m.memory.__setitem__, 0x5000, 1)
+        m.run(1000000)
+        self.assertTrue(m.registers.HALT)
+        # skipped up to the event, not past it
+        self.assertLess(m.scheduler.now, 500000 + 23)
+
+    def test_wake(self):
+        waiting = idle.Idle()
+        timer = threading.Timer(0.05, waiting.wake)
+        timer.start()
+        seconds = waiting.wait(5.0)
+        timer.join()
+        self.assertLess(seconds, 1.0)
+        self.assertEqual(waiting.wakeups, 1)
+        self.assertLess(waiting.latency_max, seconds)
+
+    def test_run_for_waits(self):
+        m = self.machine(WAIT)
+        started = time.process_time()
+        result = m.run_for(0.2)
+        self.assertGreater(m.idle.waited, 0.1)
+        self.assertGreater(result.tstates, 0.1 * 7372800)
+        self.assertLess(time.process_time() - started, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+from z80 import registers, instructions, bus
+import unittest
+
+
+class TestDecode(unittest.TestCase):
+
+    def setUp(self):
+        self.registers = registers.Registers()
+        self.instructions = instructions.InstructionSet(self.registers)
+        self.mem = bytearray(64*1024)
+        self.bus = bus.Bus(self.mem)
+
+    def test_prefix_tables_built_on_use(self):
+        class Fresh(instructions.InstructionSet):
+            pass
+        fresh = Fresh(self.registers)
+        tables = fresh._tables
+        self.assertEqual([prefix for prefix in instructions.PREFIXES if dict.__contains__(tables, prefix)],
+                         [()])
+        self.mem[0:4] = bytes([0xDD, 0xCB, 0x05, 0x46]) # BIT 0,(IX+5)
+        ins, args = fresh.decode(self.mem, 0)
+        self.assertEqual(ins.assembler(args), "BIT 0, (IX+5H)")
+        self.assertEqual([prefix for prefix in instructions.PREFIXES if dict.__contains__(tables, prefix)],
+                         [(), (0xDD, 0xCB)])
+        self.assertEqual(len(tables.items()), len(instructions.PREFIXES))
+        self.assertEqual([ins and ins.string for ins in tables[0xED, ]],
+                         [ins and ins.string for ins in self.instructions._tables[0xED, ]])
+
+    def test_every_sequence_decodes(self):
+        for prefix in [[], [0xCB], [0xED], [0xDD], [0xFD], [0xDD, 0xCB], [0xFD, 0xCB]]:
+            for op in range(256):
+                code = prefix + ([0x05, op] if len(prefix) == 2 else [op, 0x05, 0x06])
+                self.mem[0:len(code)] = bytes(code)
+                ins, args = self.instructions.decode(self.mem, 0)
+                self.assertIsNotNone(ins.handler)
+
+    def undocumented(self, code):
+        self.mem[0:len(code)] = bytes(code)
+        self.registers.PC = 0
+        return self.instructions.step(self.bus)
+
+    def test_undocumented(self):
+        # DD CB d 00: RLC (IX+d) copied into B
+        self.registers.IX = 0x4000
+        self.mem[0x4002] = 0x81
+        self.assertEqual(self.undocumented([0xDD, 0xCB, 0x02, 0x00]), 23)
+        self.assertEqual((self.mem[0x4002], self.registers.B), (0x03, 0x03))
+        # SET 7,(IX+d) copied into A, BIT 0,(IX+d) at 4F
+        self.assertEqual(self.undocumented([0xDD, 0xCB, 0x02, 0xFF]), 23)
+        self.assertEqual((self.mem[0x4002], self.registers.A), (0x83, 0x83))
+        self.assertEqual(self.undocumented([0xDD, 0xCB, 0x02, 0x47]), 20)
+        self.assertFalse(self.registers.condition.Z)
+        # DD 04: INC B, 4 T-states later, R counts both bytes
+        self.registers.R = 0
+        self.assertEqual(self.undocumented([0xDD, 0x04]), 8)
+        self.assertEqual((self.registers.B, self.registers.PC, self.registers.R), (0x04, 2, 2))
+        # DD FD 00: the DD a NOP on its own
+        self.assertEqual(self.undocumented([0xDD, 0xFD, 0x00]), 4)
+        self.assertEqual(self.registers.PC, 1)
+        # ED 00 does nothing in 8 T-states, ED 4C is NEG
+        self.assertEqual(self.undocumented([0xED, 0x00]), 8)
+        self.assertEqual(self.registers.PC, 2)
+        self.registers.A = 1
+        self.undocumented([0xED, 0x4C])
+        self.assertEqual(self.registers.A, 0xFF)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+from z80 import registers, instructions, bus, interrupts, recompiler
+import unittest
+
+
+class TestInterrupts(unittest.TestCase):
+
+    def setUp(self):
+        self.registers = registers.Registers()
+        self.instructions = instructions.InstructionSet(self.registers)
+        self.mem = bytearray(64*1024)
+        self.bus = bus.Bus(self.mem)
+        self.interrupts = interrupts.Interrupts(self.registers, self.bus, self.instructions.step)
+        self.registers.PC = 0x1000
+        self.registers.SP = 0x8000
+        self.registers.IFF = self.registers.IFF2 = True
+
+    def step(self):
+        return self.instructions.step(self.bus)
+
+    def assertCalled(self, address, returning):
+        self.assertEqual(self.registers.PC, address)
+        self.assertEqual(self.registers.SP, 0x7FFE)
+        self.assertEqual(self.bus.read16(0x7FFE), returning)
+
+    def test_im1(self):
+        self.registers.IM = 1
+        self.registers.R = 0x7F
+        self.interrupts.interrupt()
+        self.assertTrue(self.interrupts.pending)
+        self.assertEqual(self.interrupts.accept(), 13)
+        self.assertCalled(0x38, 0x1000)
+        self.assertFalse(self.registers.IFF)
+        self.assertFalse(self.registers.IFF2)
+        self.assertEqual(self.registers.R, 0x00)
+        self.assertFalse(self.interrupts.pending)
+
+    def test_im2(self):
+        self.registers.IM = 2
+        self.registers.I = 0x80
+        self.bus.write16(0x8010, 0x1234)
+        device = self.interrupts.chain(interrupts.Vectored(0x10))
+        device.request()
+        self.assertEqual(self.interrupts.accept(), 19)
+        self.assertCalled(0x1234, 0x1000)
+
+    def test_im0(self):
+        self.registers.IM = 0
+        device = self.interrupts.chain(interrupts.Vectored(0xCF)) # RST 08H
+        device.request()
+        self.assertEqual(self.interrupts.accept(), 13)
+        self.assertCalled(0x08, 0x1000)
+
+    def test_disabled(self):
+        self.registers.IM = 1
+        self.registers.IFF = False
+        self.interrupts.interrupt()
+        self.assertEqual(self.interrupts.accept(), 0)
+        self.assertEqual(self.registers.PC, 0x1000)
+        self.assertTrue(self.interrupts.pending)
+
+    def test_nmi(self):
+        self.mem[0x66:0x68] = bytes([0xED, 0x45]) # RETN
+        self.interrupts.nmi()
+        self.assertEqual(self.interrupts.accept(), 11)
+        self.assertCalled(0x66, 0x1000)
+        self.assertFalse(self.registers.IFF)
+        self.assertTrue(self.registers.IFF2)
+        self.step()
+        self.assertEqual(self.registers.PC, 0x1000)
+        self.assertTrue(self.registers.IFF)
+
+    def test_ei_delay(self):
+        self.registers.IM = 1
+        self.registers.IFF = self.registers.IFF2 = False
+        self.mem[0x1000:0x1002] = bytes([0xFB, 0x00]) # EI / NOP
+        self.step()
+        self.interrupts.interrupt()
+        # the NOP goes first
+        self.assertEqual(self.interrupts.accept(), 4 + 13)
+        self.assertCalled(0x38, 0x1002)
+
+    def test_ei_delay_ends(self):
+        self.registers.IM = 1
+        self.registers.IFF = self.registers.IFF2 = False
+        self.mem[0x1000:0x1004] = bytes([0xFB, 0x00, 0x00, 0x00]) # EI / NOP / NOP / NOP
+        for _ in range(4):
+            self.step()
+        self.interrupts.interrupt()
+        # taken where it is, nothing stepped first
+        self.assertEqual(self.interrupts.accept(), 13)
+        self.assertCalled(0x38, 0x1004)
+
+    def test_ei_delay_ends_translated(self):
+        self.registers.IM = 1
+        self.registers.IFF = self.registers.IFF2 = False
+        self.mem[0x1000:0x1006] = bytes([0xFB, 0x00, 0x00, 0xC3, 0x05, 0x10]) # EI / NOP / NOP / JP 1005H
+        blocks = recompiler.Recompiler(self.instructions, self.bus)
+        blocks.step()
+        self.assertTrue(self.registers.EI_DELAY)
+        blocks.step()
+        self.assertFalse(self.registers.EI_DELAY)
+        self.interrupts.interrupt()
+        self.assertEqual(self.interrupts.accept(), 13)
+        self.assertCalled(0x38, 0x1005)
+
+    def test_di_after_ei(self):
+        self.registers.IM = 1
+        self.registers.IFF = self.registers.IFF2 = False
+        self.mem[0x1000:0x1002] = bytes([0xFB, 0xF3]) # EI / DI
+        self.step()
+        self.interrupts.interrupt()
+        # the DI runs and the INT is left waiting
+        self.assertEqual(self.interrupts.accept(), 4)
+        self.assertEqual(self.registers.PC, 0x1002)
+        self.assertFalse(self.registers.IFF)
+        self.assertTrue(self.interrupts.pending)
+
+    def test_nmi_after_ei(self):
+        self.registers.IFF = self.registers.IFF2 = False
+        self.mem[0x1000:0x1002] = bytes([0xFB, 0x00]) # EI / NOP
+        self.step()
+        self.interrupts.nmi()
+        self.assertEqual(self.interrupts.accept(), 11)
+        self.assertCalled(0x66, 0x1001)
+
+    def test_halt(self):
+        self.registers.IM = 1
+        self.mem[0x1000] = 0x76 # HALT
+        self.step()
+        self.step()
+        self.assertTrue(self.registers.HALT)
+        self.assertEqual(self.registers.PC, 0x1000)
+        self.interrupts.interrupt()
+        self.interrupts.accept()
+        self.assertFalse(self.registers.HALT)
+        self.assertCalled(0x38, 0x1001)
+
+    def test_daisy_chain(self):
+        self.registers.IM = 2
+        self.mem[0x2000:0x2002] = bytes([0xED, 0x4D]) # RETI
+        for vector in range(0, 8, 2):
+            self.bus.write16(vector, 0x2000)
+        first = self.interrupts.chain(interrupts.Vectored(0))
+        second = self.interrupts.chain(interrupts.Vectored(2))
+        second.request()
+        first.request()
+        # first has priority
+        self.interrupts.accept()
+        self.assertTrue(first.in_service)
+        self.assertTrue(second.requesting)
+        # second waits for first's RETI, interrupts enabled or not
+        self.registers.IFF = True
+        self.assertFalse(self.interrupts.pending)
+        self.assertEqual(self.interrupts.accept(), 0)
+        self.step()
+        self.assertFalse(first.in_service)
+        self.assertTrue(self.interrupts.pending)
+        self.registers.IFF = True
+        self.interrupts.accept()
+        self.assertTrue(second.in_service)
+        # but first can interrupt second's handler
+        self.registers.IFF = True
+        first.request()
+        self.assertNotEqual(self.interrupts.accept(), 0)
+        self.assertTrue(first.in_service and second.in_service)
+        self.step()
+        self.assertFalse(first.in_service)
+        self.assertTrue(second.in_service)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+from z80 import registers, instructions, bus
+import random
+import unittest
+
+try:
+    import numpy
+    from z80 import lockstep
+except ImportError:
+    numpy = None
+
+# LD HL,9000H / LD DE,0 / LD B,0 / loop: LD A,(HL) / CP 80H / JR C,add /
+# CPL / add: ADD A,E / LD E,A / JR NC,next / INC D / next: INC HL /
+# DJNZ loop / HALT
+SUM = [0x21, 0x00, 0x90, 0x11, 0x00, 0x00, 0x06, 0x00, 0x7E, 0xFE, 0x80, 0x38, 0x01,
+       0x2F, 0x83, 0x5F, 0x30, 0x01, 0x14, 0x23, 0x10, 0xF2, 0x76]
+
+
+@unittest.skipIf(numpy is None, "needs NumPy")
+class TestLockstep(unittest.TestCase):
+
+    def interpret(self, memory, pc=0x8000):
+        regs = registers.Registers()
+        regs.PC = pc
+        instruction_set = instructions.InstructionSet(regs)
+        memory_bus = bus.Bus(memory)
+        tstates = 0
+        while not regs.HALT:
+            tstates += instruction_set.step(memory_bus)
+        return regs, tstates
+
+    def test_lanes_match_the_interpreter(self):
+        rng = random.Random(1)
+        data = [bytes(rng.randrange(256) for _ in range(256)) for _ in range(20)]
+        lanes = lockstep.Lockstep(len(data), bytes(SUM), 0x8000)
+        for lane, block in enumerate(data):
+            lanes.memory[lane, 0x9000:0x9100] = list(block)
+        lanes.set("PC", 0x8000)
+        lanes.run(100000)
+        self.assertTrue(lanes.halted)
+        for lane, block in enumerate(data):
+            memory = bytearray(0x10000)
+            memory[0x8000:0x8000 + len(SUM)] = bytes(SUM)
+            memory[0x9000:0x9100] = block
+            regs, tstates = self.interpret(memory)
+            self.assertEqual(lanes.get("DE")[lane], regs.DE)
+            self.assertEqual(lanes.get("PC")[lane], regs.PC)
+            self.assertEqual(lanes.tstates[lane], tstates)
+        # the lanes go different ways at the branches and come back together
+        executed = lanes.executed.sum()
+        self.assertEqual(lanes.vectorised, executed)
+        self.assertLess(lanes.steps, 1.2 * lanes.executed.max())
+
+    def test_every_vectorised_opcode(self):
+        # each instruction with a vectorised form does just what the
+        # interpreter does, in lanes with registers and memory all different
+        rng = numpy.random.default_rng(1)
+        memory = rng.integers(0, 256, (8, 0x10000), dtype=numpy.uint8)
+        state = rng.integers(0, 0x10000, (len(registers.NAMES), 8)) & 0xFF
+        for name in ["SP", "IX", "IY"]:
+            state[registers.NAMES.index(name)] = rng.integers(0, 0x10000, 8)
+        for name in ["HALT", "IFF", "IFF2", "IM", "EI_DELAY"]:
+            state[registers.NAMES.index(name)] = 0
+        state[registers.NAMES.index("PC")] = 0x8000
+        decoder = instructions.InstructionSet(registers.Registers())
+        tested = 0
+        for prefix in [[], [0xCB], [0xED], [0xDD], [0xFD], [0xDD, 0xCB], [0xFD, 0xCB]]:
+            for op in range(256):
+                if not prefix and op in instructions.PREFIX_BYTES:
+                    continue
+                code = prefix + ([0x05, op] if len(prefix) == 2 else [op])
+                memory[:, 0x8000:0x8000 + len(code)] = code
+                ins, args = decoder.decode(memoryview(memory[0]), 0x8000)
+                if ins.executer.__name__ not in lockstep.VECTORS:
+                    continue
+                results = []
+                for vectorise in [True, False]:
+                    lanes = lockstep.Lockstep(8, vectorise=vectorise)
+                    lanes.memory[:] = memory
+                    lanes.registers[:] = state
+                    lanes.step()
+                    results.append(lanes)
+                vector, interpreted = results
+                if ins.args[:1] not in [("I", ), ("R", )]:
+                    self.assertEqual(vector.vectorised, 8, ins.string)
+                self.assertTrue((vector.registers == interpreted.registers).all(), ins.string)
+                self.assertTrue((vector.memory == interpreted.memory).all(), ins.string)
+                self.assertTrue((vector.tstates == interpreted.tstates).all(), ins.string)
+                tested += 1
+        self.assertGreater(tested, 700)
+
+    def test_interpreted_lanes(self):
+        # SRL A has no vectorised form; lane 1 halts, the lower opcode at
+        # the same PC so first, then lane 0 goes on by itself
+        lanes = lockstep.Lockstep(2, bytes([0xCB, 0x3F, 0x76]), 0x8000)
+        lanes.memory[1, 0x8000] = 0x76
+        lanes.set("PC", 0x8000)
+        lanes.set("A", [0x81, 0x81])
+        self.assertEqual(lanes.run(10), 3)
+        self.assertTrue(lanes.halted)
+        self.assertEqual(list(lanes.get("A")), [0x40, 0x81])
+        self.assertEqual(list(lanes.get("F") & 1), [1, 0])
+        self.assertEqual(list(lanes.executed), [2, 1])
+        self.assertEqual(lanes.vectorised, 2)
+        self.assertEqual(list(lanes.tstates), [12, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+from z80 import machine, devices
+import os
+import subprocess
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+class TestMachine(unittest.TestCase):
+
+    def test_no_qt(self):
+        code = "import sys, z80.machine, z80.devices; print('PySide2' in sys.modules)"
+        out = subprocess.run([sys.executable, "-c", code], cwd=SRC, stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True).stdout
+        self.assertEqual(out.strip(), "False")
+
+    def test_boot_and_type(self):
+        m = machine.Machine(translate=False)
+        acia = m.add_device(devices.Acia(m))
+        m.run(2000000)
+        self.assertTrue(bytes(acia.output).endswith(b"Memory top? "))
+        self.assertTrue(acia.receive(ord("C")))
+        self.assertFalse(acia.receive(ord("C")))
+        m.run(100000)
+        self.assertTrue(bytes(acia.output).endswith(b"Memory top? C"))
+
+    def test_shared_tables(self):
+        machines = [machine.Machine(translate=False) for _ in range(2)]
+        first, second = [m.instructions for m in machines]
+        self.assertIs(first._main, second._main)
+        ins, args = first.decode(machines[0].memory, 0)
+        with self.assertRaises(AttributeError):
+            ins.tstates = 0
+        with self.assertRaises(TypeError):
+            first._main[0] = None
+        # each runs on its own registers
+        acias = [m.add_device(devices.Acia(m)) for m in machines]
+        machines[0].run(2000000)
+        self.assertEqual(bytes(acias[1].output), b"")
+        machines[1].run(2000000)
+        self.assertEqual(acias[0].output, acias[1].output)
+        self.assertEqual(machines[0].registers.PC, machines[1].registers.PC)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+from z80 import pacing, machine, runner, devices
+import unittest
+
+
+class Clock(object):
+    """ Host time that only moves when told to or slept through """
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def timer(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestPacing(unittest.TestCase):
+
+    def pacer(self, speed, clock, latency=0.02):
+        return pacing.Pacer(speed, latency, timer=clock.timer, sleep=clock.sleep)
+
+    def test_real_time(self):
+        clock = Clock()
+        pacer = self.pacer(1.0, clock)
+        self.assertEqual(pacer.chunk, 147456)
+        cycles = 0
+        for _ in range(50):
+            # the host runs a chunk in a quarter of its emulated time
+            cycles += pacer.chunk
+            clock.now += 0.005
+            pacer.pace(cycles)
+        self.assertEqual(len(clock.sleeps), 50)
+        self.assertAlmostEqual(clock.sleeps[-1], 0.015)
+        self.assertAlmostEqual(pacer.mhz(), 7.3728)
+        self.assertAlmostEqual(pacer.drift, 0.0)
+        self.assertIn("7.373 MHz (1.00x)", pacer.report())
+
+    def test_multiplier(self):
+        clock = Clock()
+        pacer = self.pacer(4.0, clock)
+        for n in range(1, 11):
+            clock.now += 0.001
+            pacer.pace(n * pacer.chunk)
+        self.assertAlmostEqual(pacer.mhz(), 4 * 7.3728)
+
+    def test_unthrottled(self):
+        clock = Clock()
+        pacer = self.pacer(None, clock)
+        for n in range(1, 11):
+            clock.now += 0.001
+            pacer.pace(n * pacer.chunk)
+        self.assertEqual(clock.sleeps, [])
+        self.assertAlmostEqual(pacer.mhz(), 10 * pacer.chunk / 0.01 / 1e6)
+
+    def test_falling_behind(self):
+        clock = Clock()
+        pacer = self.pacer(1.0, clock)
+        # stalled for a second, then fast again
+        clock.now += 1.0
+        pacer.pace(pacer.chunk)
+        self.assertEqual(pacer.resyncs, 1)
+        clock.now += 0.001
+        pacer.pace(2 * pacer.chunk)
+        self.assertAlmostEqual(clock.sleeps[-1], 0.019)
+
+    def test_specs(self):
+        self.assertIsNone(pacing.pacer("max").hz)
+        self.assertEqual(pacing.pacer("real").hz, pacing.CLOCK)
+        self.assertEqual(pacing.pacer("0.5").hz, pacing.CLOCK / 2)
+
+
+class TestRunPaced(unittest.TestCase):
+
+    def test_run_paced(self):
+        m = machine.Machine(translate=False)
+        m.add_device(devices.Acia(m))
+        pacer = pacing.Pacer(None)
+        result = m.run_paced(pacer, seconds=0.05)
+        self.assertEqual(result.reason, runner.TIME)
+        self.assertEqual(m.cycles, result.tstates)
+        self.assertEqual(pacer.cycles, m.cycles)
+        m.poll = lambda: m.stop() or 0
+        self.assertEqual(m.run_paced(pacer).reason, runner.STOPPED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+from z80 import recompiler
+from machines import Machine, random_state
+import random
+import unittest
+
+# LD HL,0080H / LD B,10H / loop: LD A,(HL) / INC A / LD (HL),A / INC HL /
+# DJNZ loop / JP 0000H
+LOOP = [0x21, 0x80, 0x00, 0x06, 0x10, 0x7E, 0x3C, 0x77, 0x23, 0x10, 0xFA,
+        0xC3, 0x00, 0x00]
+
+# LD A,01H / INC A / LD (0001H),A / JP 0000H, writes its own operand
+SELF_MODIFYING = [0x3E, 0x01, 0x3C, 0x32, 0x01, 0x00, 0xC3, 0x00, 0x00]
+
+
+class TestRecompiler(unittest.TestCase):
+
+    def setUp(self):
+        self.interpreter = Machine()
+        self.translated = Machine()
+        self.recompiler = recompiler.Recompiler(self.translated.instructions,
+                                                self.translated.bus)
+
+    def interpret(self, tstates):
+        taken = 0
+        while taken < tstates:
+            taken += self.interpreter.instructions.step(self.interpreter.bus)
+        return taken
+
+    def load(self, state, memory):
+        self.interpreter.load(state, memory)
+        self.translated.load(state, memory)
+        self.recompiler.clear()
+
+    def test_every_opcode(self):
+        rng = random.Random(5)
+        memory = bytearray(rng.randrange(256) for _ in range(64*1024))
+        for prefix, table in self.interpreter.instructions._tables.items():
+            for op, ins in enumerate(table):
+                if ins is None:
+                    continue
+                for trial in range(2):
+                    state = random_state(rng, IFF2=bool(trial))
+                    pc = state["PC"]
+                    code = list(prefix) + [op] + [rng.randrange(256) for _ in range(ins.operand_count)]
+                    if prefix in [(0xDD, 0xCB), (0xFD, 0xCB)]:
+                        code = list(prefix) + [rng.randrange(256), op]
+                    for n, b in enumerate(code):
+                        memory[(pc + n) & 0xFFFF] = b
+                    self.load(state, memory)
+                    expected = self.interpreter.instructions.step(self.interpreter.bus)
+                    taken = self.recompiler.translate(pc, 1).run(self.translated.registers,
+                                                                 self.translated.bus,
+                                                                 self.translated.mem)
+                    self.assertEqual(taken, expected, ins.assembler())
+                    self.assertEqual(self.translated.state(), self.interpreter.state(),
+                                     "%s from %r" % (ins.assembler(), state))
+
+    def test_blocks_are_reused(self):
+        memory = bytearray(64*1024)
+        memory[0:len(LOOP)] = bytes(LOOP)
+        self.load({"PC": 0}, memory)
+        self.assertEqual(self.recompiler.run(5000), self.interpret(5000))
+        self.assertEqual(self.translated.state(), self.interpreter.state())
+        # LD HL.. DJNZ, the loop body from DJNZ's target, JP
+        self.assertEqual(self.recompiler.stats()["blocks"], 3)
+
+    def test_run_stops_where_stepping_would(self):
+        memory = bytearray(64*1024)
+        memory[0:len(LOOP)] = bytes(LOOP)
+        for tstates in [1, 10, 17, 18, 30, 100, 1000]:
+            self.load({"PC": 0, "R": 0}, memory)
+            self.assertEqual(self.recompiler.run(tstates), self.interpret(tstates))
+            self.assertEqual(self.translated.state(), self.interpreter.state())
+
+    def test_self_modifying(self):
+        memory = bytearray(64*1024)
+        memory[0:len(SELF_MODIFYING)] = bytes(SELF_MODIFYING)
+        self.load({"PC": 0}, memory)
+        self.assertEqual(self.recompiler.run(2000), self.interpret(2000))
+        self.assertEqual(self.translated.state(), self.interpreter.state())
+        # After the first write the operand is read as the block runs
+        self.assertEqual(self.recompiler.stats()["invalidations"], 1)
+
+    def test_random_programs(self):
+        rng = random.Random(11)
+        for trial in range(20):
+            memory = bytearray(rng.randrange(0x40, 0xC0) if rng.random() < 0.7 else rng.randrange(256)
+                               for _ in range(64*1024))
+            state = {"PC": rng.randrange(0x10000), "SP": rng.randrange(0x10000),
+                     "A": rng.randrange(256), "F": rng.randrange(256)}
+            self.load(state, memory)
+            try:
+                expected = self.interpret(2000)
+            except KeyError:
+                continue
+            self.assertEqual(self.recompiler.run(2000), expected)
+            self.assertEqual(self.translated.state(), self.interpreter.state())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ import unittest
 class TestZ80Registers(unittest.TestCase):
 
     def setUp(self):
-        self.registers = registers.Registers(power=None)
+        self.registers = registers.Registers()
         
     def test_double_register_access(self):
         self.registers.H = 0x45
@@ -23,8 +23,56 @@ class TestZ80Registers(unittest.TestCase):
         self.registers.F=0x0
         self.registers.condition.PV=True
         self.assertEqual(self.registers.F, 0x01 << 2)        
-        
-        
+
+    def test_pairs(self):
+        self.registers.HL = 0x1234
+        self.assertEqual((self.registers.H, self.registers.L), (0x12, 0x34))
+        self.registers.B = 0xAB
+        self.registers.C = 0xCD
+        self.assertEqual(self.registers.BC, 0xABCD)
+
+    def test_index_halves(self):
+        self.registers.IX = 0x1234
+        self.registers.IXL = 0x56
+        self.registers.IYH = 0x78
+        self.assertEqual(self.registers.IX, 0x1256)
+        self.assertEqual((self.registers.IXH, self.registers.IY), (0x12, 0x7800))
+
+    def test_flags(self):
+        self.registers.condition.Z = 1
+        self.registers.condition.C = True
+        self.assertEqual(self.registers.F, 0x41)
+        self.registers.condition.Z = 0
+        self.assertEqual((self.registers.F, self.registers.condition.C), (0x01, 1))
+
+    def test_items(self):
+        self.registers["AF"] = 0x1280
+        self.assertEqual(self.registers["A"], 0x12)
+        self.assertEqual(self.registers.condition.S, 1)
+        with self.assertRaises(KeyError):
+            self.registers["Q"]
+        with self.assertRaises(AttributeError):
+            self.registers.Q = 1
+
+    def test_clone(self):
+        self.registers.DE = 0xBEEF
+        copy = self.registers.clone()
+        self.registers.D = 0
+        self.assertEqual(copy.DE, 0xBEEF)
+        copy.condition.N = 1
+        self.assertEqual(self.registers.F, 0)
+
+    def test_access(self):
+        self.registers.SP = 0x4321
+        self.assertEqual(registers.reader("SP")(self.registers), 0x4321)
+        registers.writer("DE")(self.registers, 0x0102)
+        self.assertEqual((self.registers.D, self.registers.E), (1, 2))
+        lazy = registers.LazyRegisters()
+        registers.writer("F")(lazy, 0x40)
+        self.assertEqual(lazy.condition.Z, 1)
+
+
+
 if __name__ == '__main__':
     unittest.main()
     raw_input()
@@ -0,0 +1,118 @@
+from z80 import recompiler, runner, scheduler
+import machines
+import unittest
+
+
+class Machine(runner.Runner):
+    def __init__(self, translate):
+        parts = machines.Machine(make_bus=machines.Terminal, rom=True)
+        self.registers = parts.registers
+        self.instructions = parts.instructions
+        self.mem = parts.mem
+        self._bus = parts.bus
+        self._recompiler = recompiler.Recompiler(self.instructions, self._bus) if translate else None
+        self.polls = 0
+        self.scheduler = scheduler.Scheduler()
+
+    def poll(self):
+        self.polls += 1
+        return 0
+
+
+class TestRunner(unittest.TestCase):
+
+    def stepped(self, tstates):
+        machine = Machine(False)
+        taken = 0
+        while taken < tstates:
+            taken += machine.instructions.step(machine._bus)
+        return machine, taken
+
+    def test_run(self):
+        reference, taken = self.stepped(100000)
+        for translate in [False, True]:
+            machine = Machine(translate)
+            result = machine.run(100000)
+            self.assertEqual(result, (taken, runner.CYCLES))
+            self.assertEqual(machine.registers.PC, reference.registers.PC)
+            self.assertEqual(machine.mem, reference.mem)
+            self.assertEqual(machine.polls, 100000 // runner.SLICE)
+            more = machine.run(1000)
+            self.assertEqual(machine.cycles, result.tstates + more.tstates)
+
+    def test_run_until_pc(self):
+        reference, _ = self.stepped(30000)
+        target = reference.registers.PC
+        # stepping again, stopping the first time PC gets to target
+        expected = Machine(False)
+        expected_taken = 0
+        while expected.registers.PC != target:
+            expected_taken += expected.instructions.step(expected._bus)
+        for translate in [False, True]:
+            machine = Machine(translate)
+            result = machine.run_until(pc=target)
+            self.assertEqual(result, (expected_taken, runner.PC))
+            self.assertEqual(machine.mem, expected.mem)
+
+    def test_run_until_cycles(self):
+        reference, taken = self.stepped(54321)
+        machine = Machine(True)
+        self.assertEqual(machine.run_until(pc=0xFFFF, cycles=54321), (taken, runner.CYCLES))
+        self.assertEqual(machine.registers.PC, reference.registers.PC)
+
+    def test_run_until_predicate(self):
+        machine = Machine(True)
+        result = machine.run_until(predicate=lambda m: m.registers.SP != 0)
+        self.assertEqual(result.reason, runner.PREDICATE)
+        self.assertNotEqual(machine.registers.SP, 0)
+        with self.assertRaises(ValueError):
+            machine.run_until()
+
+    def test_run_for(self):
+        machine = Machine(True)
+        result = machine.run_for(0.01)
+        self.assertEqual(result.reason, runner.TIME)
+        self.assertGreater(result.tstates, 0)
+
+    def test_halt(self):
+        # DI / HALT
+        reference = Machine(False)
+        reference.mem[0:2] = bytes([0xF3, 0x76])
+        taken = 0
+        while taken < 100001:
+            taken += reference.instructions.step(reference._bus)
+        for translate in [False, True]:
+            machine = Machine(translate)
+            machine.mem[0:2] = bytes([0xF3, 0x76])
+            self.assertEqual(machine.run(100001), (taken, runner.CYCLES))
+            self.assertEqual(machine.registers.R, reference.registers.R)
+            self.assertEqual(machine.registers.PC, 1)
+            self.assertTrue(machine.registers.HALT)
+            machine = Machine(translate)
+            machine.mem[0:2] = bytes([0xF3, 0x76])
+            self.assertEqual(machine.run_until(cycles=100001), (taken, runner.CYCLES))
+            self.assertEqual(machine.registers.R, reference.registers.R)
+
+    def test_halt_until_event(self):
+        machine = Machine(True)
+        machine.mem[0:2] = bytes([0xF3, 0x76])
+        woken = []
+        def wake():
+            woken.append(machine.scheduler.now)
+            machine.registers.HALT = False
+            machine.registers.PC = 2
+        machine.scheduler.at(50001, wake)
+        machine.run(10 * runner.SLICE)
+        machine.run(100000)
+        self.assertEqual(woken, [50004])
+
+    def test_stop(self):
+        machine = Machine(True)
+        machine.poll = lambda: machine.stop() or 0
+        result = machine.run(10 * runner.SLICE)
+        self.assertEqual(result.reason, runner.STOPPED)
+        self.assertLess(result.tstates, 2 * runner.SLICE)
+
+
+if __name__ == '__main__':
+    unittest.main()
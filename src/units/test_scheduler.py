@@ -0,0 +1,81 @@
+from z80 import scheduler, machine, devices
+import unittest
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_order(self):
+        s = scheduler.Scheduler()
+        fired = []
+        s.at(30, fired.append, "c")
+        s.at(10, fired.append, "a")
+        s.at(30, fired.append, "d")
+        s.at(20, fired.append, "b")
+        self.assertEqual(s.due, 10)
+        s.run_due(25)
+        self.assertEqual(fired, ["a", "b"])
+        self.assertEqual(s.due, 30)
+        s.run_due(30)
+        self.assertEqual(fired, ["a", "b", "c", "d"])
+        self.assertEqual(s.due, scheduler.NEVER)
+
+    def test_cancel(self):
+        s = scheduler.Scheduler()
+        fired = []
+        event = s.at(10, fired.append, "a")
+        s.at(20, fired.append, "b")
+        s.cancel(event)
+        self.assertEqual(len(s), 1)
+        s.run_due(100)
+        self.assertEqual(fired, ["b"])
+
+    def test_after(self):
+        s = scheduler.Scheduler()
+        times = []
+        def tick():
+            times.append(s.now)
+            if len(times) < 3:
+                s.after(100, tick)
+        s.at(50, tick)
+        for now in range(0, 1000, 10):
+            if now >= s.due:
+                s.run_due(now)
+        self.assertEqual(times, [50, 150, 250])
+
+
+class TestMachineEvents(unittest.TestCase):
+
+    def test_runs_up_to_event(self):
+        for translate in (False, True):
+            m = machine.Machine(translate=translate)
+            m.add_device(devices.Acia(m))
+            fired = []
+            m.scheduler.at(12345, lambda: fired.append(m.scheduler.now))
+            m.run(20000)
+            # the slice is cut short at the event, at most an instruction past it
+            self.assertEqual(len(fired), 1)
+            self.assertGreaterEqual(fired[0], 12345)
+            self.assertLess(fired[0], 12345 + 23)
+
+    def test_run_until_event(self):
+        m = machine.Machine()
+        m.add_device(devices.Acia(m))
+        fired = []
+        m.scheduler.at(5000, lambda: fired.append(m.scheduler.now))
+        m.run_until(cycles=10000)
+        self.assertEqual(len(fired), 1)
+        self.assertLess(fired[0] - 5000, 23)
+
+    def test_type(self):
+        m = machine.Machine()
+        acia = m.add_device(devices.Acia(m))
+        m.run(2000000)
+        self.assertTrue(bytes(acia.output).endswith(b"Memory top? "))
+        acia.type(b"40000", m.scheduler)
+        m.run(100000)
+        self.assertTrue(bytes(acia.output).endswith(b"Memory top? 40000"))
+        self.assertEqual(len(m.scheduler), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
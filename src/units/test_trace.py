@@ -0,0 +1,84 @@
+from z80 import registers, instructions, bus, util, trace
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+
+class Counted(object):
+    """ Counts how often it is formatted """
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "counted"
+
+
+class TestTrace(unittest.TestCase):
+
+    def tearDown(self):
+        trace.reset()
+
+    def test_nothing_printed(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            r = registers.Registers()
+            instruction_set = instructions.InstructionSet(r)
+            util.add16(0x1234, 0x4321, r)
+            util.subtract16(0x1234, 0x4321, r)
+        self.assertEqual(out.getvalue(), "")
+
+    def test_disabled(self):
+        ring = trace.add_sink(trace.RingSink())
+        util.add16(0x1234, 0x4321, registers.Registers())
+        self.assertEqual(len(ring.events), 0)
+
+    def test_levels(self):
+        ring = trace.add_sink(trace.RingSink())
+        trace.enable("interrupts", trace.INFO)
+        self.assertTrue(trace.interrupts.info)
+        self.assertFalse(trace.interrupts.debug)
+        trace.configure("alu")
+        util.add16(0xFFFF, 0x0002, registers.Registers())
+        self.assertEqual(ring.lines(), ["alu: FFFF + 0002 = 10001"])
+        with self.assertRaises(ValueError):
+            trace.configure("dma")
+
+    def test_formatting_deferred(self):
+        ring = trace.add_sink(trace.RingSink(2))
+        counted = Counted()
+        for _ in range(3):
+            trace.io.emit(trace.DEBUG, "%s", counted)
+        self.assertEqual(counted.formatted, 0)
+        self.assertEqual(ring.lines(), ["io: counted"] * 2)
+        self.assertEqual(counted.formatted, 2)
+
+    def test_decode(self):
+        r = registers.Registers()
+        instruction_set = instructions.InstructionSet(r)
+        memory = bytearray(64*1024)
+        memory[0:4] = bytes([0x21, 0x34, 0x12, 0x00])
+        ring = trace.RingSink()
+        trace.configure("decode", ring)
+        instruction_set.step(bus.Bus(memory))
+        instruction_set.step(bus.Bus(memory))
+        self.assertEqual(len(ring.events), 2)
+        self.assertTrue(ring.lines()[0].startswith("decode: 0000 : LD HL"))
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            trace.configure("io", trace.FileSink(path))
+            trace.io.emit(trace.DEBUG, "write %02X %02X", 0x81, 0x41)
+            trace.reset()
+            with open(path) as f:
+                self.assertEqual(f.read(), "io: write 81 41\n")
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,9 +33,9 @@ class TestZ80Instructions(unittest.TestCase):
                 yield ins, args
         
     def execute(self, ins):
-        rd =  ins[0].get_read_list(ins[1])
+        rd =  ins[0].get_read_list(self.registers, ins[1])
         data = [self.mem[i] for i in rd]
-        wrt = ins[0].execute(data, ins[1])
+        wrt = ins[0].execute(self.registers, data, ins[1])
         for i in wrt:
             self.mem[i[0]] = i[1]
 
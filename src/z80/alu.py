@@ -0,0 +1,179 @@
+""" Flag and result tables for the 8 bit ALU
+
+    Built once when the module is imported and shared by everything,
+    all of them bytes so a lookup is an index giving back a small int:
+
+        SZ53, SZ53P       S, Z, F5, F3 (and parity) of a value      256 each
+        ADD_F, SUB_F      flags of a + b + c and a - b - c,         128K each
+                          indexed c << 16 | a << 8 | b
+        INC_F, DEC_F      flags of INC and DEC of a value, C clear  256 each
+        DAA_A, DAA_F      DAA's result and flags, indexed            2K each
+                          (C | N | H >> 2) << 8 | A
+        SHIFT_R, SHIFT_F  results and flags of the CB rotates and    4K each
+                          shifts, indexed op << 9 | c << 8 | value,
+                          op as in the opcode (RLC RRC RL RR SLA SRA SLL SRL)
+        BIT_F             flags of BIT, C clear, F5/F3 from the     2K
+                          value, indexed bit << 8 | value
+
+    about 280K in all, see footprint(). The functions below are the ALU
+    operations the handlers use, taking the registers and the operand.
+"""
+
+S, Z, F5, H, F3, PV, N, C = 0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01
+
+
+def _parity(v):
+    v ^= v >> 4
+    v ^= v >> 2
+    v ^= v >> 1
+    return not v & 1
+
+SZ53 = bytes((v & (S | F5 | F3)) | (Z if v == 0 else 0) for v in range(256))
+SZ53P = bytes(SZ53[v] | (PV if _parity(v) else 0) for v in range(256))
+
+
+def _add_flags(a, b, c):
+    r = a + b + c
+    f = SZ53[r & 0xFF] | (r >> 8)
+    if (a & 0xF) + (b & 0xF) + c > 0xF:
+        f |= H
+    if (a ^ ~b) & (a ^ r) & 0x80:
+        f |= PV
+    return f
+
+def _sub_flags(a, b, c):
+    r = a - b - c
+    f = SZ53[r & 0xFF] | N | (C if r < 0 else 0)
+    if (a & 0xF) - (b & 0xF) - c < 0:
+        f |= H
+    if (a ^ b) & (a ^ r) & 0x80:
+        f |= PV
+    return f
+
+ADD_F = bytes(_add_flags(a, b, c) for c in range(2) for a in range(256) for b in range(256))
+SUB_F = bytes(_sub_flags(a, b, c) for c in range(2) for a in range(256) for b in range(256))
+
+INC_F = bytes(_add_flags(v, 1, 0) & ~C & 0xFF for v in range(256))
+DEC_F = bytes(_sub_flags(v, 1, 0) & ~C & 0xFF for v in range(256))
+
+
+def _daa(a, n, h, c):
+    diff = 0
+    carry = c
+    if c or a > 0x99:
+        diff = 0x60
+        carry = 1
+    if h or (a & 0xF) > 9:
+        diff |= 0x06
+    r = (a - diff if n else a + diff) & 0xFF
+    if n:
+        half = h and (a & 0xF) < 6
+    else:
+        half = (a & 0xF) > 9
+    return r, SZ53P[r] | (N if n else 0) | (H if half else 0) | carry
+
+_DAA = [_daa(a, index & 2, index & 4, index & 1) for index in range(8) for a in range(256)]
+DAA_A = bytes(r for r, f in _DAA)
+DAA_F = bytes(f for r, f in _DAA)
+del _DAA
+
+
+def _shift(op, v, c):
+    """ Result and carry out of CB rotate/shift op """
+    if op == 0:
+        return (v << 1 | v >> 7) & 0xFF, v >> 7
+    if op == 1:
+        return (v >> 1 | v << 7) & 0xFF, v & 1
+    if op == 2:
+        return (v << 1 | c) & 0xFF, v >> 7
+    if op == 3:
+        return v >> 1 | c << 7, v & 1
+    if op == 4:
+        return (v << 1) & 0xFF, v >> 7
+    if op == 5:
+        return v >> 1 | (v & 0x80), v & 1
+    if op == 6:
+        return (v << 1 | 1) & 0xFF, v >> 7
+    return v >> 1, v & 1
+
+_SHIFT = [_shift(op, v, c) for op in range(8) for c in range(2) for v in range(256)]
+SHIFT_R = bytes(r for r, carry in _SHIFT)
+SHIFT_F = bytes(SZ53P[r] | carry for r, carry in _SHIFT)
+del _SHIFT
+
+RLC, RRC, RL, RR, SLA, SRA, SLL, SRL = [op << 9 for op in range(8)]
+
+BIT_F = bytes(H | (v & (F5 | F3)) | (Z | PV if not v & (1 << bit) else 0) |
+              (S if bit == 7 and v & 0x80 else 0)
+              for bit in range(8) for v in range(256))
+
+
+def footprint():
+    """ Bytes held by the tables """
+    return sum(len(table) for table in [SZ53, SZ53P, ADD_F, SUB_F, INC_F, DEC_F,
+                                        DAA_A, DAA_F, SHIFT_R, SHIFT_F, BIT_F])
+
+
+#----------------------------------------------------------------------
+# Operations on A, the operand b already fetched
+#----------------------------------------------------------------------
+
+def add_a(registers, b):
+    a = registers.A
+    registers.A = (a + b) & 0xFF
+    registers.F = ADD_F[a << 8 | b]
+
+def adc_a(registers, b):
+    a = registers.A
+    c = registers.F & 1
+    registers.A = (a + b + c) & 0xFF
+    registers.F = ADD_F[c << 16 | a << 8 | b]
+
+def sub_a(registers, b):
+    a = registers.A
+    registers.A = (a - b) & 0xFF
+    registers.F = SUB_F[a << 8 | b]
+
+def sbc_a(registers, b):
+    a = registers.A
+    c = registers.F & 1
+    registers.A = (a - b - c) & 0xFF
+    registers.F = SUB_F[c << 16 | a << 8 | b]
+
+def cp_a(registers, b):
+    # F5 and F3 come from the operand
+    registers.F = SUB_F[registers.A << 8 | b] & 0xD7 | b & 0x28
+
+def and_a(registers, b):
+    a = registers.A & b
+    registers.A = a
+    registers.F = SZ53P[a] | H
+
+def or_a(registers, b):
+    a = registers.A | b
+    registers.A = a
+    registers.F = SZ53P[a]
+
+def xor_a(registers, b):
+    a = registers.A ^ b
+    registers.A = a
+    registers.F = SZ53P[a]
+
+
+#----------------------------------------------------------------------
+# Operations on a value, returning the result
+#----------------------------------------------------------------------
+
+def increment(registers, v):
+    registers.F = registers.F & C | INC_F[v]
+    return (v + 1) & 0xFF
+
+def decrement(registers, v):
+    registers.F = registers.F & C | DEC_F[v]
+    return (v - 1) & 0xFF
+
+def shift(registers, op, v):
+    """ CB rotate/shift, op one of RLC .. SRL """
+    i = op | (registers.F & C) << 8 | v
+    registers.F = SHIFT_F[i]
+    return SHIFT_R[i]
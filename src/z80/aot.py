@@ -0,0 +1,264 @@
+""" Ahead of time translation of a ROM image into a Python module
+
+    The ROM's control flow is followed from the reset and RST vectors
+    and from the BASIC keyword and function address tables, every block
+    reached is translated as the recompiler would and the lot is written
+    out as one module. The module is kept on disk under the ROM's
+    content hash, so later runs just import it (and Python keeps its
+    bytecode next to it). Building one removes those older translators
+    made of the same ROM.
+
+        cd src
+        python -m z80.aot ../roms/ROM.HEX
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+
+from . import alu, bus, instructions, recompiler
+from . recompiler import Block, CONTROL, TABLES, _relative
+
+# The reset vector and the RST vectors
+VECTORS = [0x00, 0x08, 0x10, 0x18, 0x20, 0x28, 0x30, 0x38]
+
+# Code only reached through a table of addresses, found by the code that
+# reads the table: what comes before the load of the table address, the
+# load's opcode, then what comes after, and the number of entries
+ADDRESS_TABLES = [
+    # WORDTB: LD HL,WORDTB / ADD HL,BC / LD C,(HL) / INC HL / LD B,(HL) / PUSH BC
+    (bytes([0x06, 0x00, 0xEB]), 0x21, bytes([0x09, 0x4E, 0x23, 0x46, 0xC5]), 37),
+    # FNCTAB: LD BC,FNCTAB / ADD HL,BC / LD C,(HL) / INC HL / LD H,(HL) / LD L,C / JP (HL)
+    (b"", 0x01, bytes([0x09, 0x4E, 0x23, 0x66, 0x69, 0xE9]), 28),
+]
+
+# Where translated ROMs are kept
+DIRECTORY = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          "..", "..", "roms", "aot"))
+
+
+def read_hex(romfile, memory):
+    """ Load an Intel HEX file into memory, return the end of the data """
+    end = 0
+    with open(romfile, "r") as f:
+        for line in f:
+            if line[0] != ":":
+                raise Exception("Bad start code in hex file.")
+            if line[7:9] == "01":
+                break
+            count = int(line[1:3], 16)
+            address = int(line[3:7], 16)
+            if address + count > len(memory):
+                raise Exception("Trying to load a ROM file too large for memory")
+            for b in range(count):
+                memory[address + b] = int(line[9 + 2 * b:11 + 2 * b], 16)
+            end = max(end, address + count)
+    return end
+
+
+def digest(memory, end):
+    return hashlib.sha1(bytes(memory[:end])).hexdigest()
+
+
+def translator():
+    """ Short hash of the code a translation depends on, so a module made
+        by an older translator is not picked up """
+    h = hashlib.sha1()
+    for module in [instructions, alu, recompiler, sys.modules[__name__]]:
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:8]
+
+
+def _module_name(rom_digest):
+    return "rom_%s_%s" % (rom_digest, translator())
+
+
+def entries(memory, end):
+    """ Where the ROM can be entered from outside its own direct jumps """
+    found = [v for v in VECTORS if v < end]
+    rom = bytes(memory[:end])
+    for before, opcode, after, count in ADDRESS_TABLES:
+        at = rom.find(after)
+        while at >= 3:
+            if rom[at - 3] == opcode and rom[at - 3 - len(before):at - 3] == before:
+                table = rom[at - 2] | rom[at - 1] << 8
+                for k in range(count):
+                    address = table + 2 * k
+                    if address + 1 < end:
+                        found.append(rom[address] | rom[address + 1] << 8)
+                break
+            at = rom.find(after, at + 1)
+    return [address for address in found if address < end]
+
+
+def _exits(ins, n, start, address):
+    """ Where the last instruction of a block can go on to """
+    name = ins.executer.__name__
+    if name not in CONTROL:
+        # ran into the length limit or an opcode with no instruction
+        return [address]
+    if name == "jp":
+        return [n]
+    if name in ["jp_c", "call", "call_c"]:
+        return [n, address]
+    if name == "jr":
+        return [_relative(address, n)]
+    if name in ["jr_nz", "jr_z", "jr_nc", "jr_c", "djnz"]:
+        return [_relative(address, n), address]
+    if name == "rst_p":
+        return [ins.args[0], address]
+    if name in ["jp_r", "ret", "reti", "retn"]:
+        return []
+    if name in ["halt", "ldir", "lddr", "cpir", "cpdr", "inir", "indr", "otir", "otdr"]:
+        # goes round again from the same instruction
+        return [start, address]
+    return [address]
+
+
+def successors(instructions, memory, block):
+    """ The addresses running block can carry on at, as far as can be
+        seen from the code. Jumps through registers and returns are left
+        to the callers' return addresses, the tables, and addresses
+        pushed as a constant (LD HL,nn / PUSH HL) for a RET to find. """
+    found = []
+    loaded = None
+    address = block.pc
+    for _ in range(block.count):
+        ins, n = instructions.decode(memory, address)
+        start = address
+        address = (address + ins.length) & 0xFFFF
+        name = ins.executer.__name__
+        if name == "push_qq" and loaded is not None and loaded[0] == ins.args:
+            found.append(loaded[1])
+        loaded = (ins.args, n) if name == "ld_dd_nn" else None
+    return found + _exits(ins, n, start, address)
+
+
+def analyse(instructions, memory, end, limit=recompiler.LIMIT):
+    """ Translate every block reachable in memory below end, return
+        them in address order """
+    scratch = recompiler.Recompiler(instructions, bus.Bus(bytearray(memory)), limit)
+    blocks = {}
+    pending = entries(memory, end)
+    while pending:
+        pc = pending.pop()
+        if pc in blocks or pc >= end:
+            continue
+        block = scratch.translate(pc)
+        if block is None:
+            continue
+        blocks[pc] = block
+        pending.extend(successors(instructions, memory, block))
+    return [blocks[pc] for pc in sorted(blocks)]
+
+
+def generate(blocks, rom_digest):
+    """ The source of a module whose link() gives the blocks back """
+    lines = ['""" Translated from ROM %s by z80.aot, do not edit """' % rom_digest,
+             "DIGEST = %r" % rom_digest,
+             "",
+             "",
+             "def link(_stale, _lookup, %s):" % ", ".join(sorted(TABLES))]
+    bound = {}
+    for block in blocks:
+        for binding, code in block.bindings:
+            bound[binding] = code
+    for binding in sorted(bound):
+        lines.append("    %s = _lookup(%r, 0)" % (binding, bound[binding]))
+    for block in blocks:
+        lines.extend("    " + line if line else line
+                     for line in block.source.rstrip("\n").split("\n"))
+    lines.append("    return [")
+    for block in blocks:
+        lines.append("        (0x%04X, block_%04X, %r, %r)," %
+                     (block.pc, block.pc, tuple(block.addresses), tuple(block.starts)))
+    lines.append("    ]")
+    return "\n".join(lines) + "\n"
+
+
+def build(instructions, memory, end, directory=None):
+    """ Translate the ROM and write its module, in directory or
+        DIRECTORY, return the module's path """
+    directory = directory or DIRECTORY
+    rom_digest = digest(memory, end)
+    source = generate(analyse(instructions, memory, end), rom_digest)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _module_name(rom_digest) + ".py")
+    # a temporary file of its own, so processes building the same ROM at
+    # once each put a whole module in place, the last one staying
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as f:
+            f.write(source)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except OSError:
+        os.remove(temporary)
+        # the same module another process put there is as good
+        if not os.path.exists(path):
+            raise
+    _prune(directory, rom_digest, _module_name(rom_digest))
+    return path
+
+
+def _prune(directory, rom_digest, keep):
+    """ Remove the modules older translators made of the same ROM, and
+        their bytecode """
+    stale = "rom_%s_" % rom_digest
+    cache = os.path.join(directory, "__pycache__")
+    for folder, suffix in [(directory, ".py"), (cache, ".pyc")]:
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.startswith(stale) and name.endswith(suffix) and not name.startswith(keep + "."):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except FileNotFoundError:
+                    # another process building the same ROM got there first
+                    pass
+
+
+def load(machine_recompiler, end, directory=None):
+    """ Import the module for the ROM below end from directory or
+        DIRECTORY, building it the first time, and install its blocks in
+        machine_recompiler. Returns the number of blocks. """
+    directory = directory or DIRECTORY
+    memory = machine_recompiler._memory
+    instructions = machine_recompiler._instructions
+    rom_digest = digest(memory, end)
+    path = os.path.join(directory, _module_name(rom_digest) + ".py")
+    if not os.path.exists(path):
+        path = build(instructions, memory, end, directory)
+    name = "z80_" + _module_name(rom_digest)
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[name] = module
+    blocks = []
+    for pc, run, addresses, starts in module.link(machine_recompiler._stale, instructions._lookup,
+                                                  **TABLES):
+        block = Block(pc, len(starts), addresses, starts[-1], starts, None)
+        block.run = run
+        blocks.append(block)
+    machine_recompiler.install(blocks)
+    return len(blocks)
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+    from . import registers, instructions
+
+    memory = bytearray(64 * 1024)
+    end = read_hex(sys.argv[1], memory)
+    instruction_set = instructions.InstructionSet(registers.Registers())
+    t = perf_counter()
+    path = build(instruction_set, memory, end)
+    print("built %s in %.2fs" % (path, perf_counter() - t))
+    t = perf_counter()
+    engine = recompiler.Recompiler(instruction_set, bus.Bus(memory), dynamic=False)
+    count = load(engine, end, os.path.dirname(path))
+    print("%d blocks, loaded in %.2fs" % (count, perf_counter() - t))
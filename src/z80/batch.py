@@ -0,0 +1,137 @@
+""" Running batches of independent BASIC jobs on a pool of processes
+
+    Each worker process makes a Machine for every ROM once, boots it to
+    BASIC's Ok prompt and keeps a snapshot of it; a job starts from that
+    snapshot, has its script typed in a line at a time and runs until
+    BASIC is back at the prompt with nothing left to type, or for its
+    cycles. Results come
+    back as the jobs finish, not in the order given.
+
+        jobs = [batch.Job("sum", b"PRINT 1+2\\r"), batch.Job("loop", script)]
+        with batch.Pool() as pool:
+            for result in pool.run(jobs):
+                print(result.name, result.tstates, result.output)
+"""
+import concurrent.futures
+import os
+from collections import namedtuple
+from time import perf_counter
+
+from . import machine, devices, runner, scheduler
+
+# Why a job came back, besides runner.CYCLES
+DONE = "done"
+
+# T-states a job runs between looks at whether it is done
+SLICE = 100000
+
+# Typed at BASIC's "Memory top?" to boot it
+BOOT = b"\r"
+
+# T-states the ROM is given to reach the prompts
+BOOT_CYCLES = 20000000
+
+PROMPT = b"Ok\r\n"
+
+Job = namedtuple("Job", ["name", "script", "cycles", "rom", "capture"],
+                 defaults=(200000000, machine.ROM, True))
+
+# output is None for a job with capture False; seconds is host time
+Result = namedtuple("Result", ["name", "output", "tstates", "reason", "seconds", "worker"])
+
+
+def boot(rom=machine.ROM):
+    """ A Machine running rom, booted to BASIC's Ok prompt, and its
+        snapshot there """
+    m = machine.Machine(rom)
+    acia = m.add_device(devices.Acia(m))
+    m.run(SLICE)
+    acia.type(BOOT, m.scheduler)
+    taken = 0
+    while not bytes(acia.output).endswith(PROMPT):
+        if taken >= BOOT_CYCLES:
+            raise Exception("%s did not boot to the Ok prompt" % rom)
+        taken += m.run(SLICE).tstates
+    return m, m.snapshot()
+
+
+def run_job(m, state, job):
+    """ Run job on m from state, return its Result """
+    started = perf_counter()
+    m.restore(state)
+    acia = m.add_device(devices.Acia(m))
+    # BASIC reads the terminal looking for a break while it runs a line
+    # and drops what it reads, so each line is typed once the one before
+    # has settled: read, with a whole slice going by and nothing new
+    # printed
+    lines = job.script.splitlines(True)
+    lines.reverse()
+    output = acia.output
+    taken = 0
+    reason = runner.CYCLES
+    seen = -1
+    while taken < job.cycles:
+        taken += m.run(min(SLICE, job.cycles - taken)).tstates
+        if m.scheduler.due == scheduler.NEVER and not acia.waiting and len(output) == seen:
+            if lines:
+                acia.type(lines.pop(), m.scheduler)
+            elif bytes(output[-len(PROMPT):]) == PROMPT:
+                reason = DONE
+                break
+        seen = len(output)
+    return Result(job.name, bytes(output) if job.capture else None, taken, reason,
+                  perf_counter() - started, os.getpid())
+
+
+# The worker's booted machines, by ROM
+_booted = {}
+
+
+def _prepare(roms):
+    for rom in roms:
+        _booted[rom] = boot(rom)
+
+
+def _work(job):
+    if job.rom not in _booted:
+        _booted[job.rom] = boot(job.rom)
+    m, state = _booted[job.rom]
+    return run_job(m, state, job)
+
+
+class Pool(object):
+    """ Worker processes, as many as the host has cores unless told,
+        each with a booted machine ready for each of roms. The workers
+        last until close(), so one Pool can run batch after batch. """
+    def __init__(self, roms=(machine.ROM, ), workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        # the ROMs' translated modules are built here, once, so the
+        # workers only import them
+        for rom in roms:
+            machine.Machine(rom)
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers, initializer=_prepare, initargs=(tuple(roms), ))
+
+    def run(self, jobs):
+        """ Run jobs across the workers, yield their Results as they
+            finish """
+        futures = [self._executor.submit(_work, job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run(jobs, workers=None):
+    """ Run jobs on a Pool of their own, yield their Results as they finish """
+    jobs = list(jobs)
+    with Pool(set(job.rom for job in jobs), workers) as pool:
+        for result in pool.run(jobs):
+            yield result
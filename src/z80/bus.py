@@ -0,0 +1,211 @@
+""" Memory and I/O as seen by the instruction handlers """
+
+# No limit on how long a block instruction may go on
+UNLIMITED = 1 << 62
+
+
+def written(address, count, step):
+    """ count addresses from address on, going up or down and wrapping at
+        64K, as (start, end) ranges that do not wrap """
+    start = address if step > 0 else (address - count + 1) & 0xFFFF
+    end = start + count
+    if end > 0x10000:
+        return [(start, 0x10000), (0, end - 0x10000)]
+    return [(start, end)]
+
+
+class Bus(object):
+    """ Gives handlers direct access to memory and the I/O devices.
+
+        read8/write8 are the memory bytearray's own item methods so a
+        byte access costs no Python call. Ports are the full 16 bit
+        address put on the bus, in8/out8 hand the low byte to the
+        device mapped there (in/out are keywords). The daisy chain
+        watches for RETI through reti(). Writes to memory other than
+        through write8/write16 are reported to wrote() for the caches.
+
+        LDIR and the other repeating instructions go round as many times
+        as fit in budget T-states in one go, the run loop setting it to
+        what is left before it must look at anything else. """
+    budget = UNLIMITED
+
+    def __init__(self, memory, iomap=None):
+        self.memory = memory
+        self.iomap = iomap
+        self.interrupts = None
+        self.read8 = memory.__getitem__
+        self.write8 = memory.__setitem__
+
+    def read16(self, address):
+        memory = self.memory
+        return memory[address] | memory[(address + 1) & 0xFFFF] << 8
+
+    def write16(self, address, value):
+        memory = self.memory
+        memory[address] = value & 0xFF
+        memory[(address + 1) & 0xFFFF] = value >> 8
+
+    def move(self, destination, source, count, step=1):
+        """ Copy count bytes from source to destination one after another
+            going up, step 1 as LDIR does, or down, step -1 as LDDR does,
+            wrapping at 64K. Where the two overlap the bytes copied first
+            are copied again, as the CPU would. """
+        memory = self.memory
+        self.wrote(destination, count, step)
+        while count:
+            if step > 0:
+                n = min(count, 0x10000 - source, 0x10000 - destination)
+                gap = destination - source
+                if 0 < gap < n:
+                    pattern = memory[source:destination]
+                    memory[destination:destination + n] = (pattern * (n // gap + 1))[:n]
+                else:
+                    memory[destination:destination + n] = memory[source:source + n]
+                source = (source + n) & 0xFFFF
+                destination = (destination + n) & 0xFFFF
+            else:
+                n = min(count, source + 1, destination + 1)
+                gap = source - destination
+                if 0 < gap < n:
+                    pattern = memory[destination + 1:source + 1]
+                    memory[destination - n + 1:destination + 1] = (pattern * (n // gap + 1))[-n:]
+                else:
+                    memory[destination - n + 1:destination + 1] = memory[source - n + 1:source + 1]
+                source = (source - n) & 0xFFFF
+                destination = (destination - n) & 0xFFFF
+            count -= n
+
+    def wrote(self, address, count, step=1):
+        """ count bytes from address on, going up or down, were written
+            other than through write8/write16 """
+        pass
+
+    def find(self, value, address, count, step=1):
+        """ How many of the count bytes from address on, going up (CPIR)
+            or down (CPDR) and wrapping at 64K, come before the first that
+            is value; None if none is """
+        memory = self.memory
+        done = 0
+        while done < count:
+            if step > 0:
+                n = min(count - done, 0x10000 - address)
+                found = memory.find(value, address, address + n)
+                if found >= 0:
+                    return done + found - address
+                address = (address + n) & 0xFFFF
+            else:
+                n = min(count - done, address + 1)
+                found = memory.rfind(value, address - n + 1, address + 1)
+                if found >= 0:
+                    return done + address - found
+                address = (address - n) & 0xFFFF
+            done += n
+        return None
+
+    def in8(self, port):
+        port &= 0xFF
+        return self.iomap.address[port].read(port)
+
+    def out8(self, port, value):
+        port &= 0xFF
+        self.iomap.address[port].write(port, value)
+
+    def _device(self, port):
+        iomap = self.iomap
+        return iomap.address.get(port & 0xFF) if iomap is not None else None
+
+    def in_block(self, port, address, count, step=1):
+        """ What INIR (step 1) or INDR (step -1) reads, count bytes from
+            port to memory from address on, in one read_block() from the
+            device if it has one. port is BC as the instruction found it;
+            B counts down a byte at a time, each read seeing it after the
+            decrement as INI and IND do """
+        read_block = getattr(self._device(port), "read_block", None)
+        if read_block is None:
+            c, b = port & 0xFF, port >> 8
+            for _ in range(count):
+                b = (b - 1) & 0xFF
+                self.write8(address, self.in8(b << 8 | c))
+                address = (address + step) & 0xFFFF
+            return
+        data = bytes(read_block(port & 0xFF, count))
+        memory = self.memory
+        self.wrote(address, count, step)
+        if step > 0:
+            first = min(count, 0x10000 - address)
+            memory[address:address + first] = data[:first]
+            memory[:count - first] = data[first:]
+        else:
+            first = min(count, address + 1)
+            memory[address - first + 1:address + 1] = data[first - 1::-1]
+            memory[0x10000 - count + first:] = data[:first - 1:-1]
+
+    def out_block(self, port, address, count, step=1):
+        """ What OTIR (step 1) or OTDR (step -1) writes, count bytes from
+            memory from address on to port, handed to the device's
+            write_block() as memoryviews if it has one. port is BC as the
+            instruction found it; B counts down a byte at a time, each
+            write seeing it before the decrement as OUTI and OUTD do """
+        write_block = getattr(self._device(port), "write_block", None)
+        if write_block is None:
+            c, b = port & 0xFF, port >> 8
+            for _ in range(count):
+                self.out8(b << 8 | c, self.read8(address))
+                b = (b - 1) & 0xFF
+                address = (address + step) & 0xFFFF
+            return
+        view = memoryview(self.memory)
+        port &= 0xFF
+        if step > 0:
+            first = min(count, 0x10000 - address)
+            write_block(port, view[address:address + first])
+            if count > first:
+                write_block(port, view[:count - first])
+        else:
+            first = min(count, address + 1)
+            write_block(port, view[address - first + 1:address + 1][::-1])
+            if count > first:
+                write_block(port, view[0x10000 - count + first:][::-1])
+
+    def reti(self):
+        if self.interrupts is not None:
+            self.interrupts.reti()
+
+
+class TwoPassBus(object):
+    """ Adapter for the old get_read_list/execute protocol.
+
+        Reads are recorded, and served from data when it is given, writes
+        are collected as (address, value) tuples. I/O addresses are offset
+        by 0x10000 as before. Block instructions go round once a call. """
+    budget = 0
+
+    def __init__(self, data=None):
+        self.reads = []
+        self.writes = []
+        self._data = iter(data) if data is not None else None
+
+    def read8(self, address):
+        self.reads.append(address)
+        if self._data is None:
+            return 0
+        return next(self._data)
+
+    def write8(self, address, value):
+        self.writes.append((address, value))
+
+    def read16(self, address):
+        return self.read8(address) | self.read8((address + 1) & 0xFFFF) << 8
+
+    def write16(self, address, value):
+        self.write8(address, value & 0xFF)
+        self.write8((address + 1) & 0xFFFF, value >> 8)
+
+    def in8(self, port):
+        return self.read8(port + 0x10000)
+
+    def out8(self, port, value):
+        self.write8(port + 0x10000, value)
+
+    def reti(self):
+        pass
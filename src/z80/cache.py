@@ -0,0 +1,90 @@
+""" Cache of decoded instructions, keyed by address """
+from . bus import written
+
+
+class DecodeCache(object):
+    """ Remembers what InstructionSet.decode returned for each address.
+
+        An entry is the (instruction, operands) pair, the instruction
+        carries the handler, length and tstates. _code counts the entries
+        covering every byte so a write only has to look for entries to
+        drop when it lands on cached code. Writes that do not go through
+        the bus (loading a ROM, poking memory directly) must call
+        invalidate() or clear() themselves. """
+    def __init__(self, instructions, memory):
+        self._decode = instructions.decode
+        self._memory = memory
+        self._entries = [None] * 0x10000
+        self._code = bytearray(0x10000)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def attach(self, bus):
+        """ Route the bus's memory writes through the cache """
+        bus.write8 = self.write8
+        bus.write16 = self.write16
+        self._wrote = bus.wrote
+        bus.wrote = self.wrote
+
+    def lookup(self, pc):
+        entry = self._entries[pc]
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self._decode(self._memory, pc)
+        self._entries[pc] = entry
+        code = self._code
+        for address in range(pc, pc + entry[0].length):
+            code[address & 0xFFFF] += 1
+        return entry
+
+    def write8(self, address, value):
+        self._memory[address] = value
+        if self._code[address]:
+            self.invalidate(address)
+
+    def write16(self, address, value):
+        memory = self._memory
+        code = self._code
+        high = (address + 1) & 0xFFFF
+        memory[address] = value & 0xFF
+        memory[high] = value >> 8
+        if code[address]:
+            self.invalidate(address)
+        if code[high]:
+            self.invalidate(high)
+
+    def wrote(self, address, count, step=1):
+        self._wrote(address, count, step)
+        code = self._code
+        for start, end in written(address, count, step):
+            if code.count(0, start, end) != end - start:
+                for address in range(start, end):
+                    if code[address]:
+                        self.invalidate(address)
+
+    def invalidate(self, address):
+        """ Drop every entry covering address """
+        entries = self._entries
+        code = self._code
+        # An instruction is at most 4 bytes long
+        for back in range(4):
+            start = (address - back) & 0xFFFF
+            entry = entries[start]
+            if entry is not None and entry[0].length > back:
+                entries[start] = None
+                self.invalidations += 1
+                for a in range(start, start + entry[0].length):
+                    code[a & 0xFFFF] -= 1
+
+    def clear(self):
+        self._entries = [None] * 0x10000
+        self._code = bytearray(0x10000)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0}
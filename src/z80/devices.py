@@ -0,0 +1,116 @@
+""" I/O devices with nothing to do with a user interface, io has the
+    Qt front ends built on them """
+from . import trace
+from . trace import DEBUG, INFO
+
+# T-states a character takes on the wire at 115200 baud, ten bits at the
+# SBC's 7.3728 MHz
+CHARACTER = 640
+
+
+class IO(object):
+    """ A device at the ports in _addresses.
+
+        A device may also have read_block(address, n), returning n bytes,
+        and write_block(address, buffer), taking a memoryview, for INIR,
+        OTIR and the like to move a whole run in one call instead of a
+        read() or write() a byte. """
+    _addresses = []
+    def read(self, address):
+        pass
+    def write(self, address, value):
+        pass
+
+class Interruptable(object):
+    def interrupt(self):
+        if trace.interrupts.info:
+            trace.interrupts.emit(INFO, "interrupt")
+        pass
+
+
+class Acia(IO):
+    """ The 6850 serial port, status at 80H and data at 81H.
+
+        receive() hands the CPU a byte from the terminal, one at a time,
+        interrupting it. Bytes the CPU sends go to transmit(), which keeps
+        them in output unless a front end has its own. """
+    _addresses = [0x80, 0x81]
+    def __init__(self, interruptable=None):
+        self._interruptable = interruptable
+        self._send_queue = None
+        self.output = []
+
+    def read(self, address):
+        if trace.io.debug:
+            trace.io.emit(DEBUG, "read %02X", address)
+        if address == 0x80:
+            v =  ((1 << 1) | # RTS
+                  ((self._send_queue is not None) << 0) | # interrupt?
+                  0 )
+            return v
+        elif address == 0x81:
+            if self._send_queue is not None:
+                val = self._send_queue
+                self._send_queue = None
+                return val
+        return 0x13
+
+    def write(self, address, value):
+        if trace.io.debug:
+            trace.io.emit(DEBUG, "write %02X %02X", address, value)
+        if address == 0x80:
+            pass
+        elif address == 0x81:
+            self.transmit(value)
+        else:
+            raise Exception("Trying Console IO with wrong address")
+
+    def transmit(self, value):
+        self.output.append(value)
+
+    def write_block(self, address, buffer):
+        if address != 0x81:
+            raise Exception("Trying Console IO with wrong address")
+        for value in bytes(buffer):
+            self.transmit(value)
+
+    @property
+    def waiting(self):
+        """ Whether a byte from the terminal has yet to be read """
+        return self._send_queue is not None
+
+    def receive(self, value):
+        """ Queue value for the CPU, False if the last one is still
+            waiting to be read """
+        if self._send_queue is not None:
+            return False
+        self._send_queue = value
+        if self._interruptable is not None:
+            self._interruptable.interrupt()
+        return True
+
+    def type(self, data, scheduler, interval=CHARACTER):
+        """ Have the bytes of data arrive from the terminal one every
+            interval T-states on the machine's scheduler, each waiting
+            until the CPU has read the one before """
+        data = bytes(data)
+        def arrive(i):
+            if self.receive(data[i]):
+                i += 1
+            if i < len(data):
+                scheduler.after(interval, arrive, i)
+        if data:
+            scheduler.after(interval, arrive, 0)
+
+
+class IOMap(object):
+    def __init__(self):
+        self.address = {}
+        pass
+    def addDevice(self, dev):
+        assert isinstance(dev, IO)
+        for i in dev._addresses:
+            self.address[i] = dev
+
+    def interupt(self):
+        pass
@@ -0,0 +1,154 @@
+""" Spotting the guest waiting for input, so the host can wait instead
+
+    BASIC at its Ok prompt waits in INTMINI's RXA,
+
+        waitForChar:    LD       A,(serBufUsed)
+                        CP       $00
+                        JR       Z, waitForChar
+
+    going round until the serial interrupt puts a character in the buffer.
+    A loop like it, reading memory or ports and coming back round to the
+    same registers, writing nothing that changes anything, can only end
+    when an interrupt or a device event comes. The run loop skips going
+    round it and blocks the host until one does.
+
+    Loops are looked for at addresses given to watch(), and, unless infer
+    is False, wherever PC is found close to where it was at the last look.
+"""
+import operator
+import threading
+from time import perf_counter
+
+from . import bus
+from . registers import NAMES
+
+# Most instructions run looking for a loop, two times round
+LOOP = 16
+
+# PC at two looks this close together is worth looking at
+WINDOW = 32
+
+# Looks to let go by after finding no loop
+BACKOFF = 8
+
+# Everything the loop must leave as it found it, R counts it going round
+_state = operator.attrgetter(*[name for name in NAMES if name != "R"])
+
+
+class Probe(bus.Bus):
+    """ The machine's bus, noting whether anything is changed through it.
+        Block instructions go round once a step. """
+    budget = 0
+
+    def __init__(self, real):
+        bus.Bus.__init__(self, real.memory, real.iomap)
+        self.interrupts = real.interrupts
+        self._real = real
+        self.changed = False
+        self.write8 = self._write8
+
+    def _write8(self, address, value):
+        if self.memory[address] != value:
+            self.changed = True
+        self._real.write8(address, value)
+
+    def write16(self, address, value):
+        self._write8(address, value & 0xFF)
+        self._write8((address + 1) & 0xFFFF, value >> 8)
+
+    def in8(self, port):
+        return self._real.in8(port)
+
+    def out8(self, port, value):
+        self.changed = True
+        self._real.out8(port, value)
+
+
+class Idle(object):
+    """ Finds idle loops for a machine's run loop, and blocks the host
+        while the machine waits in one until wake() """
+    def __init__(self, infer=True):
+        self.infer = infer
+        self._ranges = []
+        self._woken = threading.Event()
+        self._wake_time = 0.0
+        self._last = -1
+        self._backoff = 0
+        self.loops = 0
+        self.waited = 0.0
+        self.wakeups = 0
+        self.latency = 0.0
+        self.latency_max = 0.0
+
+    def watch(self, start, end):
+        """ Look for an idle loop whenever PC is in start..end - 1 """
+        self._ranges.append((start, end))
+
+    def _candidate(self, pc):
+        for start, end in self._ranges:
+            if start <= pc < end:
+                return True
+        if not self.infer:
+            return False
+        last = self._last
+        self._last = pc
+        if self._backoff:
+            self._backoff -= 1
+            return False
+        return -WINDOW < pc - last < WINDOW
+
+    def probe(self, machine):
+        """ Run the machine on, looking for an idle loop at PC. Returns
+            the T-states run and the loop, (T-states, refreshes) once
+            round, or None if there is none. PC is left at an instruction
+            boundary either way, at the top of the loop when found. """
+        registers = machine.registers
+        pc = registers.PC
+        if not self._candidate(pc):
+            return 0, None
+        probe = Probe(machine._bus)
+        step = machine.instructions.step
+        state = _state(registers)
+        r = registers.R
+        taken = start = 0
+        for _ in range(LOOP):
+            taken += step(probe)
+            if probe.changed or registers.HALT:
+                break
+            if registers.PC == pc:
+                now = _state(registers)
+                if now == state:
+                    self.loops += 1
+                    return taken, (taken - start, (registers.R - r) & 0x7F)
+                # the first time round may set what the rest keep
+                state = now
+                r = registers.R
+                start = taken
+        self._backoff = BACKOFF
+        return taken, None
+
+    def wait(self, seconds):
+        """ Block for up to seconds, return as soon as wake() is called,
+            or at once if it was since the last wait. Returns the seconds
+            blocked. """
+        started = perf_counter()
+        woken = self._woken.wait(seconds)
+        now = perf_counter()
+        self._woken.clear()
+        if woken and self._wake_time >= started:
+            latency = now - self._wake_time
+            self.wakeups += 1
+            self.latency += latency
+            self.latency_max = max(self.latency_max, latency)
+        self.waited += now - started
+        return now - started
+
+    def wake(self):
+        """ Input or stop(), from any thread """
+        self._wake_time = perf_counter()
+        self._woken.set()
+
+    def report(self):
+        mean = self.latency / self.wakeups if self.wakeups else 0.0
+        return "%d loops, waited %.2f s, %d wakeups, latency %.3f ms mean %.3f ms max" % (
+            self.loops, self.waited, self.wakeups, mean * 1000, self.latency_max * 1000)
@@ -1,10 +1,23 @@
-import copy
-import logging
 from . util import *
+from . alu import (add_a, adc_a, sub_a, sbc_a, cp_a, and_a, or_a, xor_a,
+                   increment, decrement, shift, RLC, RRC, RL, RR, SLA, SRA, SLL, SRL,
+                   SUB_F, DAA_A, DAA_F, BIT_F)
+from . registers import reader, writer, flag_bits
+from . bus import TwoPassBus
+from . cache import DecodeCache
+from . import trace
+from . trace import DEBUG
 import sys
 
+
+# Prefix states, each one gets its own flat 256 entry decode table.
+PREFIXES = [(), (0xCB, ), (0xED, ), (0xDD, ), (0xFD, ), (0xDD, 0xCB), (0xFD, 0xCB)]
+PREFIX_BYTES = [0xCB, 0xED, 0xDD, 0xFD]
+# Prefixes that put the displacement before the opcode with a CB
+INDEX = (0xDD, 0xFD)
+
 class instruction(object):
-    def __init__(self, opcode_args, n_operands, string, tstates=1):
+    def __init__(self, opcode_args, n_operands, string, tstates=1, skipped=None):
         self.string = string
         self.super_op = 0
         #op_args = []
@@ -18,31 +31,66 @@ class instruction(object):
 
         self.n_operands = n_operands # number bytes to read pos opcodeaa()
         self.tstates = tstates
+        # T-states when a condition is not met or a repeat is over,
+        # tstates being those when it is
+        self.skipped = skipped
 
     def __call__(self, f):
         return Instruction(self, f)
 
 
 class Instruction(object):
+    """ One opcode variant. The decorated function is a factory, it is
+        called once per variant with the variant's arguments when the tables
+        are built and returns the specialised handler
+
+            handler(registers, bus, n)
+
+        n holds the operand bytes packed little endian, so a 16 bit
+        immediate arrives as a ready made word. The handler does its
+        memory and I/O accesses through the bus itself, in one pass. It
+        returns None having taken tstates, the instructions with a
+        condition return skipped when it is not met, and the repeating
+        block instructions, going round as often as bus.budget allows,
+        the T-states of all the times round. Nothing about the
+        instruction changes as it runs, once its handler is made it is
+        read only. """
     def __init__(self, ins, executer):
         self.string = ins.string
         self.super_op = ins.super_op
         self.opcode_args = ins.opcode_args
         self.n_operands = ins.n_operands
         self.tstates = ins.tstates
+        self.skipped = ins.skipped
         self.executer = executer
         self.incrementR = 1
 
-    def get_read_list(self, operands=()):
-        return self.executer(*((self, self.registers, True, None) + self.args +
-                               tuple([operands[i] for i in self.operands]) ))
-
-    def execute(self, data=None, operands=()):
-        return self.executer(*((self, self.registers, False, data) + self.args +
-                               tuple([operands[i] for i in self.operands]) ))
-
-    def assembler(self, operands=()):
-        return self.string.format(*(self.args + tuple([operands[i] for i in self.operands])))
+    def __setattr__(self, name, value):
+        if "handler" in self.__dict__:
+            raise AttributeError("%s is shared by every InstructionSet, it can not be changed"
+                                 % self.string)
+        object.__setattr__(self, name, value)
+
+    def get_read_list(self, registers, operands=0):
+        """ Two pass protocol, first pass: the addresses execute will read.
+            Runs the handler on a copy of the registers. """
+        bus = TwoPassBus()
+        self.handler(registers.clone(), bus, operands)
+        return bus.reads
+
+    def execute(self, registers, data=None, operands=0):
+        """ Two pass protocol, second pass: run on the registers with the
+            data read from the get_read_list addresses, return the
+            (address, value) writes """
+        bus = TwoPassBus(data or ())
+        self.handler(registers, bus, operands)
+        return bus.writes
+
+    def operand_bytes(self, operands=0):
+        return tuple((operands >> (8 * i)) & 0xFF for i in range(self.operand_count))
+
+    def assembler(self, operands=0):
+        return self.string.format(*(self.args + self.operand_bytes(operands)))
     
     
     def __str__(self):
@@ -52,102 +100,254 @@ class Instruction(object):
         return s
 
 
+def _variant(name, f, o, code, prefix, extra=0):
+    """ The table entry for one of f's opcodes, read only once made,
+        taking extra T-states more than f says """
+    if trace.init.debug:
+        trace.init.emit(DEBUG, "%s: %r", name, o)
+    # Operand bytes are always one contiguous run, for
+    # DDCB/FDCB it sits between the CB and the opcode.
+    operands = tuple(n for n, b in enumerate(code) if b == "-")
+    if prefix[:1] in [(0xDD, ), (0xFD, )] and prefix[1:] == (0xCB, ):
+        increment = 3
+    elif prefix:
+        increment = 2
+    else:
+        increment = 1
+    ff = Instruction.__new__(Instruction)
+    ff.__dict__.update(f.__dict__, args=o[1], operands=operands,
+                       operand_count=len(operands), length=len(code),
+                       operand_start=operands[0] if operands else len(code),
+                       incrementR=increment)
+    if len(o) == 3:
+        ff.__dict__["tstates"] = o[2]
+    if extra:
+        ff.__dict__["tstates"] += extra
+        if ff.skipped is not None:
+            ff.__dict__["skipped"] += extra
+    ff.handler = f.executer(ff, *ff.args)
+    return ff
+
+
+class _Lazy(dict):
+    """ A read only dict, the value for each of keys made by make(key)
+        the first time it is looked up """
+    def __init__(self, keys, make):
+        dict.__init__(self)
+        self._keys = tuple(keys)
+        self._make = make
+
+    def __missing__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        value = self._make(key)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key, default=None):
+        return self[key] if key in self._keys else default
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("the decode tables are shared by every InstructionSet, they are read only")
+
+    __setitem__ = __delitem__ = setdefault = pop = popitem = clear = update = _read_only
+
+
+def _disassembly(pc, ins, operands):
+    return "%04X : %s" % (pc, ins.assembler(operands))
+
+
 class InstructionSet():
+    """ The Z80 instruction set, run on one set of registers.
+
+        The decode tables are made the first time an InstructionSet is
+        made and shared by every one made after it in the process, the
+        registers are handed to the handlers when they are called. Only
+        the unprefixed table is built up front, the CB, ED, DD, FD, DDCB
+        and FDCB ones the first time an opcode is looked up in them. The
+        tables and the instructions in them are read only.
+
+        Every byte sequence decodes, the undocumented instructions and the
+        prefixes that do nothing included, so decoding never fails. """
 
     def __init__(self, registers):
         self._registers = registers
-
-        self._instructions = {} #0: [None] * 256} #keys of this are super_ops
-        
-        self._instructions2 = {}
-        # Fill instruction lookup
-        for i in dir(self):
-            f = getattr(self, i)
+        self._tables, self._main, self._prefixed, self._index_cb = self._shared()
+        self._instruction_composer = []
+        self.cache = None
+
+    @classmethod
+    def _shared(cls):
+        """ The decode tables for the instructions on cls, made on the
+            first call """
+        shared = cls.__dict__.get("_built")
+        if shared is None:
+            shared = cls._build()
+            cls._built = shared
+        return shared
+
+    @classmethod
+    def _build(cls):
+        """ Sort the opcodes by prefix and build the unprefixed table, the
+            prefixed ones are built the first time they are looked up """
+        found = {}
+        for klass in reversed(cls.__mro__):
+            for name, f in vars(klass).items():
+                found[name] = f
+        variants = dict((prefix, []) for prefix in PREFIXES)
+        for name in sorted(found):
+            f = found[name]
             if f.__class__ == Instruction:
-                print (i, ":")
                 for o in f.opcode_args:
-                    print (o)
-                    ff = copy.copy(f)
-                    ff.registers = self._registers
-                    ff.args = o[1]
-                    if len(o) == 3:
-                        ff.tstates = o[2]
-                        #print "Tstates=", ff.tstates
-                    else:
-                        # print "missing tstates for "
-                        # tstates not specified so used instruction group number
-                        # so default...
-                        pass
-                    ff.operands = []
-                    d = self._instructions2
-                    opargs = o
-                    if type(o[0]) == type(0x4):
-                        if o[0] > 0xFF:
-                            opargs = ((o[0] >> 8, o[0] & 0xFF), o[1])
-                        else:
-                            opargs = ((o[0], ), o[1])
-                    for n, i in enumerate(opargs[0][:-1]):
-                        if i in d:
-                            d = d[i]
-                        elif i == "-":
-                            ff.operands.append(n)
-                            if len(d.keys()) == 0:
-                                d2 = {}
-                                for i in range(256):
-                                    d[i] = d2
-                                d = d2
-                            else:
-                                d = d[0]
+                    code = o[0]
+                    if type(code) == type(0x4):
+                        if code > 0xFF:
+                            code = (code >> 8, code & 0xFF)
                         else:
-                            d[i] = {}
-                            d = d[i]                    
-                    if (opargs[0][0] in [0xCB, 0xED, 0xDD, 0xFD]):
-                        if (opargs[0][0] in [0xDD, 0xFD]) & (opargs[0][1] == 0xCB): ff.incrementR = 3
-                        else: ff.incrementR = 2
-                    else: ff.incrementR = 1
-                    if opargs[0][-1] == "-":
-                        ff.operands.append(n+1)
-                        for i in range(256):
-                            d[i] = ff
-                    else:
-                        d[opargs[0][-1]] = ff
-                    
-                            
-
-        self._instructions = self._instructions2
+                            code = (code, )
+                    fixed = [b for b in code if b != "-"]
+                    variants[tuple(fixed[:-1])].append((fixed[-1], name, f, o, code))
+
+        def table(prefix):
+            table = [None] * 256
+            for op, name, f, o, code in variants[prefix]:
+                table[op] = _variant(name, f, o, code, prefix)
+            if not prefix:
+                for op in PREFIX_BYTES:
+                    table[op] = None
+            elif prefix[0] in INDEX and len(prefix) == 1:
+                # Undocumented: DD or FD in front of an instruction that
+                # does not use HL runs it 4 T-states later, in front of
+                # another prefix it is a NOP of its own
+                for op, name, f, o, code in variants[()]:
+                    if table[op] is None:
+                        table[op] = _variant(name, f, o, prefix + tuple(code), prefix, 4)
+                    if op == 0x00:
+                        for other in PREFIX_BYTES:
+                            if other != 0xCB:
+                                table[other] = _variant(name, f, o, prefix, ())
+            return tuple(table)
+
+        tables = _Lazy(PREFIXES, table)
+        prefixed = _Lazy(PREFIX_BYTES, lambda op: tables[op, ])
+        index_cb = _Lazy(INDEX, lambda op: tables[op, 0xCB])
+        return tables, tables[()], prefixed, index_cb
 
-        self._instruction_composer = []
-        self._composer_instruction = None
-        self._composer_len = 1
-        
-        
     def __getitem__(self, ins):
-        if self.is_two_parter(ins):
-            return self._instructions[ins]
-        else:
-            if ins in self._instructions[0]: 
-                return self._instructions[0][ins]
+        code = []
+        while True:
+            code.insert(0, ins & 0xFF)
+            ins >>= 8
+            if not ins:
+                break
+        if len(code) == 3:
+            code.insert(2, 0)
+        try:
+            q = self._lookup(code, 0)
+        except (KeyError, IndexError):
+            q = None
+        if q is None:
             raise AttributeError("Unknown opcode")
+        return q
+
+    def _lookup(self, memory, pc):
+        """ Return the table entry for the instruction starting at pc """
+        op = memory[pc]
+        ins = self._main[op]
+        if ins is None:
+            nxt = memory[(pc + 1) & 0xFFFF]
+            if nxt == 0xCB and op in INDEX:
+                # DD CB d op, the displacement comes before the opcode
+                ins = self._index_cb[op][memory[(pc + 3) & 0xFFFF]]
+            else:
+                ins = self._prefixed[op][nxt]
+        return ins
+
+    def decode(self, memory, pc):
+        """ Decode the instruction at pc straight from memory,
+            return the instruction and its packed operand bytes """
+        ins = self._lookup(memory, pc)
+        count = ins.operand_count
+        if not count:
+            return ins, 0
+        start = pc + ins.operand_start
+        if count == 1:
+            return ins, memory[start & 0xFFFF]
+        return ins, memory[start & 0xFFFF] | memory[(start + 1) & 0xFFFF] << 8
+
+    def enable_cache(self, bus):
+        """ Look decoded instructions up in a DecodeCache from now on,
+            bus writes keep it up to date. Returns the cache. """
+        self.cache = DecodeCache(self, bus.memory)
+        self.cache.attach(bus)
+        return self.cache
+
+    def fetch(self, memory):
+        """ Decode the instruction at PC, step PC over it and refresh R.
+            Whatever comes after an EI ends the hold it put on interrupts,
+            an EI setting it again. """
+        registers = self._registers
+        registers.EI_DELAY = False
+        pc = registers.PC
+        if self.cache is not None:
+            ins, operands = self.cache.lookup(pc)
+        else:
+            ins, operands = self.decode(memory, pc)
+        registers.PC = (pc + ins.length) & 0xFFFF
+        registers.R = ((registers.R + ins.incrementR) & 0x7F) | (registers.R & 0x80)
+        if trace.decode.debug:
+            trace.decode.emit(DEBUG, _disassembly, pc, ins, operands)
+        return ins, operands
+
+    def step(self, bus):
+        """ Fetch and execute the instruction at PC, return the T-states
+            it took """
+        ins, operands = self.fetch(bus.memory)
+        return ins.handler(self._registers, bus, operands) or ins.tstates
 
     def __lshift__(self, op):
         self._instruction_composer.append(op)
-        q = self._instructions
-        for i in self._instruction_composer:
-            q = q[i]
-        if isinstance(q, dict):
+        composer = self._instruction_composer
+        if composer[0] in self._prefixed:
+            if len(composer) < 2:
+                return False, 0
+            if composer[1] == 0xCB and composer[0] in self._index_cb and len(composer) < 4:
+                return False, 0
+        q = self._lookup(composer, 0)
+        if len(composer) < q.length:
             return False, 0
-        else:
-            ops = tuple(self._instruction_composer)
-            self._instruction_composer = []
-            self._registers.R = ((self._registers.R + q.incrementR) & 0x7F) | (self._registers.R & 0x80)
+        ops = 0
+        for n in range(q.operand_count):
+            ops |= composer[q.operand_start + n] << (8 * n)
+        # an index prefix in front of another is an instruction on its own
+        self._instruction_composer = composer[q.length:]
+        self._registers.R = ((self._registers.R + q.incrementR) & 0x7F) | (self._registers.R & 0x80)
 #            print q, ops
-            return q, ops
+        return q, ops
         
     def reset_composer(self):
         self._instruction_composer = []
         
     def is_two_parter(self, ins):
-        return ins in self._instructions
+        return ins in self._prefixed
 
     #----------------------------------------------------------------------
 
@@ -198,26 +398,25 @@ class InstructionSet():
                   (0xFD6C, ("IYL", "IYH"), 8), (0xFD6D, ("IYL", "IYL"), 8),
                   (0xED47, ("I", "A"), 9), (0xED4F, ("R", "A"), 9),
                   ], 0, "LD {0}, {1}", 4)
-    def ld_r_r_(instruction, registers, get_reads, data, r, r_):
-        if get_reads:
-            return []
-        else:
-            registers[r] = registers[r_]
-            return []
+    def ld_r_r_(instruction, r, r_):
+        get, put = reader(r_), writer(r)
+        def ld_r_r_(registers, bus, n):
+            put(registers, get(registers))
+        return ld_r_r_
         
     @instruction([(0xED57, ('I', )), (0xED5F, ("R", ))], 0, "LD A, {0}", 9)
-    def ld_a_ir(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.A = registers[r]
-            registers.condition.S = registers[r] >> 7
-            registers.condition.Z = registers[r] == 0
+    def ld_a_ir(instruction, r):
+        get = reader(r)
+        def ld_a_ir(registers, bus, n):
+            v = get(registers)
+            registers.A = v
+            registers.condition.S = v >> 7
+            registers.condition.Z = v == 0
             registers.condition.H = 0
             registers.condition.PV = registers.IFF2
             registers.condition.N = 0
             set_f5_f3_from_a(registers)
-            return []
+        return ld_a_ir
         
     #@instruction([(0xED47, ("I", )), (0xED5F, ("R", )), (0x00, (), 30) ],
                   #1, "LD {0}, {1}", 9)
@@ -246,23 +445,21 @@ class InstructionSet():
                   ([0xFD, 0x16, '-'], ("D", ), 11), ([0xFD, 0x1E, '-'], ("E", ), 11), ([0xFD, 0x26, '-'], ("IYH", ), 11),
                   ([0xFD, 0x2E, '-'], ("IYL", ), 11)],
                  1, "LD {0}, {1:X}H", 7)
-    def ld_r_n(instruction, registers, get_reads, data, r, n):
-        if get_reads:
-            return []
-        else:
-            registers[r] = n
-            return []
+    def ld_r_n(instruction, r):
+        put = writer(r)
+        def ld_r_n(registers, bus, n):
+            put(registers, n)
+        return ld_r_n
 
 
     @instruction([(0x7E, ("A", )), (0x46, ("B", )), (0x4E, ("C", )), (0x56, ("D", )), (0x5E, ("E", )), (0x66, ("H", )),
                   (0x6E, ("L", ))],
                  0, "LD {0}, (HL)", 7)
-    def ld_r_hl(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return [registers.H << 8 | registers.L]
-        else:
-            registers[r] = data[0]
-            return []
+    def ld_r_hl(instruction, r):
+        put = writer(r)
+        def ld_r_hl(registers, bus, n):
+            put(registers, bus.read8(registers.H << 8 | registers.L))
+        return ld_r_hl
 
     @instruction([([0xDD, 0x7E, '-'], ("A", "IX")), ([0xDD, 0x46, '-'], ("B", "IX")),
                   ([0xDD, 0x4E, '-'], ("C", "IX")), ([0xDD, 0x56, '-'], ("D", "IX")),
@@ -273,21 +470,20 @@ class InstructionSet():
                   ([0xFD, 0x5E, '-'], ("E", "IY")), ([0xFD, 0x66, '-'], ("H", "IY")),
                   ([0xFD, 0x6E, '-'], ("L", "IY"))],   
                   1, "LD {0}, ({1}+{2:X}H)", 19)
-    def ld_r_i_d(instruction, registers, get_reads, data, r, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            registers[r] = data[0]
-            return []
+    def ld_r_i_d(instruction, r, i):
+        put, index = writer(r), reader(i)
+        def ld_r_i_d(registers, bus, d):
+            put(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return ld_r_i_d
 
     @instruction([(0x77, ("A", )), (0x70, ("B", )), (0x71, ("C", )), (0x72, ("D", )), (0x73, ("E", )), (0x74, ("H", )),
                   (0x75, ("L", ))],
                  0, "LD (HL), {0}", 7)
-    def ld_hl_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            return [(registers.H << 8 | registers.L, registers[r])]
+    def ld_hl_r(instruction, r):
+        get = reader(r)
+        def ld_hl_r(registers, bus, n):
+            bus.write8(registers.H << 8 | registers.L, get(registers))
+        return ld_hl_r
 
     @instruction([([0xDD, 0x77, '-'], ("A", "IX")), ([0xDD, 0x70, '-'], ("B", "IX")),
                   ([0xDD, 0x71, '-'], ("C", "IX")), ([0xDD, 0x72, '-'], ("D", "IX")),
@@ -298,62 +494,57 @@ class InstructionSet():
                   ([0xFD, 0x73, '-'], ("E", "IY")), ([0xFD, 0x74, '-'], ("H", "IY")),
                   ([0xFD, 0x75, '-'], ("L", "IY"))],
                   1, "LD ({1}+{2:X}H), {0}", 19)
-    def ld_i_d_r(instruction, registers, get_reads, data, r, i, d):
-        if get_reads:
-            return []
-        else:
-            return [( registers[i] + get_8bit_twos_comp(d), registers[r])]
+    def ld_i_d_r(instruction, r, i):
+        get, index = reader(r), reader(i)
+        def ld_i_d_r(registers, bus, d):
+            bus.write8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF, get(registers))
+        return ld_i_d_r
 
     @instruction([([0x36, '-'], ( ))], 1, "LD (HL), {0:X}H", 10)
-    def ld_hl_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            return [(registers.H << 8 | registers.L, n)]
+    def ld_hl_n(instruction):
+        def ld_hl_n(registers, bus, n):
+            bus.write8(registers.H << 8 | registers.L, n)
+        return ld_hl_n
 
     @instruction([([0xDD, 0x36, '-', '-'], ("IX", )), ([0xFD, 0x36, '-', '-'], ("IY", ))],
                  2, "LD ({0}+{1:X}H), {2:X}H", 19)
-    def ld_i_d_n(instruction, registers, get_reads, data, i, d, n):
-        if get_reads:
-            return []
-        else:
-            return [( registers[i] + get_8bit_twos_comp(d), n)]
+    def ld_i_d_n(instruction, i):
+        index = reader(i)
+        def ld_i_d_n(registers, bus, dn):
+            bus.write8((index(registers) + get_8bit_twos_comp(dn & 0xFF)) & 0xFFFF, dn >> 8)
+        return ld_i_d_n
 
     @instruction([(0x0A, ("B", "C")), (0x1A, ("D", "E"))],
                  0, "LD A, ({0}{1})", 7)
-    def ld_a_rr(instruction, registers, get_reads, data, r, r2):
-        if get_reads:
-            return [registers[r] << 8 | registers[r2]]
-        else:
-            registers.A = data[0]
-            return []
+    def ld_a_rr(instruction, r, r2):
+        get = reader(r + r2)
+        def ld_a_rr(registers, bus, n):
+            registers.A = bus.read8(get(registers))
+        return ld_a_rr
 
     @instruction([([0x3A, '-', '-'], ())],
                  2, "LD A, ({1:x}{0:X}H)", 13)
-    def ld_a_nn(instruction, registers, get_reads, data, n, n2):
-        if get_reads:
-            return [n2 << 8 | n]
-        else:
-            registers.A = data[0]
-            return []
+    def ld_a_nn(instruction):
+        def ld_a_nn(registers, bus, nn):
+            registers.A = bus.read8(nn)
+        return ld_a_nn
 
 
     @instruction([(0x02, ("B", "C")), (0x12, ("D", "E"))],
                  0, "LD ({0}{1}), A", 7)
-    def ld_rr_a(instruction, registers, get_reads, data, r, r2):
-        if get_reads:
-            return []
-        else:
-            return [(registers[r] << 8 | registers[r2], registers.A)]
+    def ld_rr_a(instruction, r, r2):
+        get = reader(r + r2)
+        def ld_rr_a(registers, bus, n):
+            bus.write8(get(registers), registers.A)
+        return ld_rr_a
 
 
     @instruction([([0x32, '-', '-'], ())],
                  2, "LD ({1:x}{0:X}H), A", 13)
-    def ld_nn_a(instruction, registers, get_reads, data, n, n2):
-        if get_reads:
-            return []
-        else:
-            return [(n2 << 8 | n, registers.A)]
+    def ld_nn_a(instruction):
+        def ld_nn_a(registers, bus, nn):
+            bus.write8(nn, registers.A)
+        return ld_nn_a
 
 
     #----------------------------------------------------------------------
@@ -361,404 +552,395 @@ class InstructionSet():
     #----------------------------------------------------------------------
     @instruction([([0x01, '-', '-'], ("B", "C")), ([0x11, '-', '-'], ("D", "E")), ([0x21, '-', '-'], ("H", "L"))],
                  2, "LD {0}{1}, {3:X}{2:X}H", 10)
-    def ld_dd_nn(instruction, registers, get_reads, data, r, r2, n, n2):
-        if get_reads:
-            return []
-        else:
-            registers[r] = n2
-            registers[r2] = n
-            return []
+    def ld_dd_nn(instruction, r, r2):
+        put = writer(r + r2)
+        def ld_dd_nn(registers, bus, nn):
+            put(registers, nn)
+        return ld_dd_nn
 
     @instruction([([0x31, '-', '-'], ("SP",), 10), ([0xDD, 0x21, '-', '-'], ("IX", )),
                   ([0xFD, 0x21, '-', '-'], ("IY", ))],
                  2, "LD {0}, {2:X}{1:X}H", 14)
-    def ld_D_nn(instruction, registers, get_reads, data, r, n, n2):
-        if get_reads:
-            return []
-        else:
-            registers[r] = n2 << 8 | n
-            return []
+    def ld_D_nn(instruction, r):
+        put = writer(r)
+        def ld_D_nn(registers, bus, nn):
+            put(registers, nn)
+        return ld_D_nn
 
     @instruction([([0xED, 0x4B, '-', '-'], ("B", "C" )), ([0xED, 0x5B, '-', '-'], ("D", "E" )),
                   ([0xED, 0x6B, '-', '-'], ("H", "L" )), ([0x2A, '-', '-'], ("H", "L" ), 16), ],
                  2, "LD {0}{1}, ({3:X}{2:X}H)", 20)
-    def ld_dd_nn_(instruction, registers, get_reads, data, r, r_, n, n_):
-        if get_reads:
-            return [n_ << 8 | n, (n_ << 8 | n) + 1]
-        else:
-            registers[r] = data[1]
-            registers[r_] = data[0]
-            return []
+    def ld_dd_nn_(instruction, r, r_):
+        put = writer(r + r_)
+        def ld_dd_nn_(registers, bus, nn):
+            put(registers, bus.read16(nn))
+        return ld_dd_nn_
 
     @instruction([([0xDD, 0x2A, '-', '-'], ("IX", )), ([0xFD, 0x2A, '-', '-'], ("IY", )),
                   ([0xED, 0x7B, '-', '-'], ("SP", ))],
                  2, "LD {0}, ({2:X}{1:X}H)", 20)
-    def ld_D_nn_(instruction, registers, get_reads, data, r, n, n2):
-        if get_reads:
-            return [n2 << 8 | n, (n2 << 8 | n) + 1]
-        else:
-            registers[r] = data[1] << 8 | data[0]
-            return []
+    def ld_D_nn_(instruction, r):
+        put = writer(r)
+        def ld_D_nn_(registers, bus, nn):
+            put(registers, bus.read16(nn))
+        return ld_D_nn_
 
 
     @instruction([([0xED, 0x73, '-', '-'], ("SP", )), ([0xDD, 0x22, '-', '-'], ("IX", )),
                   ([0xFD, 0x22, '-', '-'], ("IY", ))],
                  2, "LD ({2:X}{1:X}H), {0}", 20)
-    def ld_nn__D(instruction, registers, get_reads, data, r, n, n2):
-        if get_reads:
-            return []
-        else:
-            ad = n2 << 8 | n
-            return [(ad + 1, registers[r] >> 8),
-                    (ad, registers[r] & 255)]
+    def ld_nn__D(instruction, r):
+        get = reader(r)
+        def ld_nn__D(registers, bus, nn):
+            bus.write16(nn, get(registers))
+        return ld_nn__D
 
     @instruction([([0xED, 0x63, '-', '-'], ("H", "L", )), ([0x22, '-', '-'], ("H", "L", ), 16),
                   ([0xED, 0x43, '-', '-'], ("B", "C", )), ([0xED, 0x53, '-', '-'], ("D", "E", ))],
                  2, "LD ({3:X}{2:X}H), {0}{1}", 20)
-    def ld_nn_D(instruction, registers, get_reads, data, r, r2, n, n2):
-        if get_reads:
-            return []
-        else:
-            ad = n2 << 8 | n
-            return [(ad + 1, registers[r]),
-                    (ad, registers[r2])]
+    def ld_nn_D(instruction, r, r2):
+        get = reader(r + r2)
+        def ld_nn_D(registers, bus, nn):
+            bus.write16(nn, get(registers))
+        return ld_nn_D
 
     @instruction([(0xF9, ())],
                  0, "LD SP, HL", 6)
-    def ld_sp_hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def ld_sp_hl(instruction):
+        def ld_sp_hl(registers, bus, n):
             registers.SP = registers.H << 8 | registers.L
-            return []
+        return ld_sp_hl
 
     @instruction([(0xDDF9, ("IX", )), (0xFDF9, ("IY", ))],
                  0, "LD SP, {0}", 10)
-    def ld_sp_i(instruction, registers, get_reads, data, i):
-        if get_reads:
-            return []
-        else:
-            registers.SP = registers[i]
-            return []
+    def ld_sp_i(instruction, i):
+        get = reader(i)
+        def ld_sp_i(registers, bus, n):
+            registers.SP = get(registers)
+        return ld_sp_i
 
 
     @instruction([(0xC5, ("B", "C" )), (0xD5, ("D", "E" )), (0xE5, ("H", "L" )), (0xF5, ("A", "F" ))],
                  0, "PUSH {0}{1}", 11)
-    def push_qq(instruction, registers, get_reads, data, q, q2):
-        if get_reads:
-            return []
-        else:
-            stack = registers.SP
-            registers.SP = dec16(registers.SP)
-            registers.SP = dec16(registers.SP)
-            return [(stack - 1, registers[q]), (stack - 2, registers[q2])]
+    def push_qq(instruction, q, q2):
+        get = reader(q + q2)
+        def push_qq(registers, bus, n):
+            stack = (registers.SP - 2) & 0xFFFF
+            registers.SP = stack
+            bus.write16(stack, get(registers))
+        return push_qq
 
 
     @instruction([(0xDDE5, ("IX",  )), (0xFDE5, ("IY", ))],
                  0, "PUSH {0}", 15)
-    def push_i(instruction, registers, get_reads, data, i):
-        if get_reads:
-            return []
-        else:
-            stack = registers.SP
-            registers.SP = dec16(registers.SP)
-            registers.SP = dec16(registers.SP)
-            return [(stack - 1, registers[i] >> 8), (stack - 2, registers[i] & 255)]
+    def push_i(instruction, i):
+        get = reader(i)
+        def push_i(registers, bus, n):
+            stack = (registers.SP - 2) & 0xFFFF
+            registers.SP = stack
+            bus.write16(stack, get(registers))
+        return push_i
 
 
     @instruction([(0xC1, ("B", "C" )), (0xD1, ("D", "E" )), (0xE1, ("H", "L" )), (0xF1, ("A", "F" ))],
                  0, "POP {0}{1}", 10)
-    def pop_qq(instruction, registers, get_reads, data, q, q2):
-        if get_reads:
+    def pop_qq(instruction, q, q2):
+        put = writer(q + q2)
+        def pop_qq(registers, bus, n):
             stack = registers.SP
-            return [stack, stack + 1]
-        else:
-            registers.SP = inc16(registers.SP)
-            registers.SP = inc16(registers.SP)
-            registers[q2] = data[0]
-            registers[q] = data[1]
-            return []
+            registers.SP = (stack + 2) & 0xFFFF
+            put(registers, bus.read16(stack))
+        return pop_qq
 
 
     @instruction([(0xDDE1, ("IX", )), (0xFDE1, ("IY", ))],
                  0, "POP {0}", 14)
-    def pop_i(instruction, registers, get_reads, data, i):
-        if get_reads:
+    def pop_i(instruction, i):
+        put = writer(i)
+        def pop_i(registers, bus, n):
             stack = registers.SP
-            return [stack, stack + 1]
-        else:
-            registers.SP = inc16(registers.SP)
-            registers.SP = inc16(registers.SP)
-            registers[i] = data[1] << 8 | data[0]
-            return []
+            registers.SP = (stack + 2) & 0xFFFF
+            put(registers, bus.read16(stack))
+        return pop_i
 
     #----------------------------------------------------------------------
     # Exchange, Block Transfer, and Search Group
     #----------------------------------------------------------------------
     @instruction([(0xEB, ())], 0, "EX DE, HL", 4)
-    def ex_de_hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def ex_de_hl(instruction):
+        def ex_de_hl(registers, bus, n):
             registers.D, registers.H = (registers.H, registers.D)
             registers.E, registers.L = (registers.L, registers.E)
-            return []
+        return ex_de_hl
 
     @instruction([(0x08, ())], 0, "EX AF, AF'", 4)
-    def ex_af_af_(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def ex_af_af_(instruction):
+        def ex_af_af_(registers, bus, n):
             registers.A, registers.A_ = (registers.A_, registers.A)
             registers.F, registers.F_ = (registers.F_, registers.F)
-            return []
+        return ex_af_af_
 
     @instruction([(0xD9, ())], 0, "EXX", 4)
-    def exx(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def exx(instruction):
+        def exx(registers, bus, n):
             registers.B, registers.B_ = (registers.B_, registers.B)
             registers.C, registers.C_ = (registers.C_, registers.C)
             registers.D, registers.D_ = (registers.D_, registers.D)
             registers.E, registers.E_ = (registers.E_, registers.E)
             registers.H, registers.H_ = (registers.H_, registers.H)
             registers.L, registers.L_ = (registers.L_, registers.L)
-            return []
+        return exx
 
     @instruction([(0xE3, ())], 0, "EX (SP), HL", 19)
-    def ex_sp__hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.SP, registers.SP + 1]
-        else:
-            h = registers.H
-            l = registers.L
-            registers.H = data[1]
-            registers.L = data[0]
-            return [(registers.SP, l), (registers.SP + 1, h)]
+    def ex_sp__hl(instruction):
+        def ex_sp__hl(registers, bus, n):
+            stack = registers.SP
+            v = bus.read16(stack)
+            bus.write16(stack, registers.H << 8 | registers.L)
+            registers.H = v >> 8
+            registers.L = v & 0xFF
+        return ex_sp__hl
 
     @instruction([(0xDDE3, ("IX", )), (0xFDE3, ("IY", ))], 0,
                  "EX (SP), {0}", 23)
-    def ex_sp__i(instruction, registers, get_reads, data, i):
-        if get_reads:
-            return [registers.SP, registers.SP + 1]
-        else:
-            ix = registers[i]
-            registers[i] = data[1] << 8 | data[0]
-
-            return [(registers.SP, ix & 0xFF),
-                    (registers.SP + 1, ix >> 8)]
+    def ex_sp__i(instruction, i):
+        get, put = reader(i), writer(i)
+        def ex_sp__i(registers, bus, n):
+            stack = registers.SP
+            v = bus.read16(stack)
+            bus.write16(stack, get(registers))
+            put(registers, v)
+        return ex_sp__i
 
     @instruction([(0xEDA0, ())], 0, "LDI", 16)
-    def ldi(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.H << 8 | registers.L]
-        
-        else:
-            de_ = de = registers.D << 8 | registers.E
+    def ldi(instruction):
+        def ldi(registers, bus, n):
+            de = registers.D << 8 | registers.E
             hl = registers.H << 8 | registers.L
             bc = registers.B << 8 | registers.C
-            hl += 1
-            if hl > 0xFFFF: hl = 0
+            v = bus.read8(hl)
+            bus.write8(de, v)
+            hl = (hl + 1) & 0xFFFF
             registers.H = hl >> 8
             registers.L = hl & 0xFF
-            bc -= 1
-            if bc < 0: bc = 0xFFFF
+            bc = (bc - 1) & 0xFFFF
             registers.B = bc >> 8
             registers.C = bc & 0xFF
-            de += 1
-            if de > 0xFFFF: de = 0
+            de = (de + 1) & 0xFFFF
             registers.D = de >> 8
             registers.E = de & 0xFF
 
             registers.condition.H = 0
-            if bc != 0:
-                registers.condition.PV = 1
-            else:
-                registers.condition.PV = 0
+            registers.condition.PV = bc != 0
             registers.condition.N = 0
-            registers.condition.F3 = (registers.A + data[0]) & 0x08
-            registers.condition.F5 = (registers.A + data[0]) & 0x02
-            return [(de_, data[0])]
-
-    @instruction([(0xEDB0, ())], 0, "LDIR", 21)
-    def ldir(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.H << 8 | registers.L]
-        else:
-            de_ = de = registers.D << 8 | registers.E
+            registers.condition.F3 = (registers.A + v) & 0x08
+            registers.condition.F5 = (registers.A + v) & 0x02
+        return ldi
+
+    @instruction([(0xEDB0, ())], 0, "LDIR", 21, 16)
+    def ldir(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def ldir(registers, bus, n):
+            de = registers.D << 8 | registers.E
             hl = registers.H << 8 | registers.L
             bc = registers.B << 8 | registers.C
-            hl += 1
-            if hl > 0xFFFF: hl = 0
+            # all but the last time round the budget allows as one copy
+            more = rounds(bc, bus.budget, tstates) - 1
+            if more:
+                bus.move(de, hl, more, 1)
+                de = (de + more) & 0xFFFF
+                hl = (hl + more) & 0xFFFF
+                bc = (bc - more) & 0xFFFF
+                refresh(registers, 2 * more)
+            v = bus.read8(hl)
+            bus.write8(de, v)
+            hl = (hl + 1) & 0xFFFF
             registers.H = hl >> 8
             registers.L = hl & 0xFF
-            bc -= 1
-            if bc < 0: bc = 0xFFFF
+            bc = (bc - 1) & 0xFFFF
             registers.B = bc >> 8
             registers.C = bc & 0xFF
-            de += 1
-            if de > 0xFFFF: de = 0
+            de = (de + 1) & 0xFFFF
             registers.D = de >> 8
             registers.E = de & 0xFF
 
             registers.condition.H = 0
+            registers.condition.PV = bc != 0
+            registers.condition.N = 0
+            registers.condition.F3 = (registers.A + v) & 0x08
+            registers.condition.F5 = (registers.A + v) & 0x02
             if bc != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
             else:
-                instruction.tstates = 16
-
-            registers.condition.PV = 0
-            registers.condition.N = 0
-            registers.condition.F3 = (registers.A + data[0]) & 0x08
-            registers.condition.F5 = (registers.A + data[0]) & 0x02
-            return [(de_, data[0])]
+                return tstates * more + skipped
+        return ldir
 
 
     @instruction([(0xEDA8, ())], 0, "LDD", 16)
-    def ldd(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.H << 8 | registers.L]
-        else:
-            de_ = de = registers.D << 8 | registers.E
+    def ldd(instruction):
+        def ldd(registers, bus, n):
+            de = registers.D << 8 | registers.E
             hl = registers.H << 8 | registers.L
             bc = registers.B << 8 | registers.C
-            hl -= 1
-            if hl < 0: hl = 0xFFFF
+            v = bus.read8(hl)
+            bus.write8(de, v)
+            hl = (hl - 1) & 0xFFFF
             registers.H = hl >> 8
             registers.L = hl & 0xFF
-            bc -= 1
-            if bc < 0: bc = 0xFFFF
+            bc = (bc - 1) & 0xFFFF
             registers.B = bc >> 8
             registers.C = bc & 0xFF
-            de -= 1
-            if de < 0: de = 0xFFFF
+            de = (de - 1) & 0xFFFF
             registers.D = de >> 8
             registers.E = de & 0xFF
 
             registers.condition.H = 0
-            if bc != 0:
-                registers.condition.PV = 1
-            else:
-                registers.condition.PV = 0
+            registers.condition.PV = bc != 0
             registers.condition.N = 0
-            registers.condition.F3 = (registers.A + data[0]) & 0x08
-            registers.condition.F5 = (registers.A + data[0]) & 0x02
-            return [(de_, data[0])]
-
-    @instruction([(0xEDB8, ())], 0, "LDDR", 16)
-    def lddr(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.H << 8 | registers.L]
-        else:
-            de_ = de = registers.D << 8 | registers.E
+            registers.condition.F3 = (registers.A + v) & 0x08
+            registers.condition.F5 = (registers.A + v) & 0x02
+        return ldd
+
+    @instruction([(0xEDB8, ())], 0, "LDDR", 21, 16)
+    def lddr(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def lddr(registers, bus, n):
+            de = registers.D << 8 | registers.E
             hl = registers.H << 8 | registers.L
             bc = registers.B << 8 | registers.C
-            hl -= 1
-            if hl < 0: hl = 0xFFFF
+            # all but the last time round the budget allows as one copy
+            more = rounds(bc, bus.budget, tstates) - 1
+            if more:
+                bus.move(de, hl, more, -1)
+                de = (de - more) & 0xFFFF
+                hl = (hl - more) & 0xFFFF
+                bc = (bc - more) & 0xFFFF
+                refresh(registers, 2 * more)
+            v = bus.read8(hl)
+            bus.write8(de, v)
+            hl = (hl - 1) & 0xFFFF
             registers.H = hl >> 8
             registers.L = hl & 0xFF
-            bc -= 1
-            if bc < 0: bc = 0xFFFF
+            bc = (bc - 1) & 0xFFFF
             registers.B = bc >> 8
             registers.C = bc & 0xFF
-            de -= 1
-            if de < 0: de = 0xFFFF
+            de = (de - 1) & 0xFFFF
             registers.D = de >> 8
             registers.E = de & 0xFF
 
             registers.condition.H = 0
+            registers.condition.PV = bc != 0
+            registers.condition.N = 0
+            registers.condition.F3 = (registers.A + v) & 0x08
+            registers.condition.F5 = (registers.A + v) & 0x02
             if bc != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
             else:
-                instruction.tstates = 16
-
-            registers.condition.PV = 0
-            registers.condition.N = 0
-            registers.condition.F3 = (registers.A + data[0]) & 0x08
-            registers.condition.F5 = (registers.A + data[0]) & 0x02
-            return [(de_, data[0])]
+                return tstates * more + skipped
+        return lddr
 
 
     @instruction([(0xEDA1, ())], 0, "CPI", 16)
-    def cpi(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
+    def cpi(instruction):
+        def cpi(registers, bus, n):
+            v = bus.read8(registers.HL)
             registers.HL = inc16(registers.HL)
             registers.BC = dec16(registers.BC)
 
-            subtract8(registers.A, data[0], registers)
+            subtract8(registers.A, v, registers)
             registers.condition.PV = registers.BC != 0
-            # F3 is bit 3 of (A - (HL) - H), H 
+            # F3 is bit 3 of (A - (HL) - H), H
             # F5 is bit 1 of (A - (HL) - H), H a
-            f5f3 = registers.A - data[0] -  registers.condition.H
+            f5f3 = registers.A - v -  registers.condition.H
             registers.condition.F5 = f5f3 & 0x02
             registers.condition.F3 = f5f3 & 0x08
-            return []
-
-    @instruction([(0xEDB1, ())], 0, "CPIR", 16)
-    def cpir(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
+        return cpi
+
+    @instruction([(0xEDB1, ())], 0, "CPIR", 21, 16)
+    def cpir(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def cpir(registers, bus, n):
+            # go straight to the last time round the budget allows, or
+            # the first byte that matches
+            more = rounds(registers.BC, bus.budget, tstates) - 1
+            if more:
+                found = bus.find(registers.A, registers.HL, more, 1)
+                if found is not None:
+                    more = found
+                registers.HL = (registers.HL + more) & 0xFFFF
+                registers.BC = (registers.BC - more) & 0xFFFF
+                refresh(registers, 2 * more)
+            v = bus.read8(registers.HL)
             registers.HL = inc16(registers.HL)
             registers.BC = dec16(registers.BC)
 
-            res = subtract8(registers.A, data[0], registers)
+            res = subtract8(registers.A, v, registers)
 
-            if registers.BC != 0 and res != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
-            else:
-                instruction.tstates = 16
             registers.condition.PV = registers.BC != 0
-            f5f3 = registers.A - data[0] -  registers.condition.H
+            f5f3 = registers.A - v -  registers.condition.H
             registers.condition.F5 = f5f3 & 0x02
             registers.condition.F3 = f5f3 & 0x08
-            return []
+            if registers.BC != 0 and res != 0:
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
+            else:
+                return tstates * more + skipped
+        return cpir
 
     @instruction([(0xEDA9, ())], 0, "CPD", 16)
-    def cpd(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
+    def cpd(instruction):
+        def cpd(registers, bus, n):
+            v = bus.read8(registers.HL)
             registers.HL = dec16(registers.HL)
             registers.BC = dec16(registers.BC)
 
-            subtract8(registers.A, data[0], registers)
+            subtract8(registers.A, v, registers)
             registers.condition.PV = registers.BC != 0
-            f5f3 = registers.A - data[0] -  registers.condition.H
+            f5f3 = registers.A - v -  registers.condition.H
             registers.condition.F5 = f5f3 & 0x02
             registers.condition.F3 = f5f3 & 0x08
-            return []
-
-    @instruction([(0xEDB9, ())], 0, "CPDR", 16)
-    def cpdr(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
+        return cpd
+
+    @instruction([(0xEDB9, ())], 0, "CPDR", 21, 16)
+    def cpdr(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def cpdr(registers, bus, n):
+            # go straight to the last time round the budget allows, or
+            # the first byte that matches
+            more = rounds(registers.BC, bus.budget, tstates) - 1
+            if more:
+                found = bus.find(registers.A, registers.HL, more, -1)
+                if found is not None:
+                    more = found
+                registers.HL = (registers.HL - more) & 0xFFFF
+                registers.BC = (registers.BC - more) & 0xFFFF
+                refresh(registers, 2 * more)
+            v = bus.read8(registers.HL)
             registers.HL = dec16(registers.HL)
             registers.BC = dec16(registers.BC)
 
-            res = subtract8(registers.A, data[0], registers)
+            res = subtract8(registers.A, v, registers)
 
-            if registers.BC != 0 and res != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
-            else:
-                instruction.tstates = 16
             registers.condition.PV = registers.BC != 0
-            f5f3 = registers.A - data[0] -  registers.condition.H
+            f5f3 = registers.A - v -  registers.condition.H
             registers.condition.F5 = f5f3 & 0x02
             registers.condition.F3 = f5f3 & 0x08
-            return []
+            if registers.BC != 0 and res != 0:
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
+            else:
+                return tstates * more + skipped
+        return cpdr
 
     #----------------------------------------------------------------------
     # 8-Bit Arithmetic Group
@@ -773,38 +955,32 @@ class InstructionSet():
                   (0xFD87, ("A",), 8), (0xFD80, ("B",), 8), (0xFD81, ("C",), 8),
                   (0xFD82, ("D",), 8), (0xFD83, ("E",), 8), (0xFD84, ("IYH",), 8),
                   (0xFD85, ("IYL",), 8)], 0, "ADD A, {0}", 4)
-    def add_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.A = add8(registers.A, registers[r], registers)
-            return []
+    def add_a_r(instruction, r):
+        get = reader(r)
+        def add_a_r(registers, bus, n):
+            add_a(registers, get(registers))
+        return add_a_r
 
     @instruction([([0xC6, '-'], ())], 1, "ADD A, {0:X}H", 7)
-    def add_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            registers.A = add8(registers.A, n, registers)
-            return []
+    def add_a_n(instruction):
+        def add_a_n(registers, bus, n):
+            add_a(registers, n)
+        return add_a_n
 
 
     @instruction([(0x86, ())], 0, "ADD A, (HL)", 7)
-    def add_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            registers.A = add8(registers.A, data[0], registers)
-            return []
+    def add_a_hl_(instruction):
+        def add_a_hl_(registers, bus, n):
+            add_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return add_a_hl_
 
     @instruction([([0xDD, 0x86, '-'], ("IX",)),
                   ([0xFD, 0x86, '-'], ("IY",))], 1, "ADD A, ({0}+{1:X}H)", 19)
-    def add_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            registers.A = add8(registers.A, data[0], registers)
-            return []
+    def add_a_i_(instruction, i):
+        index = reader(i)
+        def add_a_i_(registers, bus, d):
+            add_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return add_a_i_
 
     #---- ADC ----
     @instruction([(0x8f, ("A",)), (0x88, ("B",)), (0x89, ("C",)),
@@ -816,38 +992,32 @@ class InstructionSet():
                   (0xFD8f, ("A",), 8), (0xFD88, ("B",), 8), (0xFD89, ("C",), 8),
                   (0xFD8A, ("D",), 8), (0xFD8B, ("E",), 8), (0xFD8C, ("IYH",), 8),
                   (0xFD8D, ("IYL",), 8)], 0, "ADC A, {0}", 4)
-    def adc_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.A = add8(registers.A + registers.condition.C, registers[r], registers)
-            return []
+    def adc_a_r(instruction, r):
+        get = reader(r)
+        def adc_a_r(registers, bus, n):
+            adc_a(registers, get(registers))
+        return adc_a_r
 
     @instruction([([0xCE, '-'], ())], 1, "ADC A, {0:X}H", 7)
-    def adc_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            registers.A = add8(registers.A + registers.condition.C, n, registers)
-            return []
+    def adc_a_n(instruction):
+        def adc_a_n(registers, bus, n):
+            adc_a(registers, n)
+        return adc_a_n
 
 
     @instruction([(0x8E, ())], 0, "ADC A, (HL)", 7)
-    def adc_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            registers.A = add8(registers.A + registers.condition.C, data[0], registers)
-            return []
+    def adc_a_hl_(instruction):
+        def adc_a_hl_(registers, bus, n):
+            adc_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return adc_a_hl_
 
     @instruction([([0xDD, 0x8E, '-'], ("IX",)),
                   ([0xFD, 0x8E, '-'], ("IY",))], 1, "ADC A, ({0}+{1:X}H)", 19)
-    def adc_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            registers.A = add8(registers.A + registers.condition.C, data[0], registers)
-            return []
+    def adc_a_i_(instruction, i):
+        index = reader(i)
+        def adc_a_i_(registers, bus, d):
+            adc_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return adc_a_i_
 
     #---- SUB ----
     @instruction([(0x97, ("A",)), (0x90, ("B",)), (0x91, ("C",)),
@@ -859,38 +1029,32 @@ class InstructionSet():
                   (0xFD97, ("A",), 8), (0xFD90, ("B",), 8), (0xFD91, ("C",), 8),
                   (0xFD92, ("D",), 8), (0xFD93, ("E",), 8), (0xFD94, ("IYH",), 8),
                   (0xFD95, ("IYL",), 8)], 0, "SUB A, {0}", 4)
-    def sub_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.A = subtract8_check_overflow(registers.A, registers[r], registers)
-            return []
+    def sub_a_r(instruction, r):
+        get = reader(r)
+        def sub_a_r(registers, bus, n):
+            sub_a(registers, get(registers))
+        return sub_a_r
 
     @instruction([([0xD6, '-'], ())], 1, "SUB A, {0:X}H", 7)
-    def sub_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            registers.A = subtract8_check_overflow(registers.A, n, registers)
-            return []
+    def sub_a_n(instruction):
+        def sub_a_n(registers, bus, n):
+            sub_a(registers, n)
+        return sub_a_n
 
 
     @instruction([(0x96, ())], 0, "SUB A, (HL)", 7)
-    def sub_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            registers.A = subtract8_check_overflow(registers.A, data[0], registers)
-            return []
+    def sub_a_hl_(instruction):
+        def sub_a_hl_(registers, bus, n):
+            sub_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return sub_a_hl_
 
     @instruction([([0xDD, 0x96, '-'], ("IX",)),
                   ([0xFD, 0x96, '-'], ("IY",))], 1, "SUB A, ({0}+{1:X}H)", 19)
-    def sub_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            registers.A = subtract8_check_overflow(registers.A, data[0], registers)
-            return []
+    def sub_a_i_(instruction, i):
+        index = reader(i)
+        def sub_a_i_(registers, bus, d):
+            sub_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return sub_a_i_
 
     #---- SBC ----
     @instruction([(0x9f, ("A",)), (0x98, ("B",)), (0x99, ("C",)),
@@ -902,38 +1066,32 @@ class InstructionSet():
                   (0xFD9f, ("A",), 8), (0xFD98, ("B",), 8), (0xFD99, ("C",), 8),
                   (0xFD9A, ("D",), 8), (0xFD9B, ("E",), 8), (0xFD9C, ("IYH",), 8),
                   (0xFD9D, ("IYL",), 8)], 0, "SBC A, {0}", 4)
-    def sbc_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.A = subtract8_check_overflow(registers.A - registers.condition.C, registers[r], registers)
-            return []
+    def sbc_a_r(instruction, r):
+        get = reader(r)
+        def sbc_a_r(registers, bus, n):
+            sbc_a(registers, get(registers))
+        return sbc_a_r
 
     @instruction([([0xDE, '-'], ())], 1, "SBC A, {0:X}H", 7)
-    def sbc_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            registers.A = subtract8_check_overflow(registers.A - registers.condition.C, n, registers)
-            return []
+    def sbc_a_n(instruction):
+        def sbc_a_n(registers, bus, n):
+            sbc_a(registers, n)
+        return sbc_a_n
 
 
     @instruction([(0x9E, ())], 0, "SBC A, (HL)", 7)
-    def sbc_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            registers.A = subtract8_check_overflow(registers.A - registers.condition.C, data[0], registers)
-            return []
+    def sbc_a_hl_(instruction):
+        def sbc_a_hl_(registers, bus, n):
+            sbc_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return sbc_a_hl_
 
     @instruction([([0xDD, 0x9E, '-'], ("IX",)),
                   ([0xFD, 0x9E, '-'], ("IY",))], 1, "SBC A, ({0}+{1:X}H)", 19)
-    def sbc_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            registers.A = subtract8_check_overflow(registers.A - registers.condition.C, data[0], registers)
-            return []
+    def sbc_a_i_(instruction, i):
+        index = reader(i)
+        def sbc_a_i_(registers, bus, d):
+            sbc_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return sbc_a_i_
 
     #---- AND ----
     @instruction([(0xa7, ("A",)), (0xa0, ("B",)), (0xa1, ("C",)),
@@ -945,38 +1103,32 @@ class InstructionSet():
                   (0xFDa7, ("A",), 8), (0xFDa0, ("B",), 8), (0xFDa1, ("C",), 8),
                   (0xFDa2, ("D",), 8), (0xFDa3, ("E",), 8), (0xFDa4, ("IYH",), 8),
                   (0xFDa5, ("IYL",), 8)], 0, "AND {0}", 4)
-    def and_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            a_and_n(registers, registers[r])
-            return []
+    def and_a_r(instruction, r):
+        get = reader(r)
+        def and_a_r(registers, bus, n):
+            and_a(registers, get(registers))
+        return and_a_r
 
     @instruction([([0xe6, '-'], ())], 1, "AND {0:X}H", 7)
-    def and_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            a_and_n(registers, n)
-            return []
+    def and_a_n(instruction):
+        def and_a_n(registers, bus, n):
+            and_a(registers, n)
+        return and_a_n
 
 
     @instruction([(0xa6, ())], 0, "AND (HL)", 7)
-    def and_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            a_and_n(registers, data[0])
-            return []
+    def and_a_hl_(instruction):
+        def and_a_hl_(registers, bus, n):
+            and_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return and_a_hl_
 
     @instruction([([0xDD, 0xA6, '-'], ("IX",)),
                   ([0xFD, 0xA6, '-'], ("IY",))], 1, "AND ({0}+{1:X}H)", 19)
-    def and_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            a_and_n(registers, data[0])
-            return []
+    def and_a_i_(instruction, i):
+        index = reader(i)
+        def and_a_i_(registers, bus, d):
+            and_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return and_a_i_
 
     #---- OR ----
     @instruction([(0xb7, ("A",)), (0xb0, ("B",)), (0xb1, ("C",)),
@@ -988,38 +1140,32 @@ class InstructionSet():
                   (0xFDb7, ("A",), 8), (0xFDb0, ("B",), 8), (0xFDb1, ("C",), 8),
                   (0xFDb2, ("D",), 8), (0xFDb3, ("E",), 8), (0xFDb4, ("IYH",), 8),
                   (0xFDb5, ("IYL",), 8)], 0, "OR {0}", 4)
-    def or_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            a_or_n(registers, registers[r])
-            return []
+    def or_a_r(instruction, r):
+        get = reader(r)
+        def or_a_r(registers, bus, n):
+            or_a(registers, get(registers))
+        return or_a_r
 
     @instruction([([0xf6, '-'], ())], 1, "OR {0:X}H", 7)
-    def or_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            a_or_n(registers, n)
-            return []
+    def or_a_n(instruction):
+        def or_a_n(registers, bus, n):
+            or_a(registers, n)
+        return or_a_n
 
 
     @instruction([(0xb6, ())], 0, "OR (HL)", 7)
-    def or_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            a_or_n(registers, data[0])
-            return []
+    def or_a_hl_(instruction):
+        def or_a_hl_(registers, bus, n):
+            or_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return or_a_hl_
 
     @instruction([([0xDD, 0xB6, '-'], ("IX",)),
                   ([0xFD, 0xB6, '-'], ("IY",))], 1, "OR ({0}+{1:X}H)", 19)
-    def or_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            a_or_n(registers, data[0])
-            return []
+    def or_a_i_(instruction, i):
+        index = reader(i)
+        def or_a_i_(registers, bus, d):
+            or_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return or_a_i_
 
     #---- XOR ----
     @instruction([(0xaf, ("A",)), (0xa8, ("B",)), (0xa9, ("C",)),
@@ -1031,38 +1177,32 @@ class InstructionSet():
                   (0xFDaf, ("A",), 8), (0xFDa8, ("B",), 8), (0xFDa9, ("C",), 8),
                   (0xFDaa, ("D",), 8), (0xFDab, ("E",), 8), (0xFDac, ("IYH",), 8),
                   (0xFDad, ("IYL",), 8)], 0, "XOR {0}", 4)
-    def xor_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            a_xor_n(registers, registers[r])
-            return []
+    def xor_a_r(instruction, r):
+        get = reader(r)
+        def xor_a_r(registers, bus, n):
+            xor_a(registers, get(registers))
+        return xor_a_r
 
     @instruction([([0xee, '-'], ())], 1, "XOR {0:X}H", 7)
-    def xor_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            a_xor_n(registers, n)
-            return []
+    def xor_a_n(instruction):
+        def xor_a_n(registers, bus, n):
+            xor_a(registers, n)
+        return xor_a_n
 
 
     @instruction([(0xae, ())], 0, "XOR (HL)", 7)
-    def xor_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            a_xor_n(registers, data[0])
-            return []
+    def xor_a_hl_(instruction):
+        def xor_a_hl_(registers, bus, n):
+            xor_a(registers, bus.read8(registers.H << 8 | registers.L))
+        return xor_a_hl_
 
     @instruction([([0xDD, 0xAE, '-'], ("IX",)),
                   ([0xFD, 0xAE, '-'], ("IY",))], 1, "XOR ({0}+{1:X}H)", 19)
-    def xor_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            a_xor_n(registers, data[0])
-            return []
+    def xor_a_i_(instruction, i):
+        index = reader(i)
+        def xor_a_i_(registers, bus, d):
+            xor_a(registers, bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF))
+        return xor_a_i_
 
     #---- CP ----
     @instruction([(0xbf, ("A",)), (0xb8, ("B",)), (0xb9, ("C",)),
@@ -1074,42 +1214,35 @@ class InstructionSet():
                   (0xFDbf, ("A",), 8), (0xFDb8, ("B",), 8), (0xFDb9, ("C",), 8),
                   (0xFDba, ("D",), 8), (0xFDbb, ("E",), 8), (0xFDbc, ("IYH",), 8),
                   (0xFDbd, ("IYL",), 8)], 0, "CP {0}", 4)
-    def cp_a_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            subtract8_check_overflow(registers.A, registers[r], registers)
-            set_f5_f3(registers, registers[r])
-            return []
+    def cp_a_r(instruction, r):
+        get = reader(r)
+        def cp_a_r(registers, bus, n):
+            v = get(registers)
+            cp_a(registers, v)
+        return cp_a_r
 
     @instruction([([0xfe, '-'], ())], 1, "CP {0:X}H", 7)
-    def cp_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            subtract8_check_overflow(registers.A, n, registers)
-            set_f5_f3(registers, n)
-            return []
+    def cp_a_n(instruction):
+        def cp_a_n(registers, bus, n):
+            cp_a(registers, n)
+        return cp_a_n
 
 
     @instruction([(0xbe, ())], 0, "CP (HL)", 7)
-    def cp_a_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            subtract8_check_overflow(registers.A, data[0], registers)
-            set_f5_f3(registers, data[0])
-            return []
+    def cp_a_hl_(instruction):
+        def cp_a_hl_(registers, bus, n):
+            v = bus.read8(registers.H << 8 | registers.L)
+            cp_a(registers, v)
+        return cp_a_hl_
 
     @instruction([([0xDD, 0xBE, '-'], ("IX",)),
                   ([0xFD, 0xBE, '-'], ("IY",))], 1, "CP ({0}+{1:X}H)", 19)
-    def cp_a_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            subtract8_check_overflow(registers.A, data[0], registers)
-            set_f5_f3(registers, data[0])
-            return []
+    def cp_a_i_(instruction, i):
+        index = reader(i)
+        def cp_a_i_(registers, bus, d):
+            v = bus.read8((index(registers) + get_8bit_twos_comp(d)) & 0xFFFF)
+            cp_a(registers, v)
+        return cp_a_i_
 
     #---- INC s ----    
     @instruction([(0x3c, ("A",)), (0x04, ("B",)), (0x0c, ("C",)),
@@ -1121,29 +1254,27 @@ class InstructionSet():
                   (0xFD3c, ("A",), 8), (0xFD04, ("B",), 8), (0xFD0c, ("C",), 8),
                   (0xFD14, ("D",), 8), (0xFD1c, ("E",), 8), (0xFD24, ("IYH",), 8),
                   (0xFD2c, ("IYL",), 8)], 0, "INC {0}", 4)
-    def inc_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = add8(registers[r], 1, registers, C=False )
-            return []
+    def inc_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def inc_r(registers, bus, n):
+            put(registers, increment(registers, get(registers)))
+        return inc_r
 
     @instruction([(0x34, ())], 0, "INC (HL)", 11)
-    def inc_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            new = add8(data[0], 1, registers, C=False )
-            return [(registers.HL, new)]
+    def inc_hl_(instruction):
+        def inc_hl_(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            bus.write8(address, increment(registers, bus.read8(address)))
+        return inc_hl_
 
     @instruction([([0xDD, 0x34, '-'], ("IX",)),
                   ([0xFD, 0x34, '-'], ("IY",))], 1, "INC ({0}+{1:X}H)", 23)
-    def inc_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            new = add8(data[0], 1, registers, C=False )
-            return [(registers[i] + get_8bit_twos_comp(d), new)]
+    def inc_i_(instruction, i):
+        index = reader(i)
+        def inc_i_(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            bus.write8(address, increment(registers, bus.read8(address)))
+        return inc_i_
 
 
     #---- DEC s ----
@@ -1156,228 +1287,164 @@ class InstructionSet():
                   (0xFD3d, ("A",), 8), (0xFD05, ("B",), 8), (0xFD0d, ("C",), 8),
                   (0xFD15, ("D",), 8), (0xFD1d, ("E",), 8), (0xFD25, ("IYH",), 8),
                   (0xFD2d, ("IYL",), 8)], 0, "DEC {0}", 4)
-    def dec_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.condition.PV = registers[r] == 0x80
-            registers[r] = subtract8(registers[r], 1, registers,
-                                     PV=False)
-            
-            return []
+    def dec_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def dec_r(registers, bus, n):
+            put(registers, decrement(registers, get(registers)))
+        return dec_r
 
     @instruction([(0x35, ())], 0, "DEC (HL)", 11)
-    def dec_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            new = subtract8(data[0], 1, registers,
-                                     PV=False)
-            if data[0] == 0x80:
-                registers.condition.PV = 1
-            else:
-                registers.condition.PV = 0
-                
-            return [(registers.HL, new)]
+    def dec_hl_(instruction):
+        def dec_hl_(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            bus.write8(address, decrement(registers, bus.read8(address)))
+        return dec_hl_
 
     @instruction([([0xDD, 0x35, '-'], ("IX",)),
                   ([0xFD, 0x35, '-'], ("IY",))], 1, "DEC ({0}+{1:X}H)", 23)
-    def dec_i_(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            new = subtract8(data[0], 1, registers,
-                                     PV=False)
-            if data[0] == 0x80:
-                registers.condition.PV = 1
-            else:
-                registers.condition.PV = 0
-            return [(registers[i] + get_8bit_twos_comp(d), new)]
+    def dec_i_(instruction, i):
+        index = reader(i)
+        def dec_i_(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            bus.write8(address, decrement(registers, bus.read8(address)))
+        return dec_i_
 
     #--------------------------------------------------------------------
     # General-Purpose Arithmetic and CPU Control Groups
     #--------------------------------------------------------------------
     @instruction([(0x27, ())], 0, "DAA", 4)
-    def daa(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def daa(instruction):
+        def daa(registers, bus, n):
             # https://raine.1emulation.com/archive/dev/z80-documented.pdf
-            # (The Undocumented Z80 Documented)
-            hn = (registers.A & 0xF0) >> 4 # high nibble
-            ln = registers.A & 0x0F # low nibble
-
-           # Flag C
-            if (registers.condition.C == 0):
-                if (
-                    ((hn >= 0x09) & (ln >= 0x0A)) |
-                    ((hn >= 0x0A) & (ln <= 0x09))
-                ): c_ = 1
-                else: c_ = 0
-            else: c_ = 1
-            
-            # Flag H
-            if (registers.condition.N == 0):
-                if (ln < 0x0A): h_ = 0
-                else: h_ = 1
-            else:
-                if (registers.condition.H == 0): h_ = 0
-                else:
-                    if (ln < 0x06): h_ = 1
-                    else: h_ = 0
-            
-            # Calculate diff
-            diff = 0
-            if (registers.condition.C == 0):
-                if ((hn <= 0x09) & (ln <= 0x09) & (registers.condition.H == 0)): diff = 0x00
-                elif ((hn <= 0x09) & (ln <= 0x09) & (registers.condition.H == 1)): diff = 0x06
-                elif ((hn <= 0x08) & (ln >= 0x0A)): diff = 0x06
-                elif ((hn >= 0x0A) & (ln <= 0x09) & (registers.condition.H == 0)): diff = 0x60
-                elif ((hn >= 0x09) & (ln >= 0x0A)): diff = 0x66
-                elif ((hn >= 0x0A) & (ln <= 0x09) & (registers.condition.H == 1)): diff = 0x66
-            else:
-                if ((ln <= 0x09) & (registers.condition.H == 0)): diff = 0x60
-                elif ((ln <= 0x09) & (registers.condition.H == 1)): diff = 0x66
-                elif (ln >= 0x0A): diff = 0x66
-
-            if registers.condition.N == 1:
-                registers.A = get_8bit_twos_comp((registers.A - diff)) & 0xFF
-            else:
-                registers.A = (registers.A + diff) & 0xFF
-
-            registers.condition.C = c_
-            registers.condition.H = h_
-            registers.condition.S = registers.A >> 7
-            registers.condition.Z = (registers.A == 0)
-            registers.condition.PV = parity(registers.A)
-            set_f5_f3_from_a(registers)
-            return []
+            # (The Undocumented Z80 Documented), tabulated in alu
+            f = registers.F
+            i = ((f & 0x03) | (f & 0x10) >> 2) << 8 | registers.A
+            registers.A = DAA_A[i]
+            registers.F = DAA_F[i]
+        return daa
 
     @instruction([(0x2F, ())], 0, "CPL", 4)
-    def cpl(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def cpl(instruction):
+        def cpl(registers, bus, n):
             registers.A = 0xFF ^ registers.A
             registers.condition.N = 1
             registers.condition.H = 1
             set_f5_f3_from_a(registers)
-            return []
+        return cpl
 
 
-    @instruction([(0xED44, ())], 0, "NEG", 8)
-    def neg(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    # ED 4C, 54, ... 7C are NEG too, undocumented
+    @instruction([(0xED44 | i << 3, ()) for i in range(8)], 0, "NEG", 8)
+    def neg(instruction):
+        def neg(registers, bus, n):
             a = registers.A
-            registers.A = subtract8(0, a, registers)
-            registers.condition.PV = (a == 0x80)
-            registers.condition.C = (a != 0x00)
-            return []
+            registers.A = -a & 0xFF
+            registers.F = SUB_F[a]
+        return neg
 
     @instruction([(0x3F, ())], 0, "CCF", 4)
-    def ccf(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def ccf(instruction):
+        def ccf(registers, bus, n):
             registers.condition.H = registers.condition.C
             registers.condition.N = 0
             registers.condition.C = not registers.condition.C
             set_f5_f3_from_a(registers)
-            return []
+        return ccf
 
     @instruction([(0x37, ())], 0, "SCF", 4)
-    def scf(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def scf(instruction):
+        def scf(registers, bus, n):
             registers.condition.H = 0
             registers.condition.N = 0
             registers.condition.C = 1
             set_f5_f3_from_a(registers)
-            return []
+        return scf
 
     @instruction([(0x00, ())], 0, "NOP", 4)
-    def nop(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
-            return []
+    def nop(instruction):
+        def nop(registers, bus, n):
+            pass
+        return nop
+
+    # Undocumented: the ED opcodes with nothing else to do take 8 T-states
+    @instruction([(0xED00 | op, ()) for op in list(range(0x00, 0x40)) + [0x77, 0x7F] +
+                  [op for op in range(0x80, 0xC0) if op < 0xA0 or op & 0x04] +
+                  list(range(0xC0, 0x100))],
+                 0, "NOP", 8)
+    def ed_nop(instruction):
+        def ed_nop(registers, bus, n):
+            pass
+        return ed_nop
 
     @instruction([(0x76, ())], 0, "HALT", 4)
-    def halt(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def halt(instruction):
+        def halt(registers, bus, n):
             registers.HALT = True
             registers.PC = dec16(registers.PC)
-            return []
+        return halt
 
 
     @instruction([(0xF3, ())], 0, "DI", 4)
-    def di(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def di(instruction):
+        def di(registers, bus, n):
             registers.IFF = False
             registers.IFF2 = False
-            return []
+            registers.EI_DELAY = False
+        return di
 
     @instruction([(0xFB, ())], 0, "EI", 4)
-    def ei(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def ei(instruction):
+        def ei(registers, bus, n):
             registers.IFF = True
             registers.IFF2 = True
-            return []
-
-    @instruction([(0xED46, (0,)), (0xED56, (1,)), (0xED5E, (2,))], 0, "IM {}", 8)
-    def im(instruction, registers, get_reads, data, mode):
-        if get_reads:
-            return []
-        else:
+            registers.EI_DELAY = True
+        return ei
+
+    @instruction([(0xED46, (0,)), (0xED56, (1,)), (0xED5E, (2,)),
+                  # undocumented
+                  (0xED4E, (0,)), (0xED66, (0,)), (0xED6E, (0,)), (0xED76, (1,)), (0xED7E, (2,))],
+                 0, "IM {}", 8)
+    def im(instruction, mode):
+        def im(registers, bus, n):
             registers.IM = mode
-            return []        
+        return im
 
 
     #--------------------------------------------------------------------
     # 16-Bit Arithmetic Group
     #--------------------------------------------------------------------
     @instruction([(0x39, ("SP",)), (0x09, ("BC",)), (0x19, ("DE",)),(0x29, ("HL",))], 0, "ADD HL, {0}", 11)
-    def add16_hl(instruction, registers, get_reads, data, reg):
-        if get_reads:
-            return []
-        else:
-            val = registers.HL + getattr(registers, reg)
+    def add16_hl(instruction, reg):
+        get = reader(reg)
+        def add16_hl(registers, bus, n):
+            hl = registers.H << 8 | registers.L
+            v = get(registers)
+            val = hl + v
             dummy_reg = registers.create()
-            add8(registers.HL & 0xFF, getattr(registers, reg) & 0xFF, dummy_reg, PV=True)
+            add8(hl & 0xFF, v & 0xFF, dummy_reg, PV=True)
             registers.condition.H = dummy_reg.condition.C
-            add8(registers.HL >> 8, getattr(registers, reg) >> 8, dummy_reg, PV=True)
+            add8(hl >> 8, v >> 8, dummy_reg, PV=True)
             registers.condition.F3 = dummy_reg.condition.F3
             registers.condition.F5 = dummy_reg.condition.F5
             registers.condition.N = 0
             registers.condition.C = ((val & 0x10000) != 0)
-            registers.HL = val & 0xFFFF
-            return []
+            registers.H = (val >> 8) & 0xFF
+            registers.L = val & 0xFF
+        return add16_hl
 
     @instruction([(0xED7A, ("SP",)), (0xED4A, ("BC",)), (0xED5A, ("DE",)),(0xED6A, ("HL",))], 0, "ADC HL, {0}", 15)
-    def adc16_hl(instruction, registers, get_reads, data, reg):
-        if get_reads:
-            return []
-        else:
-            registers.HL = add16(registers.HL + registers.condition.C, getattr(registers, reg), registers)
-
-            return []
+    def adc16_hl(instruction, reg):
+        get = reader(reg)
+        def adc16_hl(registers, bus, n):
+            registers.HL = add16(registers.HL + registers.condition.C, get(registers), registers)
+        return adc16_hl
         
     @instruction([(0xED72, ("SP",)), (0xED42, ("BC",)), (0xED52, ("DE",)),(0xED62, ("HL",))], 0, "SBC HL, {0}", 15)
-    def sbc16_hl(instruction, registers, get_reads, data, reg):
-        if get_reads:
-            return []
-        else:
-            a = registers.HL
-            b = registers[reg]
+    def sbc16_hl(instruction, reg):
+        get = reader(reg)
+        def sbc16_hl(registers, bus, n):
+            a = registers.H << 8 | registers.L
+            b = get(registers)
             res = a - b
             if registers.condition.C:
                 res -= 1
@@ -1390,79 +1457,74 @@ class InstructionSet():
                 registers.condition.H = 1
             else:
                 registers.condition.H = 0
-            
+
             pvtest = get_16bit_twos_comp(a) -  get_16bit_twos_comp(b) -  registers.condition.C
             if pvtest < -32768 or pvtest > 32767:
                 registers.condition.PV = 1 # overflow
             else:
                 registers.condition.PV = 0
-        
-            registers.condition.C = ((res & 0x10000) != 0)
-            registers.HL = res &  0xFFFF
 
-            return []
+            registers.condition.C = ((res & 0x10000) != 0)
+            registers.H = (res >> 8) & 0xFF
+            registers.L = res & 0xFF
+        return sbc16_hl
 
     @instruction([(0xDD39, ("IX", "SP",)), (0xDD09, ("IX", "BC",)), (0xDD19, ("IX", "DE",)),(0xDD29, ("IX", "IX",)),
                   (0xFD39, ("IY", "SP",)), (0xFD09, ("IY", "BC",)), (0xFD19, ("IY", "DE",)),(0xFD29, ("IY", "IY",))],
                  0, "ADD {0}, {1}", 15)
-    def add16_i_pp(instruction, registers, get_reads, data, i, r):
-        if get_reads:
-            return []
-        else:
-            val = registers[i] + registers[r]
-            if ((registers[i] & 0xFFF) + (registers[r] & 0xFFF)) > 0xFFF :
+    def add16_i_pp(instruction, i, r):
+        get, put, other = reader(i), writer(i), reader(r)
+        def add16_i_pp(registers, bus, n):
+            a = get(registers)
+            b = other(registers)
+            val = a + b
+            if ((a & 0xFFF) + (b & 0xFFF)) > 0xFFF :
                 registers.condition.H = 1
             else:
                 registers.condition.H = 0
             registers.condition.N = 0
             registers.condition.C = ((val & 0x10000) != 0)
-            set_f5_f3(registers, (registers[i] >>8)+(registers[r]>>8))
-            registers[i] = val & 0xFFFF
-            return []
+            set_f5_f3(registers, (a >> 8) + (b >> 8))
+            put(registers, val & 0xFFFF)
+        return add16_i_pp
 
 
     @instruction([(0x33, ("SP",)), (0x03, ("BC",)), (0x13, ("DE",)),(0x23, ("HL",)),
                   (0xDD23, ("IX",), 10), (0xFD23, ("IY",), 10)],
                  0, "INC {0}", 6)
-    def inc16_ss(instruction, registers, get_reads, data, s):
-        if get_reads:
-            return []
-        else:
-            registers[s] = inc16(registers[s])
-            return []
+    def inc16_ss(instruction, s):
+        get, put = reader(s), writer(s)
+        def inc16_ss(registers, bus, n):
+            put(registers, (get(registers) + 1) & 0xFFFF)
+        return inc16_ss
         
 
     @instruction([(0x3b, ("SP",)), (0x0b, ("BC",)), (0x1b, ("DE",)),(0x2b, ("HL",)),
                   (0xDD2b, ("IX",), 10), (0xFD2b, ("IY",), 10)],
                  0, "DEC {0}", 6)
-    def dec16_ss(instruction, registers, get_reads, data, s):
-        if get_reads:
-            return []
-        else:
-            registers[s] = dec16(registers[s])
-            return []
+    def dec16_ss(instruction, s):
+        get, put = reader(s), writer(s)
+        def dec16_ss(registers, bus, n):
+            put(registers, (get(registers) - 1) & 0xFFFF)
+        return dec16_ss
 
     #--------------------------------------------------------------------
     # Rotate and Shift Group
     #--------------------------------------------------------------------
     @instruction([(0x07, ())], 0, "RLCA", 4)
-    def rlca(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def rlca(instruction):
+        def rlca(registers, bus, n):
             c = registers.A >> 7
             registers.A = ((registers.A << 1) | c) & 0xFF
             registers.condition.C = c
             registers.condition.H = 0
             registers.condition.N = 0
             set_f5_f3_from_a(registers)
-            return []
+        return rlca
 
     @instruction([(0x17, ())], 0, "RLA", 4)
-    def rla(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def rla(instruction):
+        def rla(registers, bus, n):
             c = registers.A >> 7
             pc = registers.condition.C
             registers.A = (registers.A << 1 | pc) & 0xFF
@@ -1470,26 +1532,22 @@ class InstructionSet():
             registers.condition.H = 0
             registers.condition.N = 0
             set_f5_f3_from_a(registers)
-            return []
+        return rla
 
     @instruction([(0x0F, ())], 0, "RRCA", 4)
-    def rrca(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def rrca(instruction):
+        def rrca(registers, bus, n):
             c = registers.A & 0x01
             registers.A = (registers.A >> 1 | c << 7) & 0xFF
             registers.condition.C = c
             registers.condition.H = 0
             registers.condition.N = 0
             set_f5_f3_from_a(registers)
-            return []
+        return rrca
 
     @instruction([(0x1F, ())], 0, "RRA", 4)
-    def rra(instruction, registers, get_reads, data):
-        if get_reads:
-            return []
-        else:
+    def rra(instruction):
+        def rra(registers, bus, n):
             c = registers.A & 0x01
             pc = registers.condition.C
             registers.A = (registers.A >> 1 | pc << 7) & 0xFF
@@ -1497,76 +1555,72 @@ class InstructionSet():
             registers.condition.H = 0
             registers.condition.N = 0
             set_f5_f3_from_a(registers)
-            return []
+        return rra
         
 
     # RLC m    
     @instruction([(0xCB07, ("A", )), (0xCB00, ("B", )), (0xCB01, ("C", )), (0xCB02, ("D", )),
                   (0xCB03, ("E", )), (0xCB04, ("H", )), (0xCB05, ("L", ))],
                  0, "RLC {0}", 8)
-    def rlc(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = rotate_left_carry(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def rlc(instruction, r):
+        get, put = reader(r), writer(r)
+        def rlc(registers, bus, n):
+            val = shift(registers, RLC, get(registers))
+            put(registers, val)
+        return rlc
         
     @instruction([(0xCB06, ( ))],
                  0, "RLC (HL)", 15)
-    def rlc_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = rotate_left_carry(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def rlc_hl_(instruction):
+        def rlc_hl_(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, RLC, bus.read8(address))
+            bus.write8(address, val)
+        return rlc_hl_
 
         
     @instruction([([0xDD, 0xCB, '-', 0x06], ("IX", )),
                   ([0xFD, 0xCB, '-', 0x06], ("IY", ))],
                  2, "RLC ({0}+{1:X}H)", 23)
-    def rlc_i_d(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            new = rotate_left_carry(registers, data[0])
-            set_f5_f3(registers, new)
-            return [(registers[i] + get_8bit_twos_comp(d), new)]
+    def rlc_i_d(instruction, i):
+        index = reader(i)
+        def rlc_i_d(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, RLC, bus.read8(address))
+            bus.write8(address, val)
+        return rlc_i_d
         
     # RL m
     @instruction([([0xCB, 0x10], ("B", )), ([0xCB, 0x11], ("C", )), ([0xCB, 0x12], ("D", )),
                   ([0xCB, 0x13], ("E", )), ([0xCB, 0x14], ("H", )), ([0xCB, 0x15], ("L", )),
                   ([0xCB, 0x17], ("A", ))],
                  2, "RL {0}", 8)
-    def rl_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = rotate_left(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def rl_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def rl_r(registers, bus, n):
+            val = shift(registers, RL, get(registers))
+            put(registers, val)
+        return rl_r
         
     @instruction([([0xCB, 0x16], ())],
                  2, "RL (HL)", 15)
-    def rl_hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = rotate_left(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def rl_hl(instruction):
+        def rl_hl(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, RL, bus.read8(address))
+            bus.write8(address, val)
+        return rl_hl
         
     @instruction([([0xDD, 0xCB, "-", 0x16], ("IX", )),
                   ([0xFD, 0xCB, "-", 0x16], ("IY", ))],
                  2, "RL ({0}+{1:X}H)", 23)
-    def rl_i(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            val = rotate_left(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers[i] + get_8bit_twos_comp(d), val)]
+    def rl_i(instruction, i):
+        index = reader(i)
+        def rl_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, RL, bus.read8(address))
+            bus.write8(address, val)
+        return rl_i
         
         
 
@@ -1577,69 +1631,65 @@ class InstructionSet():
     @instruction([(0xCB0F, ("A", )), (0xCB08, ("B", )), (0xCB09, ("C", )), (0xCB0A, ("D", )),
                   (0xCB0B, ("E", )), (0xCB0C, ("H", )), (0xCB0D, ("L", ))],
                  0, "RRC {0}", 8)
-    def rrc(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = rotate_right_carry(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def rrc(instruction, r):
+        get, put = reader(r), writer(r)
+        def rrc(registers, bus, n):
+            val = shift(registers, RRC, get(registers))
+            put(registers, val)
+        return rrc
         
     @instruction([(0xCB0E, ( ))],
                  0, "RRC (HL)", 15)
-    def rrc_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = rotate_right_carry(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def rrc_hl_(instruction):
+        def rrc_hl_(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, RRC, bus.read8(address))
+            bus.write8(address, val)
+        return rrc_hl_
 
         
     @instruction([([0xDD, 0xCB, '-', 0x0E], ("IX", )),
                   ([0xFD, 0xCB, '-', 0x0E], ("IY", ))],
                  2, "RRC ({0}+{1:X}H)", 23)
-    def rrc_i_d(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            new = rotate_right_carry(registers, data[0])
-            set_f5_f3(registers, new)
-            return [(registers[i] + get_8bit_twos_comp(d), new)]
+    def rrc_i_d(instruction, i):
+        index = reader(i)
+        def rrc_i_d(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, RRC, bus.read8(address))
+            bus.write8(address, val)
+        return rrc_i_d
         
     # RR m
     @instruction([([0xCB, 0x18], ("B", )), ([0xCB, 0x19], ("C", )), ([0xCB, 0x1A], ("D", )),
                   ([0xCB, 0x1B], ("E", )), ([0xCB, 0x1C], ("H", )), ([0xCB, 0x1D], ("L", )),
                   ([0xCB, 0x1F], ("A", ))],
                  2, "RR {0}", 8)
-    def rr_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = rotate_right(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def rr_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def rr_r(registers, bus, n):
+            val = shift(registers, RR, get(registers))
+            put(registers, val)
+        return rr_r
         
     @instruction([([0xCB, 0x1E], ())],
                  2, "RR (HL)", 15)
-    def rr_hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = rotate_right(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def rr_hl(instruction):
+        def rr_hl(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, RR, bus.read8(address))
+            bus.write8(address, val)
+        return rr_hl
         
     @instruction([([0xDD, 0xCB, "-", 0x1E], ("IX", )),
                   ([0xFD, 0xCB, "-", 0x1E], ("IY", ))],
                  2, "RR ({0}+{1:X}H)", 23)
-    def rr_i(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            val = rotate_right(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers[i] + get_8bit_twos_comp(d), val)]
+    def rr_i(instruction, i):
+        index = reader(i)
+        def rr_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, RR, bus.read8(address))
+            bus.write8(address, val)
+        return rr_i
         
         
 
@@ -1650,70 +1700,66 @@ class InstructionSet():
     @instruction([(0xCB27, ("A", )), (0xCB20, ("B", )), (0xCB21, ("C", )), (0xCB22, ("D", )),
                   (0xCB23, ("E", )), (0xCB24, ("H", )), (0xCB25, ("L", ))],
                  0, "SLA {0}", 8)
-    def sla_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = shift_left(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def sla_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def sla_r(registers, bus, n):
+            val = shift(registers, SLA, get(registers))
+            put(registers, val)
+        return sla_r
         
     @instruction([(0xCB26, ( ))],
                  0, "SLA (HL)", 15)
-    def sla_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = shift_left(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def sla_hl_(instruction):
+        def sla_hl_(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, SLA, bus.read8(address))
+            bus.write8(address, val)
+        return sla_hl_
 
         
     @instruction([([0xDD, 0xCB, '-', 0x26], ("IX", )),
                   ([0xFD, 0xCB, '-', 0x26], ("IY", ))],
                  2, "SLA ({0}+{1:X}H)", 23)
-    def sla_i_d(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            new = shift_left(registers, data[0])
-            set_f5_f3(registers, new)
-            return [(registers[i] + get_8bit_twos_comp(d), new)]
+    def sla_i_d(instruction, i):
+        index = reader(i)
+        def sla_i_d(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, SLA, bus.read8(address))
+            bus.write8(address, val)
+        return sla_i_d
 
 
     # SLL m    
     @instruction([(0xCB37, ("A", )), (0xCB30, ("B", )), (0xCB31, ("C", )), (0xCB32, ("D", )),
                   (0xCB33, ("E", )), (0xCB34, ("H", )), (0xCB35, ("L", ))],
                  0, "SLL {0}", 8)
-    def sll_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = shift_left_logical(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def sll_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def sll_r(registers, bus, n):
+            val = shift(registers, SLL, get(registers))
+            put(registers, val)
+        return sll_r
         
     @instruction([(0xCB36, ( ))],
                  0, "SLL (HL)", 15)
-    def sll_hl_(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = shift_left_logical(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def sll_hl_(instruction):
+        def sll_hl_(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, SLL, bus.read8(address))
+            bus.write8(address, val)
+        return sll_hl_
 
         
     @instruction([([0xDD, 0xCB, '-', 0x36], ("IX", )),
                   ([0xFD, 0xCB, '-', 0x36], ("IY", ))],
                  2, "SLL ({0}+{1:X}H)", 23)
-    def sll_i_d(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            new = shift_left_logical(registers, data[0])
-            set_f5_f3(registers, new)
-            return [(registers[i] + get_8bit_twos_comp(d), new)]
+    def sll_i_d(instruction, i):
+        index = reader(i)
+        def sll_i_d(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, SLL, bus.read8(address))
+            bus.write8(address, val)
+        return sll_i_d
 
 
     # SRA m
@@ -1721,34 +1767,32 @@ class InstructionSet():
                   ([0xCB, 0x2B], ("E", )), ([0xCB, 0x2C], ("H", )), ([0xCB, 0x2D], ("L", )),
                   ([0xCB, 0x2F], ("A", ))],
                  2, "SRA {0}", 8)
-    def sra_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = shift_right(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def sra_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def sra_r(registers, bus, n):
+            val = shift(registers, SRA, get(registers))
+            put(registers, val)
+        return sra_r
         
     @instruction([([0xCB, 0x2E], ())],
                  2, "SRA (HL)", 15)
-    def sra_hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = shift_right(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def sra_hl(instruction):
+        def sra_hl(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, SRA, bus.read8(address))
+            bus.write8(address, val)
+        return sra_hl
         
     @instruction([([0xDD, 0xCB, "-", 0x2E], ("IX", )),
                   ([0xFD, 0xCB, "-", 0x2E], ("IY", ))],
                  2, "SRA ({0}+{1:X}H)", 23)
-    def sra_i(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            val = shift_right(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers[i] + get_8bit_twos_comp(d), val)]
+    def sra_i(instruction, i):
+        index = reader(i)
+        def sra_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, SRA, bus.read8(address))
+            bus.write8(address, val)
+        return sra_i
         
 
     # SRL m
@@ -1756,69 +1800,87 @@ class InstructionSet():
                   ([0xCB, 0x3B], ("E", )), ([0xCB, 0x3C], ("H", )), ([0xCB, 0x3D], ("L", )),
                   ([0xCB, 0x3F], ("A", ))],
                  2, "SRL {0}", 8)
-    def srl_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers[r] = shift_right_logical(registers, registers[r])
-            set_f5_f3(registers, registers[r])
-            return []
+    def srl_r(instruction, r):
+        get, put = reader(r), writer(r)
+        def srl_r(registers, bus, n):
+            val = shift(registers, SRL, get(registers))
+            put(registers, val)
+        return srl_r
         
     @instruction([([0xCB, 0x3E], ())],
                  2, "SRL (HL)", 15)
-    def srl_hl(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = shift_right_logical(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers.HL, val)]
+    def srl_hl(instruction):
+        def srl_hl(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            val = shift(registers, SRL, bus.read8(address))
+            bus.write8(address, val)
+        return srl_hl
         
     @instruction([([0xDD, 0xCB, "-", 0x3E], ("IX", )),
                   ([0xFD, 0xCB, "-", 0x3E], ("IY", ))],
                  2, "SRL ({0}+{1:X}H)", 23)
-    def srl_i(instruction, registers, get_reads, data, i, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            val = shift_right_logical(registers, data[0])
-            set_f5_f3(registers, val)
-            return [(registers[i] + get_8bit_twos_comp(d), val)]
+    def srl_i(instruction, i):
+        index = reader(i)
+        def srl_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, SRL, bus.read8(address))
+            bus.write8(address, val)
+        return srl_i
+
+    # Undocumented: DD CB d 00 to 3F not ending in 6 shift (IX+d) and copy
+    # the result into a register as well
+    @instruction([([I, 0xCB, '-', (op << 3) + register_bits[reg]], (Ir, name, reg))
+                  for op, name in enumerate(["RLC", "RRC", "RL", "RR", "SLA", "SRA", "SLL", "SRL"])
+                  for reg in ['A', 'B', 'C', 'D', 'E', 'H', 'L']
+                  for I, Ir in index_bytes],
+                 2, "{1} ({0}+{3:X}H), {2}", 23)
+    def shift_i_r(instruction, i, name, reg):
+        index, put = reader(i), writer(reg)
+        op = {"RLC": RLC, "RRC": RRC, "RL": RL, "RR": RR,
+              "SLA": SLA, "SRA": SRA, "SLL": SLL, "SRL": SRL}[name]
+        def shift_i_r(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = shift(registers, op, bus.read8(address))
+            bus.write8(address, val)
+            put(registers, val)
+        return shift_i_r
 
         
     @instruction([([0xED, 0x6F], ())],
                  2, "RLD", 18)
-    def rld(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            a = (data[0] >> 4) | (registers.A & 0xF0)
-            hl = ((data[0] << 4) | (registers.A & 0x0f)) & 0xFF
+    def rld(instruction):
+        def rld(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            v = bus.read8(address)
+            a = (v >> 4) | (registers.A & 0xF0)
+            hl = ((v << 4) | (registers.A & 0x0f)) & 0xFF
             registers.A = a
             registers.condition.S = a >> 7
             registers.condition.Z = a == 0
             registers.condition.H = 0
             registers.condition.N = 0
             registers.condition.PV = parity(a)
-            set_f5_f3(registers, registers.A)
-            return [(registers.HL, hl)]
+            set_f5_f3(registers, a)
+            bus.write8(address, hl)
+        return rld
         
     @instruction([([0xED, 0x67], ())],
                  2, "RRD", 18)
-    def rrd(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            a = (data[0] & 0x0F) | (registers.A & 0xF0)
-            hl = ((data[0] >> 4) | (registers.A << 4))  & 0xFF
+    def rrd(instruction):
+        def rrd(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            v = bus.read8(address)
+            a = (v & 0x0F) | (registers.A & 0xF0)
+            hl = ((v >> 4) | (registers.A << 4))  & 0xFF
             registers.A = a
             registers.condition.S = a >> 7
             registers.condition.Z = a == 0
             registers.condition.H = 0
             registers.condition.N = 0
             registers.condition.PV = parity(a)
-            set_f5_f3(registers, registers.A)
-            return [(registers.HL, hl)]
+            set_f5_f3(registers, a)
+            bus.write8(address, hl)
+        return rrd
 
 
 
@@ -1830,116 +1892,131 @@ class InstructionSet():
                    for b in range(8)
                    for reg in ['A', 'B', 'C', 'D', 'E', 'H', 'L'] ] ,
                  2, "BIT {0}, {1}", 8)
-    def bit_r(instruction, registers, get_reads, data, bit, reg):
-        if get_reads:
-            return []
-        else:
-            # print "Test bit ", bit
-            val = registers[reg] & (0x01 << bit)
-            registers.condition.Z = (val == 0)
-            registers.condition.H = 1
-            registers.condition.N = 0
-            registers.condition.PV = registers.condition.Z            
-            registers.condition.S = (val >> 7)
-            #if bit == 5:
-                #registers.condition.F5 = (registers[reg] & (0x01 << bit))
-            #if bit == 3:
-                #registers.condition.F3 = (registers[reg] & (0x01 << bit))
-            set_f5_f3(registers, registers[reg])
-            return []
+    def bit_r(instruction, bit, reg):
+        get = reader(reg)
+        flags = BIT_F[bit << 8:(bit + 1) << 8]
+        def bit_r(registers, bus, n):
+            registers.F = registers.F & 0x01 | flags[get(registers)]
+        return bit_r
 
     @instruction( [ ([0xCB, 0x40 + (b << 3) + 6], (b,)) for b in range(8) ] ,
                  2, "BIT {0}, (HL)", 12)
-    def bit_hl(instruction, registers, get_reads, data, bit):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = data[0] & (0x01 << bit)
-            registers.condition.Z = (val == 0)
-            registers.condition.H = 1
-            registers.condition.N = 0
-            registers.condition.PV = registers.condition.Z
-            registers.condition.S = (val >> 7)
-            set_f5_f3(registers, data[0])
-            return []
-
-    @instruction( [ ([I, 0xCB, '-', 0x40 + (b << 3) + 6], (Ir, b,)) for b in range(8) for I, Ir in index_bytes] ,
+    def bit_hl(instruction, bit):
+        flags = BIT_F[bit << 8:(bit + 1) << 8]
+        def bit_hl(registers, bus, n):
+            v = bus.read8(registers.H << 8 | registers.L)
+            registers.F = registers.F & 0x01 | flags[v]
+        return bit_hl
+
+    # DD CB d 40 to 7F all test the bit, those not ending in 6 undocumented
+    @instruction( [ ([I, 0xCB, '-', 0x40 + (b << 3) + r], (Ir, b,))
+                    for b in range(8) for r in range(8) for I, Ir in index_bytes] ,
                  2, "BIT {1}, ({0}+{2:X}H)", 20)
-    def bit_i(instruction, registers, get_reads, data, i, bit, d):
-        if get_reads:
-            return [registers[i]+get_8bit_twos_comp(d)]
-        else:
-            val = data[0] & (0x01 << bit)
-            registers.condition.Z = (val == 0)
-            registers.condition.H = 1
-            registers.condition.N = 0
-            registers.condition.PV = registers.condition.Z
-            registers.condition.S = (val >> 7)
-            set_f5_f3(registers, (registers[i]+get_8bit_twos_comp(d)) >> 8)
-            return []
+    def bit_i(instruction, i, bit):
+        index = reader(i)
+        flags = BIT_F[bit << 8:(bit + 1) << 8]
+        def bit_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            v = bus.read8(address)
+            # F5 and F3 from the high byte of the address
+            registers.F = registers.F & 0x01 | flags[v] & 0xD7 | (address >> 8) & 0x28
+        return bit_i
 
     @instruction([ ([0xCB, 0xc0 + (b << 3) + register_bits[reg]], (b, reg))
                    for b in range(8)
                    for reg in ['A', 'B', 'C', 'D', 'E', 'H', 'L'] ] ,
                  2, "SET {0}, {1}", 8)
-    def set_r(instruction, registers, get_reads, data, bit, reg):
-        if get_reads:
-            return []
-        else:
-            registers[reg] |= (0x01 << bit)
-            return []
+    def set_r(instruction, bit, reg):
+        get, put = reader(reg), writer(reg)
+        mask = 0x01 << bit
+        def set_r(registers, bus, n):
+            put(registers, get(registers) | mask)
+        return set_r
 
     @instruction( [ ([0xCB, 0xc0 + (b << 3) + 6], (b,)) for b in range(8) ] ,
                  2, "SET {0}, (HL)", 15)
-    def set_hl(instruction, registers, get_reads, data, bit):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = data[0] | (0x01 << bit)
-            return [(registers.HL, val)]
+    def set_hl(instruction, bit):
+        mask = 0x01 << bit
+        def set_hl(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            bus.write8(address, bus.read8(address) | mask)
+        return set_hl
 
     @instruction( [ ([I, 0xCB, '-', 0xc0 + (b << 3) + 6], (Ir, b,))
                     for b in range(8)
                     for I, Ir in index_bytes] ,
                  2, "SET {1}, ({0}+{2:X}H)", 23)
-    def set_i(instruction, registers, get_reads, data, i, bit, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            val = data[0] | (0x01 << bit)
-            return [(registers[i] + get_8bit_twos_comp(d), val)]
+    def set_i(instruction, i, bit):
+        index = reader(i)
+        mask = 0x01 << bit
+        def set_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            bus.write8(address, bus.read8(address) | mask)
+        return set_i
 
     @instruction([ ([0xCB, 0x80 + (b << 3) + register_bits[reg]], (b, reg))
                    for b in range(8)
                    for reg in ['A', 'B', 'C', 'D', 'E', 'H', 'L'] ] ,
                  2, "RES {0}, {1}", 8)
-    def res_r(instruction, registers, get_reads, data, bit, reg):
-        if get_reads:
-            return []
-        else:
-            registers[reg] &= ~(0x01 << bit)
-            return []
+    def res_r(instruction, bit, reg):
+        get, put = reader(reg), writer(reg)
+        mask = 0xFF ^ (0x01 << bit)
+        def res_r(registers, bus, n):
+            put(registers, get(registers) & mask)
+        return res_r
 
     @instruction( [ ([0xCB, 0x80 + (b << 3) + 6], (b,))
                     for b in range(8) ] ,
                  2, "RES {0}, (HL)", 15)
-    def res_hl(instruction, registers, get_reads, data, bit):
-        if get_reads:
-            return [registers.HL]
-        else:
-            val = data[0] & ~(0x01 << bit)
-            return [(registers.HL, val)]
+    def res_hl(instruction, bit):
+        mask = 0xFF ^ (0x01 << bit)
+        def res_hl(registers, bus, n):
+            address = registers.H << 8 | registers.L
+            bus.write8(address, bus.read8(address) & mask)
+        return res_hl
 
     @instruction( [ ([I, 0xCB, '-', 0x80 + (b << 3) + 6], (Ir, b,))
                     for b in range(8)
                     for I, Ir in index_bytes] ,
                  2, "RES {1}, ({0}+{2:X}H)", 23)
-    def res_i(instruction, registers, get_reads, data, i, bit, d):
-        if get_reads:
-            return [registers[i] + get_8bit_twos_comp(d)]
-        else:
-            val = data[0] & ~(0x01 << bit)
-            return [(registers[i] + get_8bit_twos_comp(d), val)]
+    def res_i(instruction, i, bit):
+        index = reader(i)
+        mask = 0xFF ^ (0x01 << bit)
+        def res_i(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            bus.write8(address, bus.read8(address) & mask)
+        return res_i
+
+    # Undocumented: RES and SET on (IX+d) copying the result into a register
+    @instruction( [ ([I, 0xCB, '-', 0x80 + (b << 3) + register_bits[reg]], (Ir, b, reg))
+                    for b in range(8)
+                    for reg in ['A', 'B', 'C', 'D', 'E', 'H', 'L']
+                    for I, Ir in index_bytes] ,
+                 2, "RES {1}, ({0}+{3:X}H), {2}", 23)
+    def res_i_r(instruction, i, bit, reg):
+        index, put = reader(i), writer(reg)
+        mask = 0xFF ^ (0x01 << bit)
+        def res_i_r(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = bus.read8(address) & mask
+            bus.write8(address, val)
+            put(registers, val)
+        return res_i_r
+
+    @instruction( [ ([I, 0xCB, '-', 0xc0 + (b << 3) + register_bits[reg]], (Ir, b, reg))
+                    for b in range(8)
+                    for reg in ['A', 'B', 'C', 'D', 'E', 'H', 'L']
+                    for I, Ir in index_bytes] ,
+                 2, "SET {1}, ({0}+{3:X}H), {2}", 23)
+    def set_i_r(instruction, i, bit, reg):
+        index, put = reader(i), writer(reg)
+        mask = 0x01 << bit
+        def set_i_r(registers, bus, d):
+            address = (index(registers) + get_8bit_twos_comp(d)) & 0xFFFF
+            val = bus.read8(address) | mask
+            bus.write8(address, val)
+            put(registers, val)
+        return set_i_r
 
 
 
@@ -1948,405 +2025,405 @@ class InstructionSet():
     #--------------------------------------------------------------------
     @instruction([([0xC3, '-', '-'], ())],
                  2, "JP {1:X}{0:X}H", 10)
-    def jp(instruction, registers, get_reads, data, n, n2):
-        if get_reads:
-            return []
-        else:
-            registers.PC = n2 << 8 | n
-            return []
+    def jp(instruction):
+        def jp(registers, bus, nn):
+            registers.PC = nn
+        return jp
         
 
     @instruction([([0xC2+offset, '-', '-'], (reg, reg_name, val))
                   for offset, reg_name, reg, val in conditions],
                  2, "JP {1}, {4:x}{3:X}H", 10)
-    def jp_c(instruction, registers, get_reads, data, reg, reg_name, val, n, n2):
-        if get_reads:
-            return []
-        else:
-            if getattr(registers.condition, reg) == val:
-                registers.PC = n2 << 8 | n
-            return []
+    def jp_c(instruction, reg, reg_name, val):
+        mask = 1 << flag_bits[reg]
+        want = mask if val else 0
+        def jp_c(registers, bus, nn):
+            if registers.F & mask == want:
+                registers.PC = nn
+        return jp_c
               
 
     
     @instruction([([0x18, '-'], ())],
                  2, "JR {0:X}H", 12)
-    def jr(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
+    def jr(instruction):
+        def jr(registers, bus, n):
             offset_pc(registers, n)
-            return []
+        return jr
     
     @instruction([([0x20, '-'], ())],
-                 2, "JR NZ, {0:X}H", 12)
-    def jr_nz(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            if not registers.condition.Z:
+                 2, "JR NZ, {0:X}H", 12, 7)
+    def jr_nz(instruction):
+        skipped = instruction.skipped
+        def jr_nz(registers, bus, n):
+            if not registers.F & 0x40:
                 offset_pc(registers, n)
-                instruction.tstates = 12
             else:
-                instruction.tstates = 7
-            return []
+                return skipped
+        return jr_nz
         
          
     @instruction([([0x28, '-'], ())],
-                 2, "JR Z, {0:X}H", 12)
-    def jr_z(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            if registers.condition.Z:
+                 2, "JR Z, {0:X}H", 12, 7)
+    def jr_z(instruction):
+        skipped = instruction.skipped
+        def jr_z(registers, bus, n):
+            if registers.F & 0x40:
                 offset_pc(registers, n)
-                instruction.tstates = 12
             else:
-                instruction.tstates = 7
-            return []
+                return skipped
+        return jr_z
         
          
     @instruction([([0x30, '-'], ())],
-                 2, "JR NC, {0:X}H", 12)
-    def jr_nc(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            if not registers.condition.C:
+                 2, "JR NC, {0:X}H", 12, 7)
+    def jr_nc(instruction):
+        skipped = instruction.skipped
+        def jr_nc(registers, bus, n):
+            if not registers.F & 0x01:
                 offset_pc(registers, n)
-                instruction.tstates = 12
             else:
-                instruction.tstates = 7
-            return []
+                return skipped
+        return jr_nc
         
          
     @instruction([([0x38, '-'], ())],
-                 2, "JR C, {0:X}H", 12)
-    def jr_c(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            if registers.condition.C:
+                 2, "JR C, {0:X}H", 12, 7)
+    def jr_c(instruction):
+        skipped = instruction.skipped
+        def jr_c(registers, bus, n):
+            if registers.F & 0x01:
                 offset_pc(registers, n)
-                instruction.tstates = 12
             else:
-                instruction.tstates = 7
-            return []
+                return skipped
+        return jr_c
         
     @instruction([([0xE9], ("HL", )),([0xDD, 0xE9], ("IX", ), 8),([0xFD, 0xE9], ("IY", ), 8) ],
                  2, "JP ({})", 4)
-    def jp_r(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
-        else:
-            registers.PC = registers[r]
-            return []
+    def jp_r(instruction, r):
+        get = reader(r)
+        def jp_r(registers, bus, n):
+            registers.PC = get(registers)
+        return jp_r
         
     @instruction([([0x10, '-'], ())],
-                 2, "DJNZ {0:X}H", 13)
-    def djnz(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            registers.B = dec8(registers.B)
-            if not registers.B == 0:
+                 2, "DJNZ {0:X}H", 13, 8)
+    def djnz(instruction):
+        skipped = instruction.skipped
+        def djnz(registers, bus, n):
+            b = (registers.B - 1) & 0xFF
+            registers.B = b
+            if b:
                 offset_pc(registers, n)
-                instruction.tstates = 13
             else:
-                instruction.tstates = 8
-            return []
+                return skipped
+        return djnz
     
     #--------------------------------------------------------------------
     # Call And Return Group
     #--------------------------------------------------------------------
     @instruction([([0xCD, '-', '-'], ())],
                  2, "CALL {1:X}{0:X}H", 17)
-    def call(instruction, registers, get_reads, data, n, n2):
-        if get_reads:
-            return []
-        else:
-            sp = registers.SP
-            pc = registers.PC
-            registers.SP = dec16(registers.SP)
-            registers.SP = dec16(registers.SP)
-            registers.PC = n2 << 8 | n
-            return [(dec16(sp), pc >> 8),
-                    (dec16(dec16(sp)), pc & 0xFF)]
+    def call(instruction):
+        def call(registers, bus, nn):
+            stack = (registers.SP - 2) & 0xFFFF
+            registers.SP = stack
+            bus.write16(stack, registers.PC)
+            registers.PC = nn
+        return call
         
     @instruction([([0xC4+offset, '-', '-'], (reg, reg_name, val))
                   for offset, reg_name, reg, val in conditions],
-                 2, "CALL {1}, {4:x}{3:X}H", 17)
-    def call_c(instruction, registers, get_reads, data, reg, reg_name, val, n, n2):
-        if get_reads:
-            return []
-        else:
-            if getattr(registers.condition, reg) == val:
-                instruction.tstates = 17
-                sp = registers.SP
-                pc = registers.PC
-                registers.SP = dec16(registers.SP)
-                registers.SP = dec16(registers.SP)
-                registers.PC = n2 << 8 | n
-                return [(dec16(sp), pc >> 8),
-                        (dec16(dec16(sp)), pc & 0xFF)]
+                 2, "CALL {1}, {4:x}{3:X}H", 17, 10)
+    def call_c(instruction, reg, reg_name, val):
+        skipped = instruction.skipped
+        mask = 1 << flag_bits[reg]
+        want = mask if val else 0
+        def call_c(registers, bus, nn):
+            if registers.F & mask == want:
+                stack = (registers.SP - 2) & 0xFFFF
+                registers.SP = stack
+                bus.write16(stack, registers.PC)
+                registers.PC = nn
             else:
-                instruction.tstates = 10
-                return []
+                return skipped
+        return call_c
             
     @instruction([([0xC9], ())],
                  2, "RET", 10)
-    def ret(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.SP, inc16(registers.SP)]
-        else:
-            registers.SP = inc16(registers.SP)
-            registers.SP = inc16(registers.SP)
-            registers.PC = data[1] << 8 | data[0]
-            return []
+    def ret(instruction):
+        def ret(registers, bus, n):
+            stack = registers.SP
+            registers.SP = (stack + 2) & 0xFFFF
+            registers.PC = bus.read16(stack)
+        return ret
         
     @instruction([([0xC0+offset], (reg, reg_name, val))
                   for offset, reg_name, reg, val in conditions],
-                 2, "RET {1}", 11)
-    def ret_c(instruction, registers, get_reads, data, reg, reg_name, val):
-        if get_reads:
-            return [registers.SP, inc16(registers.SP)]
-        else:
-            if getattr(registers.condition, reg) == val:
-                registers.SP = inc16(registers.SP)
-                registers.SP = inc16(registers.SP)
-                registers.PC = data[1] << 8 | data[0]
-                instruction.tstates = 11
+                 2, "RET {1}", 11, 5)
+    def ret_c(instruction, reg, reg_name, val):
+        skipped = instruction.skipped
+        mask = 1 << flag_bits[reg]
+        want = mask if val else 0
+        def ret_c(registers, bus, n):
+            if registers.F & mask == want:
+                stack = registers.SP
+                registers.SP = (stack + 2) & 0xFFFF
+                registers.PC = bus.read16(stack)
             else:
-                instruction.tstates = 5
-            return []
+                return skipped
+        return ret_c
             
     @instruction([([0xed, 0x4d], ())],  2, "RETI", 14)
-    def reti(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.SP, inc16(registers.SP)]
-        else:
-            #TODO: implement return from interrupt
-            logging.warn("RETI not fully implemented")
-            registers.SP = inc16(registers.SP)
-            registers.SP = inc16(registers.SP)
-            registers.PC = data[1] << 8 | data[0]
-            return []
+    def reti(instruction):
+        def reti(registers, bus, n):
+            stack = registers.SP
+            registers.SP = (stack + 2) & 0xFFFF
+            registers.PC = bus.read16(stack)
+            registers.IFF = registers.IFF2
+            bus.reti()
+        return reti
         
-    @instruction([([0xed, 0x45], ())],  2, "RETN", 14)
-    def retn(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.SP, inc16(registers.SP)]
-        else:
-            #TODO: implement from non masked interrupt
-            logging.warn("RETN not fully implemented")
-            registers.SP = inc16(registers.SP)
-            registers.SP = inc16(registers.SP)
-            registers.PC = data[1] << 8 | data[0]
+    # ED 55, 5D, ... 7D are RETN too, undocumented
+    @instruction([([0xed, 0x45 + (i << 3)], ()) for i in range(8) if i != 1],  2, "RETN", 14)
+    def retn(instruction):
+        def retn(registers, bus, n):
+            stack = registers.SP
+            registers.SP = (stack + 2) & 0xFFFF
+            registers.PC = bus.read16(stack)
             registers.IFF = registers.IFF2
-            return []
+        return retn
         
     @instruction([([0xC7 + (t << 3) ], (p, )) for t, p in enumerate([0x0, 0x08, 0x10, 0x18,
                                                                    0x20, 0x28, 0x30, 0x38]) ] ,
                  2, "RST {0:X}H", 11)
-    def rst_p(instruction, registers, get_reads, data, p):
-        if get_reads:
-            return []
-        else:
-            sp = registers.SP
-            pc = registers.PC
-            registers.SP = dec16(registers.SP)
-            registers.SP = dec16(registers.SP)
+    def rst_p(instruction, p):
+        def rst_p(registers, bus, n):
+            stack = (registers.SP - 2) & 0xFFFF
+            registers.SP = stack
+            bus.write16(stack, registers.PC)
             registers.PC = p
-            return [(dec16(sp), pc >> 8),
-                    (dec16(dec16(sp)), pc & 0xFF)]
+        return rst_p
         
     #--------------------------------------------------------------------
     # Input Output Group
     #--------------------------------------------------------------------
     @instruction([([0xDB, '-'], ( )) ] ,
                  2, "IN A, ({0:X}H)", 11)
-    def in_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            address = n | (registers.A << 8) # registers.C | (registers.B << 8)
-            return [address+0x10000]
-        else:
-            registers.A = data[0]
-            return []
+    def in_a_n(instruction):
+        def in_a_n(registers, bus, n):
+            registers.A = bus.in8(n | (registers.A << 8))
+        return in_a_n
         
     @instruction([([0xEd, 0x40+(i<<3)], (r, )) for i, r in enumerate("BCDEHLFA")] ,
                  2, "IN {0}, (C)", 12)
-    def in_r_c(instruction, registers, get_reads, data, r):
-        if get_reads:
-            address = registers.C | (registers.B << 8) #n | (registers.A << 8)
-            return [address+0x10000]
-        else:
-            registers.condition.S = data[0] & 0x80
-            registers.condition.Z = data[0] == 0
+    def in_r_c(instruction, r):
+        if r == "F":
+            put = None
+        else:
+            put = writer(r)
+        def in_r_c(registers, bus, n):
+            v = bus.in8(registers.C | (registers.B << 8))
+            registers.condition.S = v & 0x80
+            registers.condition.Z = v == 0
             registers.condition.H = 0
-            registers.condition.PV = parity(data[0])
+            registers.condition.PV = parity(v)
             registers.condition.N = 0
-            if r == "F":
-                return []
-            registers[r] = data[0]
-            return []
+            if put is not None:
+                put(registers, v)
+        return in_r_c
         
     @instruction([([0xed, 0xa2], ( )) ] ,
                  2, "INI", 16)
-    def ini(instruction, registers, get_reads, data):
-        if get_reads:
-            address = registers.C | (dec8(registers.B) << 8)
-            return [address+0x10000]
-        else:
-            hl = registers.HL
-            registers.B = dec8(registers.B)
-            registers.HL = inc16(hl)
+    def ini(instruction):
+        def ini(registers, bus, n):
+            hl = registers.H << 8 | registers.L
+            b = (registers.B - 1) & 0xFF
+            bus.write8(hl, bus.in8(registers.C | (b << 8)))
+            registers.B = b
+            registers.HL = (hl + 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            return [(hl, data[0])]
+            registers.condition.Z = b == 0
+        return ini
         
         
     @instruction([([0xed, 0xb2], ( )) ] ,
-                 2, "INIR", 21)
-    def inir(instruction, registers, get_reads, data):
-        if get_reads:
-            address = registers.C | (dec8(registers.B) << 8)
-            return [address+0x10000]
-        else:
-            hl = registers.HL
-            registers.B = dec8(registers.B)
-            registers.HL = inc16(hl)
+                 2, "INIR", 21, 16)
+    def inir(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def inir(registers, bus, n):
+            # all but the last time round the budget allows in one transfer
+            more = rounds(registers.B or 0x100, bus.budget, tstates) - 1
+            if more:
+                hl = registers.H << 8 | registers.L
+                bus.in_block(registers.C | registers.B << 8, hl, more, 1)
+                registers.HL = (hl + more) & 0xFFFF
+                registers.B = (registers.B - more) & 0xFF
+                refresh(registers, 2 * more)
+            hl = registers.H << 8 | registers.L
+            b = (registers.B - 1) & 0xFF
+            bus.write8(hl, bus.in8(registers.C | (b << 8)))
+            registers.B = b
+            registers.HL = (hl + 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            if registers.B != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
+            registers.condition.Z = b == 0
+            if b != 0:
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
             else:
-                instruction.tstates = 16
-            return [(hl, data[0])]
+                return tstates * more + skipped
+        return inir
         
     @instruction([([0xed, 0xaa], ( )) ] ,
                  2, "IND", 16)
-    def ind(instruction, registers, get_reads, data):
-        if get_reads:
-            address = registers.C | (dec8(registers.B) << 8)
-            return [address+0x10000]
-        else:
-            hl = registers.HL
-            registers.B = dec8(registers.B)
-            registers.HL = dec16(hl)
+    def ind(instruction):
+        def ind(registers, bus, n):
+            hl = registers.H << 8 | registers.L
+            b = (registers.B - 1) & 0xFF
+            bus.write8(hl, bus.in8(registers.C | (b << 8)))
+            registers.B = b
+            registers.HL = (hl - 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            return [(hl, data[0])]
+            registers.condition.Z = b == 0
+        return ind
         
         
     @instruction([([0xed, 0xba], ( )) ] ,
-                 2, "INDR", 21)
-    def indr(instruction, registers, get_reads, data):
-        if get_reads:
-            address = registers.C | (dec8(registers.B) << 8)
-            return [address+0x10000]
-        else:
-            hl = registers.HL
-            registers.B = dec8(registers.B)
-            registers.HL = dec16(hl)
+                 2, "INDR", 21, 16)
+    def indr(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def indr(registers, bus, n):
+            # all but the last time round the budget allows in one transfer
+            more = rounds(registers.B or 0x100, bus.budget, tstates) - 1
+            if more:
+                hl = registers.H << 8 | registers.L
+                bus.in_block(registers.C | registers.B << 8, hl, more, -1)
+                registers.HL = (hl - more) & 0xFFFF
+                registers.B = (registers.B - more) & 0xFF
+                refresh(registers, 2 * more)
+            hl = registers.H << 8 | registers.L
+            b = (registers.B - 1) & 0xFF
+            bus.write8(hl, bus.in8(registers.C | (b << 8)))
+            registers.B = b
+            registers.HL = (hl - 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            if registers.B != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
+            registers.condition.Z = b == 0
+            if b != 0:
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
             else:
-                instruction.tstates = 16
-            return [(hl, data[0])]
+                return tstates * more + skipped
+        return indr
         
     @instruction([([0xD3, '-'], ( )) ] ,
                  2, "OUT ({0:X}H), A", 11)
-    def out_a_n(instruction, registers, get_reads, data, n):
-        if get_reads:
-            return []
-        else:
-            address = n | (registers.A << 8)
-            #if n == 0x81:
-                ##logging.info("=========================================== %s =="%chr(registers.A))
-                ##print chr(registers.A),
-                #sys.stdout.flush()
-            return [(address+0x10000, registers.A)]
+    def out_a_n(instruction):
+        def out_a_n(registers, bus, n):
+            bus.out8(n | (registers.A << 8), registers.A)
+        return out_a_n
         
-    @instruction([([0xEd, 0x41+(i<<3)], (r, )) for i, r in enumerate("BCDEHLFA")] ,
+    @instruction([([0xEd, 0x41+(i<<3)], (r, )) for i, r in enumerate("BCDEHL0A")] ,
                  2, "OUT (C), {0}", 12)
-    def out_r_c(instruction, registers, get_reads, data, r):
-        if get_reads:
-            return []
+    def out_r_c(instruction, r):
+        if r == "0":
+            # undocumented, ED 71 puts out 0
+            get = lambda registers: 0
         else:
-            if r == "F":
-                return []
-            return [(registers.BC+0x10000, registers[r])]
+            get = reader(r)
+        def out_r_c(registers, bus, n):
+            bus.out8(registers.B << 8 | registers.C, get(registers))
+        return out_r_c
         
     @instruction([([0xed, 0xa3], ( )) ] ,
                  2, "OUTI", 16)
-    def outi(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            address = registers.C | (registers.B << 8)
-            registers.B = dec8(registers.B)
-            registers.HL = inc16(registers.HL)
+    def outi(instruction):
+        def outi(registers, bus, n):
+            hl = registers.H << 8 | registers.L
+            port = registers.C | (registers.B << 8)
+            b = (registers.B - 1) & 0xFF
+            registers.B = b
+            registers.HL = (hl + 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            return [(address+0x10000, data[0])]
+            registers.condition.Z = b == 0
+            bus.out8(port, bus.read8(hl))
+        return outi
         
         
     @instruction([([0xed, 0xb3], ( )) ] ,
-                 2, "OTIR", 21)
-    def otir(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            address = registers.C | (registers.B << 8)
-            registers.B = dec8(registers.B)
-            registers.HL = inc16(registers.HL)
+                 2, "OTIR", 21, 16)
+    def otir(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def otir(registers, bus, n):
+            # all but the last time round the budget allows in one transfer
+            more = rounds(registers.B or 0x100, bus.budget, tstates) - 1
+            if more:
+                hl = registers.H << 8 | registers.L
+                bus.out_block(registers.C | registers.B << 8, hl, more, 1)
+                registers.HL = (hl + more) & 0xFFFF
+                registers.B = (registers.B - more) & 0xFF
+                refresh(registers, 2 * more)
+            hl = registers.H << 8 | registers.L
+            port = registers.C | (registers.B << 8)
+            b = (registers.B - 1) & 0xFF
+            registers.B = b
+            registers.HL = (hl + 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            if registers.B != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
+            registers.condition.Z = b == 0
+            bus.out8(port, bus.read8(hl))
+            if b != 0:
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
             else:
-                instruction.tstates = 16
-                
-            return [(address+0x10000, data[0])]
+                return tstates * more + skipped
+        return otir
         
     @instruction([([0xed, 0xab], ( )) ] ,
                  2, "OUTD", 16)
-    def outd(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            address = registers.C | (registers.B << 8)
-            registers.B = dec8(registers.B)
-            registers.HL = dec16(registers.HL)
+    def outd(instruction):
+        def outd(registers, bus, n):
+            hl = registers.H << 8 | registers.L
+            port = registers.C | (registers.B << 8)
+            b = (registers.B - 1) & 0xFF
+            registers.B = b
+            registers.HL = (hl - 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            return [(address+0x10000, data[0])]
+            registers.condition.Z = b == 0
+            bus.out8(port, bus.read8(hl))
+        return outd
         
         
     @instruction([([0xed, 0xbb], ( )) ] ,
-                 2, "OTDR", 21)
-    def otdr(instruction, registers, get_reads, data):
-        if get_reads:
-            return [registers.HL]
-        else:
-            address = registers.C | (registers.B << 8)
-            registers.B = dec8(registers.B)
-            registers.HL = dec16(registers.HL)
+                 2, "OTDR", 21, 16)
+    def otdr(instruction):
+        skipped = instruction.skipped
+        tstates = instruction.tstates
+        def otdr(registers, bus, n):
+            # all but the last time round the budget allows in one transfer
+            more = rounds(registers.B or 0x100, bus.budget, tstates) - 1
+            if more:
+                hl = registers.H << 8 | registers.L
+                bus.out_block(registers.C | registers.B << 8, hl, more, -1)
+                registers.HL = (hl - more) & 0xFFFF
+                registers.B = (registers.B - more) & 0xFF
+                refresh(registers, 2 * more)
+            hl = registers.H << 8 | registers.L
+            port = registers.C | (registers.B << 8)
+            b = (registers.B - 1) & 0xFF
+            registers.B = b
+            registers.HL = (hl - 1) & 0xFFFF
             registers.condition.N = 1
-            registers.condition.Z = registers.B == 0
-            if registers.B != 0:
-                registers.PC = dec16(registers.PC)
-                registers.PC = dec16(registers.PC)
-                instruction.tstates = 21
+            registers.condition.Z = b == 0
+            bus.out8(port, bus.read8(hl))
+            if b != 0:
+                registers.PC = (registers.PC - 2) & 0xFFFF
+                if more:
+                    return tstates * (more + 1)
             else:
-                instruction.tstates = 16
-                
-            return [(address+0x10000, data[0])]
+                return tstates * more + skipped
+        return otdr
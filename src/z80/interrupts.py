@@ -0,0 +1,173 @@
+""" The INT and NMI lines and the daisy chain of vectored devices
+
+    Taking an interrupt decodes nothing: the controller pushes PC and
+    jumps itself, as the CPU's acknowledge cycle does.
+
+        NMI   calls 0066H whatever IFF is, keeping IFF2 for RETN
+        IM 0  runs the RST the device puts on the data bus, FFH (RST 38H)
+              when none does; other instructions are not understood
+        IM 1  calls 0038H
+        IM 2  calls through the word at I * 256 + the device's vector
+
+    Nothing is taken before the instruction after EI, and a CPU halted
+    at a HALT goes on after it.
+
+        interrupts = Interrupts(registers, bus, instructions.step)
+        pio = interrupts.chain(Vectored(0x10))
+        pio.request()
+        tstates = interrupts.accept()
+"""
+from . import trace
+from . trace import INFO
+
+# T-states taken to acknowledge each, pushing PC included
+NMI_TSTATES = 11
+IM0_TSTATES = 13
+IM1_TSTATES = 13
+IM2_TSTATES = 19
+
+# What the data bus reads when no device drives it
+FLOATING = 0xFF
+
+
+class Vectored(object):
+    """ A device on the daisy chain, PIO, SIO or CTC style.
+
+        request() raises its interrupt, with vector the byte it puts on
+        the bus. From the CPU taking it until the RETI ending its handler
+        it is in service, and it and the devices after it on the chain
+        wait; devices before it can still interrupt the handler. """
+    def __init__(self, vector=FLOATING):
+        self.vector = vector
+        self.requesting = False
+        self.in_service = False
+        self._controller = None
+
+    def request(self, vector=None):
+        if vector is not None:
+            self.vector = vector
+        self.requesting = True
+        if self._controller is not None:
+            self._controller.update()
+
+    def cancel(self):
+        self.requesting = False
+        if self._controller is not None:
+            self._controller.update()
+
+
+class Interrupts(object):
+    """ Takes interrupts for a CPU, from interrupt() (the INT line of a
+        device off the chain, latched until taken), nmi() and the chained
+        devices in priority order.
+
+        pending is true while anything is waiting, whether or not the CPU
+        will take it yet, so a run loop need only call accept() then. """
+    def __init__(self, registers, bus, step):
+        self.registers = registers
+        self._bus = bus
+        self._step = step
+        self._chain = []
+        self._line = False
+        self._nmi = False
+        self.pending = False
+        bus.interrupts = self
+
+    def chain(self, device):
+        """ Put device on the end of the daisy chain, return it """
+        device._controller = self
+        self._chain.append(device)
+        self.update()
+        return device
+
+    def interrupt(self):
+        if trace.interrupts.info:
+            trace.interrupts.emit(INFO, "interrupt")
+        self._line = True
+        self.pending = True
+
+    def nmi(self):
+        if trace.interrupts.info:
+            trace.interrupts.emit(INFO, "NMI")
+        self._nmi = True
+        self.pending = True
+
+    def update(self):
+        self.pending = self._nmi or self._line or self._next() is not None
+
+    def _next(self):
+        """ The chained device to take, None if none or one in service
+            comes first """
+        for device in self._chain:
+            if device.in_service:
+                return None
+            if device.requesting:
+                return device
+        return None
+
+    def reti(self):
+        """ RETI ends the handler of the first device in service """
+        for device in self._chain:
+            if device.in_service:
+                device.in_service = False
+                self.update()
+                return
+
+    def accept(self):
+        """ Take the interrupt the CPU would take now, return the T-states
+            taken. Straight after an EI an INT waits for the instruction
+            after it, which runs first, once round, and stays pending if
+            that was a DI; an NMI never waits. """
+        registers = self.registers
+        if self._nmi:
+            self._nmi = False
+            self.update()
+            registers.IFF = False
+            if trace.interrupts.info:
+                trace.interrupts.emit(INFO, "NMI taken at %04X", registers.PC)
+            return self._call(0x66, NMI_TSTATES)
+        if not registers.IFF:
+            return 0
+        tstates = 0
+        while registers.EI_DELAY:
+            self._bus.budget = 0
+            tstates += self._step(self._bus)
+        # which may have been a DI
+        if not registers.IFF:
+            return tstates
+        if self._line:
+            self._line = False
+            data = FLOATING
+        else:
+            device = self._next()
+            if device is None:
+                return tstates
+            device.requesting = False
+            device.in_service = True
+            data = device.vector
+        self.update()
+        registers.IFF = False
+        registers.IFF2 = False
+        mode = registers.IM
+        if trace.interrupts.info:
+            trace.interrupts.emit(INFO, "IM %d interrupt taken at %04X", mode, registers.PC)
+        if mode == 2:
+            return tstates + self._call(self._bus.read16(registers.I << 8 | data), IM2_TSTATES)
+        if mode == 1:
+            return tstates + self._call(0x38, IM1_TSTATES)
+        return tstates + self._call(data & 0x38, IM0_TSTATES)
+
+    def _call(self, address, tstates):
+        registers = self.registers
+        pc = registers.PC
+        if registers.HALT:
+            # HALT leaves PC on itself, go on after it
+            registers.HALT = False
+            pc = (pc + 1) & 0xFFFF
+        sp = (registers.SP - 2) & 0xFFFF
+        registers.SP = sp
+        self._bus.write16(sp, pc)
+        registers.PC = address
+        r = registers.R
+        registers.R = (r + 1) & 0x7F | r & 0x80
+        return tstates
@@ -1,23 +1,12 @@
+""" Qt front ends for the devices """
 import sys
  
+from . devices import IO, Interruptable, IOMap, Acia
 from PySide2.QtCore import *
 from PySide2.QtGui import *
 from PySide2.QtWidgets import *
-
-class IO(object):
-    _addresses = []
-    def read(self, address):
-        pass
-    def write(self, address, value):
-        pass
-    
-class Interruptable(object):
-    def interrupt(self):
-        print ("interrupt")
-        pass
     
-class Console(QTextEdit, IO):
-    _addresses = [0x80, 0x81]
+class Console(QTextEdit, Acia):
     _wrt_sgnl = Signal(int, int)
     def __init__(self, interruptable):
         #assert isinstance(interruptable, Interruptable )
@@ -27,33 +16,14 @@ class Console(QTextEdit, IO):
         self.setFontPointSize(12)
         self._modifiers = {}
         self.setCursorWidth(0)
-        self._interruptable = interruptable
+        Acia.__init__(self, interruptable)
         self._wrt_sgnl.connect(self._write)
         self.setReadOnly(True)
         self.setGeometry(300, 0, 640, 480)
 
-        
-        self._send_queue = None
-        
-    def read(self, address):
-        print ("READ ", address)
-        if address == 0x80:
-            v =  ((1 << 1) | # RTS
-                  ((self._send_queue is not None) << 0) | # interrupt?
-                  0 )
-            return v
-        elif address == 0x81:
-            if self._send_queue is not None:
-                val = self._send_queue
-                self._send_queue = None
-                return val
-        return 0x13
-    
-    
-    @Slot(int, int)
-    def write(self, address, value):
-        print ("------> WRITE ", address)
-        self._wrt_sgnl.emit(address, value)
+    def transmit(self, value):
+        # the widget is only touched from the Qt thread
+        self._wrt_sgnl.emit(0x81, value)
         
     def _write(self, address, value):
         if address == 0x80:
@@ -86,21 +56,4 @@ class Console(QTextEdit, IO):
                 self._modifiers[event.key()] = False
             #print (key)
             
-            if self._send_queue is None:
-                self._send_queue = key
-                self._interruptable.interrupt()
-            pass
-        
-    
-class IOMap(object):
-    def __init__(self):
-        self.address = {}
-        pass
-    def addDevice(self, dev):
-        assert isinstance(dev, IO)
-        for i in dev._addresses:
-            self.address[i] = dev
-        
-    def interupt(self):
-        pass
-   
+            self.receive(key)
@@ -0,0 +1,560 @@
+""" Many machines running the same code at once, with NumPy
+
+    Lockstep keeps the registers of n machines, lanes, as rows of a
+    NumPy array, one column a lane, and their memory as an n x 64K array.
+    A step groups the lanes by PC and opcode and runs each group's
+    instruction for all its lanes as whole array operations, so the
+    Python overhead of an instruction is paid once for the group rather
+    than once a machine. Lanes whose control flow has gone different
+    ways are in different groups; each step runs the group at the lowest
+    PC, so the ones behind catch up and merge with the ones ahead, and
+    any lane kept waiting PATIENCE steps runs anyway.
+
+    Instructions with a vectorised form below (VECTORS, by handler name,
+    as in the recompiler) run that way, anything else runs lane by lane
+    through the interpreter's handler. There are no devices and no
+    interrupts: a lane runs until it halts.
+
+    NumPy is needed for this module only, nothing else imports it.
+
+        lanes = lockstep.Lockstep(1000, program, 0x8000)
+        lanes.memory[:, 0x9000:0x9100] = inputs
+        lanes.set("PC", 0x8000)
+        lanes.run(100000)
+        results = lanes.get("DE")
+"""
+import numpy as np
+
+from . import alu, bus, devices, instructions, registers
+from . instructions import PREFIX_BYTES, INDEX
+from . registers import NAMES, flag_bits
+
+# Steps a lane waits behind the lowest PC before it runs anyway
+PATIENCE = 64
+
+_ROW = dict((name, n) for n, name in enumerate(NAMES))
+_PC, _R, _HALT = _ROW["PC"], _ROW["R"], _ROW["HALT"]
+PAIRS = {"AF": ("A", "F"), "BC": ("B", "C"), "DE": ("D", "E"), "HL": ("H", "L")}
+HALVES = {"IXH": "IX", "IXL": "IX", "IYH": "IY", "IYL": "IY"}
+
+# The ALU tables as arrays to index with arrays
+SZ53P, ADD_F, SUB_F, INC_F, DEC_F = [np.frombuffer(table, np.uint8).astype(np.intp)
+                                     for table in [alu.SZ53P, alu.ADD_F, alu.SUB_F,
+                                                   alu.INC_F, alu.DEC_F]]
+
+
+class Lockstep(object):
+    """ n lanes, each a Z80 with 64K of RAM holding image at address.
+
+        registers is a row per register in NAMES order and a column per
+        lane, get() and set() also take the pairs and the IX and IY
+        halves. tstates and executed count the T-states and instructions
+        of each lane, steps the lockstep steps and vectorised the lane
+        instructions run as part of a group. With vectorise False every
+        instruction runs lane by lane through the interpreter. """
+    def __init__(self, n, image=b"", address=0, vectorise=True):
+        self.n = n
+        self.memory = np.zeros((n, 0x10000), np.uint8)
+        if image:
+            self.memory[:, address:address + len(image)] = np.frombuffer(bytes(image), np.uint8)
+        self.registers = np.zeros((len(NAMES), n), np.intp)
+        self.tstates = np.zeros(n, np.int64)
+        self.executed = np.zeros(n, np.int64)
+        self.steps = 0
+        self.vectorised = 0
+        self.vectorise = vectorise
+        self._all = np.arange(n)
+        self._waited = np.zeros(n, np.int64)
+        self._diverged = False
+        self._scalar = registers.Registers()
+        self._instructions = instructions.InstructionSet(self._scalar)
+        self._buses = {}
+
+    def get(self, name):
+        """ The value of register name in every lane """
+        return self._get(name, self._all)
+
+    def set(self, name, value):
+        """ Set register name in every lane to value, a number or one a lane """
+        self._put(name, self._all, np.broadcast_to(np.asarray(value, np.intp), (self.n, )))
+
+    @property
+    def halted(self):
+        """ Whether every lane has halted """
+        return bool(self.registers[_HALT].all())
+
+    def step(self):
+        """ Run an instruction on the lanes at the lowest PC and on those
+            that have waited PATIENCE steps, return how many ran """
+        live = np.flatnonzero(self.registers[_HALT] == 0)
+        if not live.size:
+            return 0
+        pcs = self.registers[_PC, live]
+        keys = pcs << 8 | self.memory[live, pcs]
+        first = keys.min()
+        if keys.max() != first:
+            waited = self._waited
+            chosen = (keys == first) | (waited[live] >= PATIENCE)
+            waited[live] += 1
+            live, keys = live[chosen], keys[chosen]
+            waited[live] = 0
+            self._diverged = True
+        elif self._diverged:
+            self._waited[live] = 0
+            self._diverged = False
+        for key, lanes in _groups(keys, live):
+            self._dispatch(int(key) >> 8, int(key) & 0xFF, lanes)
+        self.executed[live] += 1
+        self.steps += 1
+        return live.size
+
+    def run(self, steps):
+        """ step() up to steps times, stopping once every lane has
+            halted, return how many steps ran """
+        for done in range(steps):
+            if not self.step():
+                return done
+        return steps
+
+    #----------------------------------------------------------------------
+
+    def _dispatch(self, pc, op, lanes):
+        """ Split lanes at pc with op on the bytes after a prefix """
+        if op not in PREFIX_BYTES:
+            return self._execute(pc, lanes)
+        keys = self._read8(lanes, (pc + 1) & 0xFFFF)
+        if op in INDEX:
+            # DD CB d op, the opcode comes after the displacement
+            cb = keys == 0xCB
+            keys[cb] = 0xCB00 | self._read8(lanes[cb], (pc + 3) & 0xFFFF)
+        for key, group in _groups(keys, lanes):
+            self._execute(pc, group)
+
+    def _execute(self, pc, lanes):
+        """ Run the instruction at pc on lanes, all with the same one there """
+        ins, n = self._instructions.decode(self._view(lanes[0]), pc)
+        vector = VECTORS.get(ins.executer.__name__) if self.vectorise else None
+        if vector is not None:
+            regs = self.registers
+            following = (pc + ins.length) & 0xFFFF
+            if ins.operand_count:
+                n = self._read8(lanes, (pc + ins.operand_start) & 0xFFFF)
+                if ins.operand_count == 2:
+                    n |= self._read8(lanes, (pc + ins.operand_start + 1) & 0xFFFF) << 8
+            regs[_PC, lanes] = following
+            met = vector(self, ins, lanes, n, following)
+            if met is not False:
+                r = regs[_R, lanes]
+                regs[_R, lanes] = (r + ins.incrementR) & 0x7F | r & 0x80
+                if met is None or ins.skipped is None:
+                    self.tstates[lanes] += ins.tstates
+                else:
+                    self.tstates[lanes] += np.where(met, ins.tstates, ins.skipped)
+                self.vectorised += lanes.size
+                return
+            regs[_PC, lanes] = pc
+        for lane in lanes.tolist():
+            self._step_lane(lane)
+
+    def _step_lane(self, lane):
+        """ One instruction on one lane, through the interpreter """
+        scalar = self._scalar
+        for name, value in zip(NAMES, self.registers[:, lane].tolist()):
+            setattr(scalar, name, value)
+        self.tstates[lane] += self._instructions.step(self._bus(lane))
+        self.registers[:, lane] = [getattr(scalar, name) for name in NAMES]
+
+    def _view(self, lane):
+        return memoryview(self.memory[lane])
+
+    def _bus(self, lane):
+        """ A Bus on lane's memory for the interpreter, block instructions
+            going round once a step """
+        lane_bus = self._buses.get(lane)
+        if lane_bus is None:
+            lane_bus = bus.Bus(self._view(lane), devices.IOMap())
+            lane_bus.budget = 0
+            self._buses[lane] = lane_bus
+        return lane_bus
+
+    def _get(self, reg, lanes):
+        regs = self.registers
+        if reg in _ROW:
+            return regs[_ROW[reg], lanes]
+        if reg in PAIRS:
+            high, low = PAIRS[reg]
+            return regs[_ROW[high], lanes] << 8 | regs[_ROW[low], lanes]
+        pair = regs[_ROW[HALVES[reg]], lanes]
+        return pair >> 8 if reg[2] == "H" else pair & 0xFF
+
+    def _put(self, reg, lanes, value):
+        regs = self.registers
+        if reg in _ROW:
+            regs[_ROW[reg], lanes] = value
+        elif reg in PAIRS:
+            high, low = PAIRS[reg]
+            regs[_ROW[high], lanes] = value >> 8
+            regs[_ROW[low], lanes] = value & 0xFF
+        else:
+            row = _ROW[HALVES[reg]]
+            if reg[2] == "H":
+                regs[row, lanes] = regs[row, lanes] & 0xFF | value << 8
+            else:
+                regs[row, lanes] = regs[row, lanes] & 0xFF00 | value
+
+    def _read8(self, lanes, address):
+        return self.memory[lanes, address].astype(np.intp)
+
+    def _read16(self, lanes, address):
+        return self._read8(lanes, address) | self._read8(lanes, (address + 1) & 0xFFFF) << 8
+
+    def _write8(self, lanes, address, value):
+        self.memory[lanes, address] = value
+
+    def _write16(self, lanes, address, value):
+        self.memory[lanes, address] = value & 0xFF
+        self.memory[lanes, (address + 1) & 0xFFFF] = value >> 8
+
+    def _indexed(self, i, lanes, d):
+        """ The (IX+d) address in each lane """
+        return (self._get(i, lanes) + (d ^ 0x80) - 0x80) & 0xFFFF
+
+
+def _groups(keys, lanes):
+    """ lanes split by their keys, as (key, lanes) """
+    if keys.size == 0 or keys.max() == keys.min():
+        return [(keys[0], lanes)] if keys.size else []
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    cuts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    return [(keys[start], lanes[group])
+            for start, group in zip(np.concatenate(([0], cuts)), np.split(order, cuts))]
+
+
+#----------------------------------------------------------------------
+# Vectorised forms, one per handler factory as in the recompiler. Each is
+# given the Lockstep, the instruction, the lanes, their operands and the
+# address of the next instruction, PC already set to it. They return
+# None, or for the instructions with a condition whether it was met in
+# each lane; returning False leaves the instruction to its handler.
+#----------------------------------------------------------------------
+
+def _alu(op):
+    def vector(m, ins, lanes, n, following):
+        kind = ins.executer.__name__.split("_a_", 1)[1]
+        if kind == "r":
+            b = m._get(ins.args[0], lanes)
+        elif kind == "n":
+            b = n
+        elif kind == "hl_":
+            b = m._read8(lanes, m._get("HL", lanes))
+        else:
+            b = m._read8(lanes, m._indexed(ins.args[0], lanes, n))
+        a = m._get("A", lanes)
+        if op in ("and", "or", "xor"):
+            a = a & b if op == "and" else a | b if op == "or" else a ^ b
+            m._put("A", lanes, a)
+            m._put("F", lanes, SZ53P[a] | 0x10 if op == "and" else SZ53P[a])
+            return
+        i = a << 8 | b
+        if op in ("adc", "sbc"):
+            i |= (m._get("F", lanes) & 1) << 16
+        if op == "cp":
+            # F5 and F3 come from the operand
+            m._put("F", lanes, SUB_F[i] & 0xD7 | b & 0x28)
+        elif op in ("add", "adc"):
+            m._put("A", lanes, (a + b + (i >> 16)) & 0xFF)
+            m._put("F", lanes, ADD_F[i])
+        else:
+            m._put("A", lanes, (a - b - (i >> 16)) & 0xFF)
+            m._put("F", lanes, SUB_F[i])
+    return vector
+
+
+def _incdec(step, table):
+    def vector(m, ins, lanes, n, following):
+        name = ins.executer.__name__
+        f = m._get("F", lanes) & 1
+        if name.endswith("_r"):
+            reg = ins.args[0]
+            v = m._get(reg, lanes)
+            m._put("F", lanes, f | table[v])
+            m._put(reg, lanes, (v + step) & 0xFF)
+            return
+        if name.endswith("hl_"):
+            address = m._get("HL", lanes)
+        else:
+            address = m._indexed(ins.args[0], lanes, n)
+        v = m._read8(lanes, address)
+        m._put("F", lanes, f | table[v])
+        m._write8(lanes, address, (v + step) & 0xFF)
+    return vector
+
+
+def ld_r_r_(m, ins, lanes, n, following):
+    r, r_ = ins.args
+    if r in ("I", "R"):
+        return False
+    m._put(r, lanes, m._get(r_, lanes))
+
+def ld_r_n(m, ins, lanes, n, following):
+    m._put(ins.args[0], lanes, n)
+
+def ld_r_hl(m, ins, lanes, n, following):
+    m._put(ins.args[0], lanes, m._read8(lanes, m._get("HL", lanes)))
+
+def ld_r_i_d(m, ins, lanes, n, following):
+    r, i = ins.args
+    m._put(r, lanes, m._read8(lanes, m._indexed(i, lanes, n)))
+
+def ld_hl_r(m, ins, lanes, n, following):
+    m._write8(lanes, m._get("HL", lanes), m._get(ins.args[0], lanes))
+
+def ld_i_d_r(m, ins, lanes, n, following):
+    r, i = ins.args
+    m._write8(lanes, m._indexed(i, lanes, n), m._get(r, lanes))
+
+def ld_hl_n(m, ins, lanes, n, following):
+    m._write8(lanes, m._get("HL", lanes), n)
+
+def ld_i_d_n(m, ins, lanes, n, following):
+    m._write8(lanes, m._indexed(ins.args[0], lanes, n & 0xFF), n >> 8)
+
+def ld_a_rr(m, ins, lanes, n, following):
+    m._put("A", lanes, m._read8(lanes, m._get(ins.args[0] + ins.args[1], lanes)))
+
+def ld_a_nn(m, ins, lanes, n, following):
+    m._put("A", lanes, m._read8(lanes, n))
+
+def ld_rr_a(m, ins, lanes, n, following):
+    m._write8(lanes, m._get(ins.args[0] + ins.args[1], lanes), m._get("A", lanes))
+
+def ld_nn_a(m, ins, lanes, n, following):
+    m._write8(lanes, n, m._get("A", lanes))
+
+def ld_dd_nn(m, ins, lanes, n, following):
+    m._put("".join(ins.args), lanes, n)
+
+def ld_D_nn(m, ins, lanes, n, following):
+    m._put(ins.args[0], lanes, n)
+
+def ld_dd_nn_(m, ins, lanes, n, following):
+    m._put("".join(ins.args), lanes, m._read16(lanes, n))
+
+def ld_D_nn_(m, ins, lanes, n, following):
+    m._put(ins.args[0], lanes, m._read16(lanes, n))
+
+def ld_nn__D(m, ins, lanes, n, following):
+    m._write16(lanes, n, m._get(ins.args[0], lanes))
+
+def ld_nn_D(m, ins, lanes, n, following):
+    m._write16(lanes, n, m._get("".join(ins.args), lanes))
+
+def ld_sp_hl(m, ins, lanes, n, following):
+    m._put("SP", lanes, m._get("HL", lanes))
+
+def ld_sp_i(m, ins, lanes, n, following):
+    m._put("SP", lanes, m._get(ins.args[0], lanes))
+
+def _push(m, lanes, value):
+    stack = (m._get("SP", lanes) - 2) & 0xFFFF
+    m._put("SP", lanes, stack)
+    m._write16(lanes, stack, value)
+
+def _pop(m, lanes):
+    stack = m._get("SP", lanes)
+    m._put("SP", lanes, (stack + 2) & 0xFFFF)
+    return m._read16(lanes, stack)
+
+def push(m, ins, lanes, n, following):
+    _push(m, lanes, m._get("".join(ins.args), lanes))
+
+def pop(m, ins, lanes, n, following):
+    m._put("".join(ins.args), lanes, _pop(m, lanes))
+
+def _swap(m, lanes, pairs):
+    for a, b in pairs:
+        va, vb = m._get(a, lanes), m._get(b, lanes)
+        m._put(a, lanes, vb)
+        m._put(b, lanes, va)
+
+def ex_de_hl(m, ins, lanes, n, following):
+    _swap(m, lanes, [("D", "H"), ("E", "L")])
+
+def ex_af_af_(m, ins, lanes, n, following):
+    _swap(m, lanes, [("A", "A_"), ("F", "F_")])
+
+def exx(m, ins, lanes, n, following):
+    _swap(m, lanes, [(r, r + "_") for r in "BCDEHL"])
+
+def ex_sp__hl(m, ins, lanes, n, following):
+    stack = m._get("SP", lanes)
+    v = m._read16(lanes, stack)
+    m._write16(lanes, stack, m._get("HL", lanes))
+    m._put("HL", lanes, v)
+
+def ex_sp__i(m, ins, lanes, n, following):
+    i = ins.args[0]
+    stack = m._get("SP", lanes)
+    v = m._read16(lanes, stack)
+    m._write16(lanes, stack, m._get(i, lanes))
+    m._put(i, lanes, v)
+
+def cpl(m, ins, lanes, n, following):
+    a = m._get("A", lanes) ^ 0xFF
+    m._put("A", lanes, a)
+    m._put("F", lanes, m._get("F", lanes) & 0xC5 | 0x12 | a & 0x28)
+
+def scf(m, ins, lanes, n, following):
+    m._put("F", lanes, m._get("F", lanes) & 0xC4 | 1 | m._get("A", lanes) & 0x28)
+
+def ccf(m, ins, lanes, n, following):
+    f = m._get("F", lanes)
+    m._put("F", lanes, f & 0xC4 | (f & 1) << 4 | (f & 1) ^ 1 | m._get("A", lanes) & 0x28)
+
+def nop(m, ins, lanes, n, following):
+    pass
+
+def rlca(m, ins, lanes, n, following):
+    a = m._get("A", lanes)
+    a = (a << 1 | a >> 7) & 0xFF
+    m._put("A", lanes, a)
+    m._put("F", lanes, m._get("F", lanes) & 0xC4 | a & 0x29)
+
+def rla(m, ins, lanes, n, following):
+    a, f = m._get("A", lanes), m._get("F", lanes)
+    r = (a << 1 | f & 1) & 0xFF
+    m._put("A", lanes, r)
+    m._put("F", lanes, f & 0xC4 | r & 0x28 | a >> 7)
+
+def rrca(m, ins, lanes, n, following):
+    a = m._get("A", lanes)
+    a = a >> 1 | (a & 1) << 7
+    m._put("A", lanes, a)
+    m._put("F", lanes, m._get("F", lanes) & 0xC4 | a & 0x28 | a >> 7)
+
+def rra(m, ins, lanes, n, following):
+    a, f = m._get("A", lanes), m._get("F", lanes)
+    r = a >> 1 | (f & 1) << 7
+    m._put("A", lanes, r)
+    m._put("F", lanes, f & 0xC4 | r & 0x28 | a & 1)
+
+def add16_hl(m, ins, lanes, n, following):
+    a, b = m._get("HL", lanes), m._get(ins.args[0], lanes)
+    r = a + b
+    m._put("F", lanes, m._get("F", lanes) & 0xC4 | ((a & 0xFF) + (b & 0xFF)) >> 4 & 0x10 |
+           ((a >> 8) + (b >> 8)) & 0x28 | r >> 16)
+    m._put("HL", lanes, r & 0xFFFF)
+
+def add16_i_pp(m, ins, lanes, n, following):
+    i, reg = ins.args
+    a, b = m._get(i, lanes), m._get(reg, lanes)
+    r = a + b
+    m._put("F", lanes, m._get("F", lanes) & 0xC4 | ((a & 0xFFF) + (b & 0xFFF)) >> 8 & 0x10 |
+           ((a >> 8) + (b >> 8)) & 0x28 | r >> 16)
+    m._put(i, lanes, r & 0xFFFF)
+
+def inc16_ss(m, ins, lanes, n, following):
+    reg = ins.args[0]
+    m._put(reg, lanes, (m._get(reg, lanes) + 1) & 0xFFFF)
+
+def dec16_ss(m, ins, lanes, n, following):
+    reg = ins.args[0]
+    m._put(reg, lanes, (m._get(reg, lanes) - 1) & 0xFFFF)
+
+def halt(m, ins, lanes, n, following):
+    m._put("HALT", lanes, 1)
+    m._put("PC", lanes, (following - 1) & 0xFFFF)
+
+
+# Jumps set PC in the lanes taking them
+
+def _relative(following, d):
+    return (following + (d ^ 0x80) - 0x80) & 0xFFFF
+
+def _taken(m, lanes, mask, want):
+    return m._get("F", lanes) & mask == want
+
+def _mask(ins):
+    reg, reg_name, val = ins.args
+    mask = 1 << flag_bits[reg]
+    return mask, mask if val else 0
+
+def jp(m, ins, lanes, n, following):
+    m._put("PC", lanes, n)
+
+def jr(m, ins, lanes, n, following):
+    m._put("PC", lanes, _relative(following, n))
+
+def jp_c(m, ins, lanes, n, following):
+    met = _taken(m, lanes, *_mask(ins))
+    m._put("PC", lanes[met], n[met])
+    return met
+
+def _jr_cc(mask, want):
+    def vector(m, ins, lanes, n, following):
+        met = _taken(m, lanes, mask, want)
+        m._put("PC", lanes[met], _relative(following, n[met]))
+        return met
+    return vector
+
+def jp_r(m, ins, lanes, n, following):
+    m._put("PC", lanes, m._get(ins.args[0], lanes))
+
+def djnz(m, ins, lanes, n, following):
+    b = (m._get("B", lanes) - 1) & 0xFF
+    m._put("B", lanes, b)
+    met = b != 0
+    m._put("PC", lanes[met], _relative(following, n[met]))
+    return met
+
+def call(m, ins, lanes, n, following):
+    _push(m, lanes, following)
+    m._put("PC", lanes, n)
+
+def call_c(m, ins, lanes, n, following):
+    met = _taken(m, lanes, *_mask(ins))
+    _push(m, lanes[met], following)
+    m._put("PC", lanes[met], n[met])
+    return met
+
+def ret(m, ins, lanes, n, following):
+    m._put("PC", lanes, _pop(m, lanes))
+
+def ret_c(m, ins, lanes, n, following):
+    met = _taken(m, lanes, *_mask(ins))
+    m._put("PC", lanes[met], _pop(m, lanes[met]))
+    return met
+
+def rst_p(m, ins, lanes, n, following):
+    _push(m, lanes, following)
+    m._put("PC", lanes, ins.args[0])
+
+
+VECTORS = {
+    "ld_r_r_": ld_r_r_, "ld_r_n": ld_r_n, "ld_r_hl": ld_r_hl,
+    "ld_r_i_d": ld_r_i_d, "ld_hl_r": ld_hl_r, "ld_i_d_r": ld_i_d_r,
+    "ld_hl_n": ld_hl_n, "ld_i_d_n": ld_i_d_n, "ld_a_rr": ld_a_rr,
+    "ld_a_nn": ld_a_nn, "ld_rr_a": ld_rr_a, "ld_nn_a": ld_nn_a,
+    "ld_dd_nn": ld_dd_nn, "ld_D_nn": ld_D_nn, "ld_dd_nn_": ld_dd_nn_,
+    "ld_D_nn_": ld_D_nn_, "ld_nn__D": ld_nn__D, "ld_nn_D": ld_nn_D,
+    "ld_sp_hl": ld_sp_hl, "ld_sp_i": ld_sp_i,
+    "push_qq": push, "push_i": push, "pop_qq": pop, "pop_i": pop,
+    "ex_de_hl": ex_de_hl, "ex_af_af_": ex_af_af_, "exx": exx,
+    "ex_sp__hl": ex_sp__hl, "ex_sp__i": ex_sp__i,
+    "inc_r": _incdec(1, INC_F), "inc_hl_": _incdec(1, INC_F),
+    "inc_i_": _incdec(1, INC_F), "dec_r": _incdec(-1, DEC_F),
+    "dec_hl_": _incdec(-1, DEC_F), "dec_i_": _incdec(-1, DEC_F),
+    "cpl": cpl, "scf": scf, "ccf": ccf, "nop": nop, "halt": halt,
+    "rlca": rlca, "rla": rla, "rrca": rrca, "rra": rra,
+    "add16_hl": add16_hl, "add16_i_pp": add16_i_pp,
+    "inc16_ss": inc16_ss, "dec16_ss": dec16_ss,
+    "jp": jp, "jr": jr, "jp_c": jp_c, "jp_r": jp_r, "djnz": djnz,
+    "jr_nz": _jr_cc(0x40, 0), "jr_z": _jr_cc(0x40, 0x40),
+    "jr_nc": _jr_cc(0x01, 0), "jr_c": _jr_cc(0x01, 0x01),
+    "call": call, "call_c": call_c, "ret": ret, "ret_c": ret_c,
+    "rst_p": rst_p,
+}
+for _op in ["add", "adc", "sub", "sbc", "and", "or", "xor", "cp"]:
+    for _kind in ["r", "n", "hl_", "i_"]:
+        VECTORS["%s_a_%s" % (_op, _kind)] = _alu(_op)
@@ -0,0 +1,99 @@
+""" The Z80 SBC with no user interface: CPU, memory and ports
+
+    Nothing here imports Qt, so tests, batch jobs and servers can run
+    the machine on its own; z80sbc.py puts the Qt front end on top.
+
+        m = Machine()
+        acia = m.add_device(devices.Acia(m))
+        m.run(1000000)
+"""
+import os
+
+from . import registers, instructions, bus, recompiler, aot, runner, scheduler, interrupts, idle, devices
+from . registers import NAMES
+
+# 8K of ROM at 0000H, RAM above
+ROM_SIZE = 0x2000
+
+ROM = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    "..", "..", "roms", "ROM.HEX"))
+
+
+class Machine(devices.Interruptable, runner.Runner):
+    """ ROM code runs translated ahead of time (see aot), RAM is
+        interpreted; with translate False everything is interpreted. """
+    def __init__(self, rom=ROM, translate=True):
+        self.registers = registers.Registers()
+        self.instructions = instructions.InstructionSet(self.registers)
+        self._memory = bytearray(64*1024)
+        aot.read_hex(rom, self._memory)
+        self._iomap = devices.IOMap()
+        self._bus = bus.Bus(self._memory, self._iomap)
+        self.instructions.enable_cache(self._bus)
+        self._recompiler = None
+        if translate:
+            self._recompiler = recompiler.Recompiler(self.instructions, self._bus, dynamic=False)
+            aot.load(self._recompiler, ROM_SIZE)
+        self.interrupts = interrupts.Interrupts(self.registers, self._bus, self.instructions.step)
+        self.scheduler = scheduler.Scheduler()
+        self.idle = idle.Idle()
+
+    @property
+    def memory(self):
+        return self._memory
+
+    def snapshot(self):
+        """ The memory and registers, for restore() """
+        return bytes(self._memory), [getattr(self.registers, name) for name in NAMES]
+
+    def restore(self, state):
+        """ Go back to a snapshot(), with nothing pending or scheduled.
+            The decoded and translated ROM are kept, devices stay mapped
+            and are left as they are. """
+        memory, values = state
+        self._memory[:] = memory
+        self.instructions.cache.clear()
+        for name, value in zip(NAMES, values):
+            setattr(self.registers, name, value)
+        self.interrupts = interrupts.Interrupts(self.registers, self._bus, self.instructions.step)
+        self.scheduler = scheduler.Scheduler()
+        self.idle = idle.Idle()
+        self.cycles = 0
+
+    def add_device(self, dev):
+        """ Map dev at its ports, return it """
+        self._iomap.addDevice(dev)
+        return dev
+
+    def interrupt(self):
+        self.interrupts.interrupt()
+        self.idle.wake()
+
+    def nmi(self):
+        self.interrupts.nmi()
+        self.idle.wake()
+
+    def step_instruction(self):
+        """ Take a pending interrupt or run one instruction, return the
+            T-states taken """
+        tstates = self.poll()
+        if tstates:
+            return tstates
+        return self.instructions.step(self._bus)
+
+    def poll(self):
+        """ Take a pending interrupt, return the T-states taken """
+        interrupts = self.interrupts
+        if interrupts.pending:
+            return interrupts.accept()
+        return 0
+
+    def step_block(self):
+        """ Take a pending interrupt or run the translated block at PC,
+            return the T-states taken """
+        tstates = self.poll()
+        if tstates:
+            return tstates
+        if self._recompiler is None:
+            return self.instructions.step(self._bus)
+        return self._recompiler.step()
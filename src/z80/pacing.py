@@ -0,0 +1,84 @@
+""" Holding emulated time to the host clock
+
+    A Pacer has the machine run latency seconds' worth of T-states at a
+    time, then sleeps off however far ahead of the host clock it got.
+    speed None runs flat out, 1.0 at the SBC's own 7.3728 MHz, anything
+    else that many times it.
+
+        pacer = pacing.Pacer(1.0)
+        machine.run_paced(pacer, seconds=10)
+        print(pacer.report())
+"""
+import time
+from time import perf_counter
+
+# The SBC's crystal
+CLOCK = 7372800
+
+# Behind the host clock by more than this, seconds, and the pacer stops
+# trying to catch up and carries on from where it is
+LAG = 0.25
+
+
+class Pacer(object):
+    def __init__(self, speed=1.0, latency=0.02, clock=CLOCK, timer=perf_counter, sleep=time.sleep):
+        self.speed = speed
+        self.latency = latency
+        self.clock = clock
+        self._timer = timer
+        self._sleep = sleep
+        self.hz = clock * speed if speed else None
+        # T-states between sleeps, flat out as many as at real speed
+        self.chunk = max(1, int(latency * (self.hz or clock)))
+        self.start(0)
+
+    def start(self, cycles):
+        """ Count from now, the machine having run cycles T-states """
+        now = self._timer()
+        self._started = self._base = now
+        self._first = self._cycles = self.cycles = cycles
+        self.drift = 0.0
+        self.slept = 0.0
+        self.resyncs = 0
+
+    def pace(self, cycles):
+        """ The machine has got to cycles, sleep until the host clock
+            catches up with it """
+        self.cycles = cycles
+        if self.hz is None:
+            return
+        due = self._base + (cycles - self._cycles) / self.hz
+        ahead = due - self._timer()
+        if ahead > 0:
+            self._sleep(ahead)
+            self.slept += ahead
+        self.drift = self._timer() - due
+        if self.drift > LAG:
+            self._base = self._timer()
+            self._cycles = cycles
+            self.resyncs += 1
+
+    def elapsed(self):
+        return self._timer() - self._started
+
+    def mhz(self):
+        """ Emulated MHz since start() """
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return (self.cycles - self._first) / elapsed / 1e6
+
+    def report(self):
+        mhz = self.mhz()
+        return "%.3f MHz (%.2fx), drift %.1f ms, slept %.0f%%, %d resyncs" % (
+            mhz, mhz * 1e6 / self.clock, self.drift * 1000,
+            100.0 * self.slept / max(self.elapsed(), 1e-9), self.resyncs)
+
+
+def pacer(spec, latency=0.02):
+    """ A Pacer from "max", "real" or a multiplier such as "2.5" """
+    if spec == "max":
+        return Pacer(None, latency)
+    if spec == "real":
+        return Pacer(1.0, latency)
+    return Pacer(float(spec), latency)
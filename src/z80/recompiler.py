@@ -0,0 +1,944 @@
+""" Basic block recompiler, straight line Z80 code to Python functions """
+from bisect import bisect_left
+
+from . import alu
+from . bus import written
+from . registers import flag_bits
+
+
+# Most instructions in a block
+LIMIT = 32
+
+# Instructions ending a block: they change PC, or they change when an
+# interrupt can be taken so the machine must look before going on.
+CONTROL = set(["jp", "jp_c", "jr", "jr_nz", "jr_z", "jr_nc", "jr_c", "jp_r",
+               "djnz", "call", "call_c", "ret", "ret_c", "reti", "retn",
+               "rst_p", "halt", "di", "ei", "ldir", "lddr", "cpir", "cpdr",
+               "inir", "indr", "otir", "otdr"])
+
+# Registers living in a local of the same name inside a block
+LOCALS = set(["A", "F", "B", "C", "D", "E", "H", "L", "SP", "IX", "IY",
+              "A_", "F_", "B_", "C_", "D_", "E_", "H_", "L_"])
+PAIRS = set(["AF", "BC", "DE", "HL"])
+HALVES = {"IXH": "IX", "IXL": "IX", "IYH": "IY", "IYL": "IY"}
+
+# Instructions that can take their operand from memory while the block
+# runs, for operands the program keeps rewriting
+RUNTIME = set(["ld_r_n", "ld_hl_n", "ld_dd_nn", "ld_D_nn", "ld_a_nn", "ld_nn_a",
+               "ld_dd_nn_", "ld_D_nn_", "ld_nn__D", "ld_nn_D"] +
+              ["%s_a_n" % op for op in ["add", "adc", "sub", "sbc", "and", "or", "xor", "cp"]])
+
+
+# The ALU tables translated blocks use, by the names they use them by
+TABLES = {"SZ53P": alu.SZ53P, "ADD_F": alu.ADD_F, "SUB_F": alu.SUB_F,
+          "INC_F": alu.INC_F, "DEC_F": alu.DEC_F, "DAA_A": alu.DAA_A,
+          "DAA_F": alu.DAA_F, "SHIFT_R": alu.SHIFT_R, "SHIFT_F": alu.SHIFT_F,
+          "BIT_F": alu.BIT_F}
+
+
+class Block(object):
+    """ A translated run of instructions.
+
+        run(registers, bus, memory) executes them, leaves PC at whatever
+        comes next and returns the T-states taken. lead is the T-states
+        spent before the last instruction starts, starts the same for
+        every instruction. """
+    def __init__(self, pc, count, addresses, lead, starts, source):
+        self.pc = pc
+        self.count = count
+        self.addresses = addresses
+        self.lead = lead
+        self.starts = starts
+        self.source = source
+        self.bindings = []
+        self.run = None
+
+
+class Translator(object):
+    """ Writes the Python source of one block.
+
+        Registers are loaded into locals the first time an instruction
+        needs them and stored back at the end if they were changed. F is
+        kept as a plain int and flags are worked out inline. Anything
+        without a translation calls the interpreter's handler, with the
+        locals stored before and reloaded after. """
+    def __init__(self):
+        self.lines = []
+        self.loaded = set()
+        self.dirty = set()
+        self.uses = set()
+        self.bindings = []
+        self.refresh = 0
+        # Where the current instruction ends, in bytes and T-states
+        self.following = 0
+        self.elapsed = 0
+        self.wrote = False
+
+    def emit(self, line):
+        self.lines.append("    " + line)
+
+    def load(self, reg):
+        if reg not in self.loaded:
+            self.emit('%s = registers.%s' % (reg, reg))
+            self.loaded.add(reg)
+
+    def get(self, reg):
+        """ Return an expression reading reg """
+        if reg in LOCALS:
+            self.load(reg)
+            return reg
+        if reg in PAIRS:
+            self.load(reg[0])
+            self.load(reg[1])
+            return "(%s << 8 | %s)" % (reg[0], reg[1])
+        pair = HALVES[reg]
+        self.load(pair)
+        if reg[2] == "H":
+            return "(%s >> 8)" % pair
+        return "(%s & 0xFF)" % pair
+
+    def put(self, reg, value):
+        """ Emit an assignment of the expression value to reg """
+        if reg in LOCALS:
+            self.emit("%s = %s" % (reg, value))
+            self.loaded.add(reg)
+            self.dirty.add(reg)
+        elif reg in PAIRS and value.startswith("0x"):
+            value = int(value, 16)
+            self.put(reg[0], "0x%02X" % (value >> 8))
+            self.put(reg[1], "0x%02X" % (value & 0xFF))
+        elif reg in PAIRS:
+            self.emit("_w = %s" % value)
+            self.put(reg[0], "_w >> 8")
+            self.put(reg[1], "_w & 0xFF")
+        else:
+            pair = HALVES[reg]
+            self.load(pair)
+            if reg[2] == "H":
+                self.put(pair, "%s & 0xFF | (%s) << 8" % (pair, value))
+            else:
+                self.put(pair, "%s & 0xFF00 | (%s)" % (pair, value))
+
+    def store(self):
+        """ Write changed locals back to the registers """
+        for reg in sorted(self.dirty):
+            self.emit('registers.%s = %s' % (reg, reg))
+        self.dirty = set()
+
+    def refresh_r(self):
+        """ Add the pending R increment to R """
+        if self.refresh:
+            self.emit('_r = registers.R')
+            self.emit('registers.R = (_r + %d) & 0x7F | _r & 0x80' % self.refresh)
+            self.refresh = 0
+
+    def immediate(self, n, form):
+        """ The operand n as an expression, n is already one when the
+            operand is read from memory as the block runs """
+        if isinstance(n, str):
+            return n
+        return form % n
+
+    def read8(self, address):
+        return "memory[%s]" % address
+
+    def read16(self, address):
+        if not isinstance(address, str):
+            return "(memory[0x%04X] | memory[0x%04X] << 8)" % (address, (address + 1) & 0xFFFF)
+        return "(memory[%s] | memory[(%s + 1) & 0xFFFF] << 8)" % (address, address)
+
+    def write8(self, address, value):
+        self.uses.add("write8")
+        self.emit("write8(%s, %s)" % (address, value))
+        self.wrote = True
+
+    def write16(self, address, value):
+        self.uses.add("write16")
+        self.emit("write16(%s, %s)" % (address, value))
+        self.wrote = True
+
+    def check(self):
+        """ Leave after the current instruction if it wrote over
+            translated code, the rest of the block may be stale """
+        self.wrote = False
+        self.emit("if _stale[0]:")
+        self.emit("    _stale[0] = 0")
+        for reg in sorted(self.dirty):
+            self.emit('    registers.%s = %s' % (reg, reg))
+        if self.refresh:
+            self.emit('    _r = registers.R')
+            self.emit('    registers.R = (_r + %d) & 0x7F | _r & 0x80' % self.refresh)
+        self.emit('    registers.PC = 0x%04X' % self.following)
+        self.emit("    return %d" % self.elapsed)
+
+    def hl(self):
+        return self.get("HL")
+
+    def indexed(self, i, d):
+        """ The (IX+d) address with d folded in """
+        d = d - 256 if d > 127 else d
+        return "(%s + %d) & 0xFFFF" % (self.get(i), d)
+
+    def condition(self, mask, want):
+        self.load("F")
+        return "F & 0x%02X == 0x%02X" % (mask, want)
+
+    def leave(self, pc, tstates):
+        """ Store everything and leave the block for the expression pc """
+        self.emit("_pc = %s" % pc)
+        self.store()
+        self.refresh_r()
+        self.emit('registers.PC = _pc')
+        self.emit("return %d" % tstates)
+
+    def finish(self, pc, tstates):
+        """ Leave the block for the constant pc """
+        self.store()
+        self.refresh_r()
+        self.emit('registers.PC = 0x%04X' % pc)
+        self.emit("return %d" % tstates)
+
+    def branch(self, test, taken, skipped):
+        """ Leave the block through a conditional, taken and skipped are
+            (lines, pc expression, T-states) """
+        for header, (lines, pc, tstates) in [("if %s:" % test, taken), ("else:", skipped)]:
+            self.emit(header)
+            for line in lines:
+                self.emit("    " + line)
+            self.emit("    _pc = %s" % pc)
+            self.emit("    _t = %d" % tstates)
+        self.store()
+        self.refresh_r()
+        self.emit('registers.PC = _pc')
+        self.emit("return _t")
+
+    def generic(self, name, ins, operands, following, lead=None):
+        """ Run ins through its interpreter handler, with lead given
+            leave the block returning lead and the T-states it took """
+        self.store()
+        self.refresh_r()
+        self.loaded = set()
+        self.emit('registers.PC = 0x%04X' % following)
+        self.bindings.append(name)
+        call = "%s.handler(registers, bus, 0x%X)" % (name, operands)
+        if lead is None:
+            self.emit(call)
+        else:
+            self.emit("return %d + (%s or %d)" % (lead, call, ins.tstates))
+
+
+#----------------------------------------------------------------------
+# Translations, one per handler factory. Each is given the translator,
+# the instruction, its packed operands and the address of the next
+# instruction. Returning False leaves the instruction to its handler.
+#----------------------------------------------------------------------
+
+def _alu(op):
+    def translate(t, ins, n, following):
+        kind = ins.executer.__name__.split("_a_", 1)[1]
+        if kind == "r":
+            b = t.get(ins.args[0])
+        elif kind == "n":
+            b = t.immediate(n, "0x%02X")
+        elif kind == "hl_":
+            b = t.read8(t.hl())
+        else:
+            b = t.read8(t.indexed(ins.args[0], n))
+        t.load("A")
+        if op in ("and", "or", "xor"):
+            symbol = {"and": "&", "or": "|", "xor": "^"}[op]
+            t.put("A", "A %s %s" % (symbol, b))
+            t.put("F", "SZ53P[A] | 0x10" if op == "and" else "SZ53P[A]")
+            return
+        t.emit("_b = %s" % b)
+        if op in ("adc", "sbc"):
+            t.load("F")
+            t.emit("_i = (F & 1) << 16 | A << 8 | _b")
+        else:
+            t.emit("_i = A << 8 | _b")
+        if op == "cp":
+            # F5 and F3 come from the operand
+            t.put("F", "SUB_F[_i] & 0xD7 | _b & 0x28")
+        elif op in ("add", "adc"):
+            t.put("A", "(A + _b + (_i >> 16)) & 0xFF")
+            t.put("F", "ADD_F[_i]")
+        else:
+            t.put("A", "(A - _b - (_i >> 16)) & 0xFF")
+            t.put("F", "SUB_F[_i]")
+    return translate
+
+
+def _incdec(op, table):
+    def translate(t, ins, n, following):
+        name = ins.executer.__name__
+        t.load("F")
+        if name.endswith("_r"):
+            reg = ins.args[0]
+            t.emit("_v = %s" % t.get(reg))
+            t.put("F", "F & 1 | %s[_v]" % table)
+            t.put(reg, "(_v %s 1) & 0xFF" % op)
+            return
+        if name.endswith("hl_"):
+            t.emit("_m = %s" % t.hl())
+        else:
+            t.emit("_m = %s" % t.indexed(ins.args[0], n))
+        t.emit("_v = memory[_m]")
+        t.put("F", "F & 1 | %s[_v]" % table)
+        t.write8("_m", "(_v %s 1) & 0xFF" % op)
+    return translate
+
+
+def ld_r_r_(t, ins, n, following):
+    r, r_ = ins.args
+    if r in ("I", "R"):
+        return False
+    t.put(r, t.get(r_))
+
+def ld_r_n(t, ins, n, following):
+    t.put(ins.args[0], t.immediate(n, "0x%02X"))
+
+def ld_r_hl(t, ins, n, following):
+    t.put(ins.args[0], t.read8(t.hl()))
+
+def ld_r_i_d(t, ins, n, following):
+    r, i = ins.args
+    t.put(r, t.read8(t.indexed(i, n)))
+
+def ld_hl_r(t, ins, n, following):
+    t.write8(t.hl(), t.get(ins.args[0]))
+
+def ld_i_d_r(t, ins, n, following):
+    r, i = ins.args
+    t.write8(t.indexed(i, n), t.get(r))
+
+def ld_hl_n(t, ins, n, following):
+    t.write8(t.hl(), t.immediate(n, "0x%02X"))
+
+def ld_i_d_n(t, ins, n, following):
+    t.write8(t.indexed(ins.args[0], n & 0xFF), "0x%02X" % (n >> 8))
+
+def ld_a_rr(t, ins, n, following):
+    t.put("A", t.read8(t.get(ins.args[0] + ins.args[1])))
+
+def ld_a_nn(t, ins, n, following):
+    t.put("A", t.read8(t.immediate(n, "0x%04X")))
+
+def ld_rr_a(t, ins, n, following):
+    t.write8(t.get(ins.args[0] + ins.args[1]), t.get("A"))
+
+def ld_nn_a(t, ins, n, following):
+    t.write8(t.immediate(n, "0x%04X"), t.get("A"))
+
+def ld_dd_nn(t, ins, n, following):
+    t.put("".join(ins.args), t.immediate(n, "0x%04X"))
+
+def ld_D_nn(t, ins, n, following):
+    t.put(ins.args[0], t.immediate(n, "0x%04X"))
+
+def ld_dd_nn_(t, ins, n, following):
+    t.put("".join(ins.args), t.read16(n))
+
+def ld_D_nn_(t, ins, n, following):
+    t.put(ins.args[0], t.read16(n))
+
+def ld_nn__D(t, ins, n, following):
+    t.write16(t.immediate(n, "0x%04X"), t.get(ins.args[0]))
+
+def ld_nn_D(t, ins, n, following):
+    t.write16(t.immediate(n, "0x%04X"), t.get("".join(ins.args)))
+
+def ld_sp_hl(t, ins, n, following):
+    t.put("SP", t.hl())
+
+def ld_sp_i(t, ins, n, following):
+    t.put("SP", t.get(ins.args[0]))
+
+def push(t, ins, n, following):
+    value = t.get("".join(ins.args))
+    t.put("SP", "(%s - 2) & 0xFFFF" % t.get("SP"))
+    t.write16("SP", value)
+
+def pop(t, ins, n, following):
+    t.emit("_s = %s" % t.get("SP"))
+    t.put("SP", "(_s + 2) & 0xFFFF")
+    t.put("".join(ins.args), t.read16("_s"))
+
+def _swap(t, pairs):
+    for a, b in pairs:
+        t.load(a)
+        t.load(b)
+        t.emit("%s, %s = %s, %s" % (a, b, b, a))
+        t.dirty.update([a, b])
+
+def ex_de_hl(t, ins, n, following):
+    _swap(t, [("D", "H"), ("E", "L")])
+
+def ex_af_af_(t, ins, n, following):
+    _swap(t, [("A", "A_"), ("F", "F_")])
+
+def exx(t, ins, n, following):
+    _swap(t, [(r, r + "_") for r in "BCDEHL"])
+
+def ex_sp__hl(t, ins, n, following):
+    t.emit("_v = %s" % t.read16(t.get("SP")))
+    t.write16("SP", t.hl())
+    t.put("H", "_v >> 8")
+    t.put("L", "_v & 0xFF")
+
+def ex_sp__i(t, ins, n, following):
+    i = ins.args[0]
+    t.emit("_v = %s" % t.read16(t.get("SP")))
+    t.write16("SP", t.get(i))
+    t.put(i, "_v")
+
+def cpl(t, ins, n, following):
+    t.put("A", "%s ^ 0xFF" % t.get("A"))
+    t.put("F", "%s & 0xC5 | 0x12 | A & 0x28" % t.get("F"))
+
+def scf(t, ins, n, following):
+    t.load("A")
+    t.put("F", "%s & 0xC4 | 1 | A & 0x28" % t.get("F"))
+
+def ccf(t, ins, n, following):
+    t.load("A")
+    t.put("F", "%s & 0xC4 | (F & 1) << 4 | (F & 1) ^ 1 | A & 0x28" % t.get("F"))
+
+def nop(t, ins, n, following):
+    pass
+
+def rlca(t, ins, n, following):
+    t.load("F")
+    t.put("A", "(%s << 1 | A >> 7) & 0xFF" % t.get("A"))
+    t.put("F", "F & 0xC4 | A & 0x29")
+
+def rla(t, ins, n, following):
+    t.load("F")
+    t.emit("_c = %s >> 7" % t.get("A"))
+    t.put("A", "(A << 1 | F & 1) & 0xFF")
+    t.put("F", "F & 0xC4 | A & 0x28 | _c")
+
+def rrca(t, ins, n, following):
+    t.load("F")
+    t.put("A", "%s >> 1 | (A & 1) << 7" % t.get("A"))
+    t.put("F", "F & 0xC4 | A & 0x28 | A >> 7")
+
+def rra(t, ins, n, following):
+    t.load("F")
+    t.emit("_c = %s & 1" % t.get("A"))
+    t.put("A", "A >> 1 | (F & 1) << 7")
+    t.put("F", "F & 0xC4 | A & 0x28 | _c")
+
+def add16_hl(t, ins, n, following):
+    t.load("F")
+    t.emit("_b = %s" % t.get(ins.args[0]))
+    t.emit("_a = %s" % t.hl())
+    t.emit("_r = _a + _b")
+    t.put("F", "F & 0xC4 | ((_a & 0xFF) + (_b & 0xFF)) >> 4 & 0x10"
+               " | ((_a >> 8) + (_b >> 8)) & 0x28 | _r >> 16")
+    t.put("HL", "_r & 0xFFFF")
+
+def add16_i_pp(t, ins, n, following):
+    i, r = ins.args
+    t.load("F")
+    t.emit("_b = %s" % t.get(r))
+    t.emit("_a = %s" % t.get(i))
+    t.emit("_r = _a + _b")
+    t.put("F", "F & 0xC4 | (0x10 if (_a & 0xFFF) + (_b & 0xFFF) > 0xFFF else 0)"
+               " | ((_a >> 8) + (_b >> 8)) & 0x28 | _r >> 16")
+    t.put(i, "_r & 0xFFFF")
+
+def inc16_ss(t, ins, n, following):
+    reg = ins.args[0]
+    t.put(reg, "(%s + 1) & 0xFFFF" % t.get(reg))
+
+def dec16_ss(t, ins, n, following):
+    reg = ins.args[0]
+    t.put(reg, "(%s - 1) & 0xFFFF" % t.get(reg))
+
+def in_a_n(t, ins, n, following):
+    t.uses.add("in8")
+    t.put("A", "in8(0x%02X | %s << 8)" % (n, t.get("A")))
+
+def out_a_n(t, ins, n, following):
+    t.uses.add("out8")
+    a = t.get("A")
+    t.emit("out8(0x%02X | %s << 8, %s)" % (n, a, a))
+
+def adc16_hl(t, ins, n, following):
+    t.load("F")
+    t.emit("_a = %s + (F & 1)" % t.hl())
+    t.emit("_b = %s" % t.get(ins.args[0]))
+    t.emit("_r = _a + _b")
+    t.put("F", "_r >> 8 & 0xA8 | (0x40 if _r == 0 else 0)"
+               " | (0x10 if (_a & 0xFFF) + (_b & 0xFFF) > 0xFFF else 0)"
+               " | (0x04 if _a >> 15 == _b >> 15 != (_r & 0xFFFF) >> 15 else 0) | _r >> 16 & 1")
+    t.put("HL", "_r & 0xFFFF")
+
+def sbc16_hl(t, ins, n, following):
+    t.load("F")
+    t.emit("_c = F & 1")
+    t.emit("_a = %s" % t.hl())
+    t.emit("_b = %s" % t.get(ins.args[0]))
+    t.emit("_r = _a - _b - _c")
+    t.emit("_v = (_a ^ 0x8000) - (_b ^ 0x8000) - _c")
+    t.put("F", "_r >> 8 & 0xA8 | (0x40 if _r == 0 else 0) | 0x02"
+               " | (0x10 if (_b & 0xFFF) > (_a & 0xFFF) - _c else 0)"
+               " | (0x04 if not -0x8000 <= _v <= 0x7FFF else 0) | _r >> 16 & 1")
+    t.put("HL", "_r & 0xFFFF")
+
+def daa(t, ins, n, following):
+    t.load("F")
+    t.emit("_i = (F & 0x03 | F >> 2 & 0x04) << 8 | %s" % t.get("A"))
+    t.put("A", "DAA_A[_i]")
+    t.put("F", "DAA_F[_i]")
+
+def neg(t, ins, n, following):
+    t.emit("_v = %s" % t.get("A"))
+    t.put("A", "-_v & 0xFF")
+    t.put("F", "SUB_F[_v]")
+
+
+# The rotates and shifts in SHIFT_R's order
+SHIFTS = ["RLC", "RRC", "RL", "RR", "SLA", "SRA", "SLL", "SRL"]
+
+# The CB group: ins.args is the register, nothing for (HL) or the index
+# register for (IX+d), the bit first for BIT, SET and RES. The
+# undocumented (IX+d) forms copying the result name the register last.
+
+def _cb_operand(t, n, args):
+    """ Emit what sets _m for a memory operand, return the register
+        operand instead or None with no memory operand """
+    if args and args[0] in ("IX", "IY"):
+        t.emit("_m = %s" % t.indexed(args[0], n))
+    elif not args:
+        t.emit("_m = %s" % t.hl())
+    else:
+        return args[0]
+    return None
+
+def _shift(op):
+    def translate(t, ins, n, following):
+        copy = ins.args[2] if len(ins.args) == 3 else None
+        t.load("F")
+        reg = _cb_operand(t, n, ins.args[:1])
+        value = t.get(reg) if reg else "memory[_m]"
+        t.emit("_i = 0x%04X | (F & 1) << 8 | %s" % (op << 9, value))
+        t.put("F", "SHIFT_F[_i]")
+        if reg:
+            t.put(reg, "SHIFT_R[_i]")
+            return
+        t.write8("_m", "SHIFT_R[_i]")
+        if copy:
+            t.put(copy, "SHIFT_R[_i]")
+    return translate
+
+def bit(t, ins, n, following):
+    if ins.executer.__name__ == "bit_i":
+        i, b = ins.args
+        t.load("F")
+        _cb_operand(t, n, (i, ))
+        # F5 and F3 from the high byte of the address
+        t.put("F", "F & 0x01 | BIT_F[0x%03X | memory[_m]] & 0xD7 | _m >> 8 & 0x28" % (b << 8))
+        return
+    b, args = ins.args[0], ins.args[1:]
+    t.load("F")
+    reg = _cb_operand(t, n, args)
+    t.put("F", "F & 0x01 | BIT_F[0x%03X | %s]" % (b << 8, t.get(reg) if reg else "memory[_m]"))
+
+def _set_res(setting):
+    def translate(t, ins, n, following):
+        args = ins.args
+        copy = None
+        if args[0] in ("IX", "IY"):
+            i, b = args[:2]
+            copy = args[2] if len(args) == 3 else None
+            args = (i, )
+        else:
+            b, args = args[0], args[1:]
+        mask = "| 0x%02X" % (1 << b) if setting else "& 0x%02X" % (0xFF ^ (1 << b))
+        reg = _cb_operand(t, n, args)
+        if reg:
+            t.put(reg, "%s %s" % (t.get(reg), mask))
+            return
+        t.emit("_v = memory[_m] %s" % mask)
+        t.write8("_m", "_v")
+        if copy:
+            t.put(copy, "_v")
+    return translate
+
+def shift_i_r(t, ins, n, following):
+    _shift(SHIFTS.index(ins.args[1]))(t, ins, n, following)
+
+
+# Terminators also get lead, the T-states before them, and leave the
+# block themselves.
+
+def _relative(following, d):
+    return (following + (d - 256 if d > 127 else d)) & 0xFFFF
+
+def _mask(ins):
+    reg, reg_name, val = ins.args
+    mask = 1 << flag_bits[reg]
+    return mask, mask if val else 0
+
+def _push_lines(t, value):
+    t.uses.add("write16")
+    return ["SP = (SP - 2) & 0xFFFF", "write16(SP, %s)" % value]
+
+def _pop_lines(t):
+    return ["_s = SP", "_ret = %s" % t.read16("_s"), "SP = (_s + 2) & 0xFFFF"]
+
+def jp(t, ins, n, following, lead):
+    t.finish(n, lead + ins.tstates)
+
+def jr(t, ins, n, following, lead):
+    t.finish(_relative(following, n), lead + ins.tstates)
+
+def jp_c(t, ins, n, following, lead):
+    t.branch(t.condition(*_mask(ins)),
+             ([], "0x%04X" % n, lead + ins.tstates), ([], "0x%04X" % following, lead + ins.tstates))
+
+def _jr_cc(mask, want):
+    def translate(t, ins, n, following, lead):
+        t.branch(t.condition(mask, want),
+                 ([], "0x%04X" % _relative(following, n), lead + ins.tstates),
+                 ([], "0x%04X" % following, lead + ins.skipped))
+    return translate
+
+def jp_r(t, ins, n, following, lead):
+    t.leave(t.get(ins.args[0]), lead + ins.tstates)
+
+def djnz(t, ins, n, following, lead):
+    t.put("B", "(%s - 1) & 0xFF" % t.get("B"))
+    t.branch("B", ([], "0x%04X" % _relative(following, n), lead + ins.tstates),
+             ([], "0x%04X" % following, lead + ins.skipped))
+
+def call(t, ins, n, following, lead):
+    t.load("SP")
+    for line in _push_lines(t, "0x%04X" % following):
+        t.emit(line)
+    t.dirty.add("SP")
+    t.finish(n, lead + ins.tstates)
+
+def call_c(t, ins, n, following, lead):
+    t.load("SP")
+    t.dirty.add("SP")
+    t.branch(t.condition(*_mask(ins)),
+             (_push_lines(t, "0x%04X" % following), "0x%04X" % n, lead + ins.tstates),
+             ([], "0x%04X" % following, lead + ins.skipped))
+
+def ret(t, ins, n, following, lead):
+    t.load("SP")
+    for line in _pop_lines(t):
+        t.emit(line)
+    t.dirty.add("SP")
+    t.leave("_ret", lead + ins.tstates)
+
+def ret_c(t, ins, n, following, lead):
+    t.load("SP")
+    t.dirty.add("SP")
+    t.branch(t.condition(*_mask(ins)),
+             (_pop_lines(t), "_ret", lead + ins.tstates),
+             ([], "0x%04X" % following, lead + ins.skipped))
+
+def rst_p(t, ins, n, following, lead):
+    t.load("SP")
+    for line in _push_lines(t, "0x%04X" % following):
+        t.emit(line)
+    t.dirty.add("SP")
+    t.finish(ins.args[0], lead + ins.tstates)
+
+
+TRANSLATIONS = {
+    "ld_r_r_": ld_r_r_, "ld_r_n": ld_r_n, "ld_r_hl": ld_r_hl,
+    "ld_r_i_d": ld_r_i_d, "ld_hl_r": ld_hl_r, "ld_i_d_r": ld_i_d_r,
+    "ld_hl_n": ld_hl_n, "ld_i_d_n": ld_i_d_n, "ld_a_rr": ld_a_rr,
+    "ld_a_nn": ld_a_nn, "ld_rr_a": ld_rr_a, "ld_nn_a": ld_nn_a,
+    "ld_dd_nn": ld_dd_nn, "ld_D_nn": ld_D_nn, "ld_dd_nn_": ld_dd_nn_,
+    "ld_D_nn_": ld_D_nn_, "ld_nn__D": ld_nn__D, "ld_nn_D": ld_nn_D,
+    "ld_sp_hl": ld_sp_hl, "ld_sp_i": ld_sp_i,
+    "push_qq": push, "push_i": push, "pop_qq": pop, "pop_i": pop,
+    "ex_de_hl": ex_de_hl, "ex_af_af_": ex_af_af_, "exx": exx,
+    "ex_sp__hl": ex_sp__hl, "ex_sp__i": ex_sp__i,
+    "inc_r": _incdec("+", "INC_F"), "inc_hl_": _incdec("+", "INC_F"),
+    "inc_i_": _incdec("+", "INC_F"), "dec_r": _incdec("-", "DEC_F"),
+    "dec_hl_": _incdec("-", "DEC_F"), "dec_i_": _incdec("-", "DEC_F"),
+    "cpl": cpl, "scf": scf, "ccf": ccf, "nop": nop,
+    "rlca": rlca, "rla": rla, "rrca": rrca, "rra": rra,
+    "add16_hl": add16_hl, "add16_i_pp": add16_i_pp,
+    "inc16_ss": inc16_ss, "dec16_ss": dec16_ss,
+    "in_a_n": in_a_n, "out_a_n": out_a_n,
+    "adc16_hl": adc16_hl, "sbc16_hl": sbc16_hl, "daa": daa, "neg": neg,
+    "bit_r": bit, "bit_hl": bit, "bit_i": bit,
+    "set_r": _set_res(True), "set_hl": _set_res(True),
+    "set_i": _set_res(True), "set_i_r": _set_res(True),
+    "res_r": _set_res(False), "res_hl": _set_res(False),
+    "res_i": _set_res(False), "res_i_r": _set_res(False),
+    "shift_i_r": shift_i_r,
+}
+for _op in ["add", "adc", "sub", "sbc", "and", "or", "xor", "cp"]:
+    for _kind in ["r", "n", "hl_", "i_"]:
+        TRANSLATIONS["%s_a_%s" % (_op, _kind)] = _alu(_op)
+# The rotates and shifts, by their handlers' names, in SHIFT_R's order
+for _op, _names in enumerate([["rlc", "rlc_hl_", "rlc_i_d"], ["rrc", "rrc_hl_", "rrc_i_d"],
+                              ["rl_r", "rl_hl", "rl_i"], ["rr_r", "rr_hl", "rr_i"],
+                              ["sla_r", "sla_hl_", "sla_i_d"], ["sra_r", "sra_hl", "sra_i"],
+                              ["sll_r", "sll_hl_", "sll_i_d"], ["srl_r", "srl_hl", "srl_i"]]):
+    for _name in _names:
+        TRANSLATIONS[_name] = _shift(_op)
+
+TERMINATORS = {
+    "jp": jp, "jr": jr, "jp_c": jp_c, "jp_r": jp_r, "djnz": djnz,
+    "jr_nz": _jr_cc(0x40, 0), "jr_z": _jr_cc(0x40, 0x40),
+    "jr_nc": _jr_cc(0x01, 0), "jr_c": _jr_cc(0x01, 0x01),
+    "call": call, "call_c": call_c, "ret": ret, "ret_c": ret_c,
+    "rst_p": rst_p,
+}
+
+
+class Recompiler(object):
+    """ Runs code as translated blocks instead of stepping the interpreter.
+
+        A block starts at the current PC and runs straight on until an
+        instruction changing PC (or the interrupt state), so it always
+        goes through from beginning to end. Blocks are translated the
+        first time they are reached and kept by their start address.
+        The recompiler takes over the bus's memory writes, a write landing
+        on translated code drops every block covering it, the block doing
+        the write runs to its end as translated. Writes that do not go
+        through the bus must call invalidate() or clear() themselves.
+
+        With dynamic False nothing is translated while running: only
+        blocks given to install() run translated, the interpreter steps
+        through everything else. """
+    def __init__(self, instructions, bus, limit=LIMIT, dynamic=True):
+        self._instructions = instructions
+        self._registers = instructions._registers
+        self._bus = bus
+        self._memory = bus.memory
+        self._limit = limit
+        self.dynamic = dynamic
+        self._blocks = {}
+        # Shortened blocks for the end of a run(), by (pc, count)
+        self._partial = {}
+        self._owners = {}
+        self._code = bytearray(0x10000)
+        # Set when a write drops a block, blocks look after every write
+        self._stale = bytearray(1)
+        # Bytes of translated code that have been written over
+        self._volatile = set()
+        self.translations = 0
+        self.invalidations = 0
+        self.attach(bus)
+
+    def attach(self, bus):
+        """ Route the bus's memory writes through the recompiler, on to
+            whatever handled them before """
+        self._write8 = bus.write8
+        self._write16 = bus.write16
+        self._wrote = bus.wrote
+        bus.write8 = self.write8
+        bus.write16 = self.write16
+        bus.wrote = self.wrote
+
+    def translate(self, pc, limit=None):
+        """ Translate the block at pc, of at most limit instructions.
+            Returns None when the first instruction does not decode. """
+        memory = self._memory
+        decode = self._instructions.decode
+        t = Translator()
+        bindings = []
+        addresses = []
+        starts = []
+        lead = 0
+        address = pc
+        ended = False
+        for number in range(limit or self._limit):
+            ins, n = decode(memory, address)
+            name = ins.executer.__name__
+            following = (address + ins.length) & 0xFFFF
+            starts.append(lead)
+            covered = [(address + k) & 0xFFFF for k in range(ins.length)]
+            t.refresh += ins.incrementR
+            t.following = following
+            t.elapsed = lead + ins.tstates
+            t.emit("# %04X %s" % (address, ins.assembler(n)))
+            operands = covered[ins.operand_start:ins.operand_start + ins.operand_count]
+            if name in RUNTIME and self._volatile.intersection(operands):
+                # Written over before, read it each time instead
+                covered = covered[:ins.operand_start]
+                if len(operands) == 1:
+                    n = t.read8("0x%04X" % operands[0])
+                else:
+                    n = t.read16(operands[0])
+            addresses.extend(covered)
+            if name in TERMINATORS:
+                TERMINATORS[name](t, ins, n, following, lead)
+                ended = True
+                break
+            if name in TRANSLATIONS and name not in CONTROL and \
+               TRANSLATIONS[name](t, ins, n, following) is not False:
+                if t.wrote:
+                    t.check()
+            else:
+                binding = "_i%04X" % address
+                bindings.append((binding, bytes(memory[(address + k) & 0xFFFF]
+                                               for k in range(ins.length))))
+                if name in CONTROL:
+                    # the handler sets PC and says what it took
+                    t.generic(binding, ins, n, following, lead)
+                    ended = True
+                    break
+                t.generic(binding, ins, n, following)
+                t.check()
+            lead += ins.tstates
+            address = following
+        if not starts:
+            return None
+        if not ended:
+            t.finish(address, lead)
+        # an EI ends a block, so the instruction after one starts a block
+        prologue = ["    registers.EI_DELAY = False"]
+        prologue += ["    %s = bus.%s" % (name, name) for name in sorted(t.uses)]
+        source = "\n".join(["def block_%04X(registers, bus, memory):" % pc] +
+                           prologue + t.lines) + "\n"
+        namespace = {"_stale": self._stale}
+        namespace.update(TABLES)
+        for binding, code in bindings:
+            namespace[binding] = self._instructions._lookup(code, 0)
+        exec(compile(source, "<block %04X>" % pc, "exec"), namespace)
+        block = Block(pc, len(starts), addresses, starts[-1], starts, source)
+        block.bindings = bindings
+        block.run = namespace["block_%04X" % pc]
+        self.translations += 1
+        return block
+
+    def _add(self, key, block):
+        """ Keep block under key, noting the bytes it was made from """
+        if key.__class__ is tuple:
+            self._partial[key] = block
+        else:
+            self._blocks[key] = block
+        owners = self._owners
+        code = self._code
+        for address in block.addresses:
+            owners.setdefault(address, set()).add(key)
+            code[address] = 1
+
+    def install(self, blocks):
+        """ Add blocks translated elsewhere, see aot """
+        for block in blocks:
+            self._add(block.pc, block)
+
+    def _fit(self, block, remaining):
+        """ The longest start of block beginning within remaining T-states """
+        count = bisect_left(block.starts, remaining)
+        key = (block.pc, count)
+        fitted = self._partial.get(key)
+        if fitted is None and self.dynamic:
+            fitted = self.translate(block.pc, count)
+            self._add(key, fitted)
+        return fitted
+
+    def block(self, pc):
+        """ The block at pc, translated now if need be """
+        block = self._blocks.get(pc)
+        if block is None and self.dynamic:
+            block = self.translate(pc)
+            if block is not None:
+                self._add(pc, block)
+        return block
+
+    def step(self):
+        """ Run the block at PC, return the T-states it took """
+        registers = self._registers
+        pc = registers.PC
+        block = self._blocks.get(pc) or self.block(pc)
+        if block is None:
+            # Not translated, or let the interpreter complain about the opcode
+            return self._instructions.step(self._bus)
+        return block.run(registers, self._bus, self._memory)
+
+    def run(self, tstates):
+        """ Run until at least tstates T-states have gone by, stopping
+            exactly where stepping the interpreter would. Returns the
+            T-states taken. """
+        registers = self._registers
+        bus = self._bus
+        memory = self._memory
+        blocks = self._blocks
+        taken = 0
+        while taken < tstates:
+            pc = registers.PC
+            block = blocks.get(pc) or self.block(pc)
+            if block is None:
+                bus.budget = tstates - taken
+                taken += self._instructions.step(bus)
+                continue
+            if taken + block.lead >= tstates:
+                block = self._fit(block, tstates - taken)
+                if block is None:
+                    bus.budget = tstates - taken
+                    taken += self._instructions.step(bus)
+                    continue
+            # what a block instruction ending the block may go round for
+            bus.budget = tstates - taken - block.lead
+            taken += block.run(registers, bus, memory)
+        return taken
+
+    def write8(self, address, value):
+        self._write8(address, value)
+        if self._code[address]:
+            self.invalidate(address)
+
+    def write16(self, address, value):
+        self._write16(address, value)
+        code = self._code
+        if code[address]:
+            self.invalidate(address)
+        high = (address + 1) & 0xFFFF
+        if code[high]:
+            self.invalidate(high)
+
+    def wrote(self, address, count, step=1):
+        self._wrote(address, count, step)
+        code = self._code
+        for start, end in written(address, count, step):
+            if code.count(0, start, end) != end - start:
+                for address in range(start, end):
+                    if code[address]:
+                        self.invalidate(address)
+
+    def invalidate(self, address):
+        """ Drop every block made from the byte at address """
+        owners = self._owners
+        code = self._code
+        for key in owners.pop(address, ()):
+            if key.__class__ is tuple:
+                block = self._partial.pop(key, None)
+            else:
+                block = self._blocks.pop(key, None)
+            if block is None:
+                continue
+            self.invalidations += 1
+            for other in block.addresses:
+                keys = owners.get(other)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del owners[other]
+                        code[other] = 0
+        code[address] = 0
+        self._stale[0] = 1
+        self._volatile.add(address)
+
+    def clear(self):
+        self._blocks = {}
+        self._partial = {}
+        self._owners = {}
+        self._code = bytearray(0x10000)
+        self._volatile = set()
+
+    def stats(self):
+        return {"blocks": len(self._blocks), "translations": self.translations,
+                "invalidations": self.invalidations}
@@ -1,101 +1,255 @@
-class BitAccesser(object):
-    def __init__(self, bit_names, registers, reg):
-        object.__setattr__(self, "bits",
-                           dict(zip(bit_names, range(7, -1, -1))))
-        self.registers = registers
-        #self.registers = registers
-        self.reg = reg
-        
-    def __getattr__(self, b):
-        return (self.registers[self.reg] >>  self.bits[b]) &  1 
-    
-    def __setattr__(self, b, v):
-        if not b in self.bits:
-            object.__setattr__(self, b, v)
-            return
+import operator
+
+# Bit positions of the flags in F
+flag_bits = {"S": 7, "Z": 6, "F5": 5, "H": 4, "F3": 3, "PV": 2, "N": 1, "C": 0}
+
+# Every register kept, in the order reset() sets them
+NAMES = ["PC", "SP", "IX", "IY", "I", "R", "A", "F", "A_", "F_",
+         "B", "C", "B_", "C_", "D", "E", "D_", "E_", "H", "L", "H_", "L_",
+         "HALT", "IFF", "IFF2", "IM", "EI_DELAY"]
+
 
+def _flag(bit):
+    mask = 1 << bit
+    def get(self):
+        return self.registers.F >> bit & 1
+    def put(self, v):
+        registers = self.registers
         if v:
-            self.registers[self.reg] = self.registers[self.reg] | (1 <<  self.bits[b])
+            registers.F = registers.F | mask
         else:
-            self.registers[self.reg] = self.registers[self.reg] & ((1 <<  self.bits[b]) ^  0xFF)
-            
-class Registers(dict):
-    def __init__(self, *arg, **kw):
-        super(Registers, self).__init__(*arg, **kw)
+            registers.F = registers.F & (mask ^ 0xFF)
+    return property(get, put)
+
+class Flags(object):
+    """ The bits of F by name, registers.condition.Z and so on """
+    __slots__ = ["registers"]
+
+    def __init__(self, registers):
+        self.registers = registers
+
+    S = _flag(7)
+    Z = _flag(6)
+    F5 = _flag(5)
+    H = _flag(4)
+    F3 = _flag(3)
+    PV = _flag(2)
+    N = _flag(1)
+    C = _flag(0)
 
+
+class Registers(object):
+    """ The register file, a slot for each register and properties for
+        the pairs made of two of them and the halves of IX and IY.
+
+        registers["A"] and registers["HL"] are still understood, as
+        getattr and setattr under another name. """
+    __slots__ = NAMES + ["condition"]
+
+    # F is always up to date, see LazyRegisters
+    lazy = False
+
+    def __init__(self):
+        self.condition = Flags(self)
         self.reset()
-        
+
     def reset(self):
-        self["PC"] = 0 # Program Counter (16bit)
-        self["SP"] = 0 # Stack Pointer (16bit)
-        self["IX"] = 0 # Index Register X (16bit)
-        self["IY"] = 0 # Index Register Y (16bit)
-        self["I"] = 0  # Interrupt Page Address (8bit)
-        self["R"] = 0  # Memory Refresh (8bit)
-
-        self["A"] = 0 # Accumulator (8bit)
-        self["F"] = 0 # Flags (8bit)
-        self["A_"] = 0 # Alt. Accumulator (8bit)
-        self["F_"] = 0 # Alt. Flags (8bit)
-
-        self["B"] = 0 # General (8bit)
-        self["C"] = 0 # General (8bit)
-        self["B_"] = 0 # General (8bit)
-        self["C_"] = 0 # General (8bit)
-
-        self["D"] = 0 # General (8bit)
-        self["E"] = 0 # General (8bit)
-        self["D_"] = 0 # General (8bit)
-        self["E_"] = 0 # General (8bit)
-
-        self["H"] = 0 # General (8bit)
-        self["L"] = 0 # General (8bit)
-        self["H_"] = 0 # General (8bit)
-        self["L_"] = 0 # General (8bit)
-
-        self["condition"] = BitAccesser(["S", "Z", "F5", "H", "F3", "PV", "N", "C"], self, "F")
-        
-        self['HALT']=False #
-        self['IFF']=False  # Interrupt flip flop
-        self['IFF2']=False  # NM Interrupt flip flop
-        self['IM']=False   # Iterrupt mode
-
-    def __setattr__(self, attr, val):
-        if attr  in ["HL", "AF", "BC", "DE"]:
-            self[attr[0]] = val >> 8
-            self[attr[1]] = val &  0xFF
-        elif attr in ["IXH", "IYH"]:
-            self[attr[0:2]] = (self[attr[0:2]] & 0x00FF) | (val << 8)
-        elif attr in ["IXL", "IYL"]:
-            self[attr[0:2]] = (self[attr[0:2]] & 0xFF00) | val
-        else:
-            self[attr] = val
-
-    def __getattr__(self, reg):
-        if reg in self:
-            return self[reg]
-        elif reg in ["HL", "AF", "BC", "DE"]:
-            return self[reg[0]] << 8 |  self[reg[1]]
-        elif reg in ["IXH", "IYH"]:
-            return self[reg[0:2]] >> 8
-        elif reg in ["IXL", "IYL"]:
-            return self[reg[0:2]] & 0xFF
-        else:
-            raise AttributeError("%s Not a known register."%reg)
-        
+        self.PC = 0 # Program Counter (16bit)
+        self.SP = 0 # Stack Pointer (16bit)
+        self.IX = 0 # Index Register X (16bit)
+        self.IY = 0 # Index Register Y (16bit)
+        self.I = 0  # Interrupt Page Address (8bit)
+        self.R = 0  # Memory Refresh (8bit)
+
+        self.A = 0 # Accumulator (8bit)
+        self.F = 0 # Flags (8bit)
+        self.A_ = 0 # Alt. Accumulator (8bit)
+        self.F_ = 0 # Alt. Flags (8bit)
+
+        self.B = 0 # General (8bit)
+        self.C = 0 # General (8bit)
+        self.B_ = 0 # General (8bit)
+        self.C_ = 0 # General (8bit)
+
+        self.D = 0 # General (8bit)
+        self.E = 0 # General (8bit)
+        self.D_ = 0 # General (8bit)
+        self.E_ = 0 # General (8bit)
+
+        self.H = 0 # General (8bit)
+        self.L = 0 # General (8bit)
+        self.H_ = 0 # General (8bit)
+        self.L_ = 0 # General (8bit)
+
+        self.HALT = False #
+        self.IFF = False  # Interrupt flip flop
+        self.IFF2 = False  # NM Interrupt flip flop
+        self.IM = False   # Iterrupt mode
+        self.EI_DELAY = False  # EI just run, no interrupt before the next instruction
+
+    @property
+    def AF(self):
+        return self.A << 8 | self.F
+
+    @AF.setter
+    def AF(self, val):
+        self.A = val >> 8
+        self.F = val & 0xFF
+
+    @property
+    def BC(self):
+        return self.B << 8 | self.C
+
+    @BC.setter
+    def BC(self, val):
+        self.B = val >> 8
+        self.C = val & 0xFF
+
+    @property
+    def DE(self):
+        return self.D << 8 | self.E
+
+    @DE.setter
+    def DE(self, val):
+        self.D = val >> 8
+        self.E = val & 0xFF
+
+    @property
+    def HL(self):
+        return self.H << 8 | self.L
+
+    @HL.setter
+    def HL(self, val):
+        self.H = val >> 8
+        self.L = val & 0xFF
+
+    @property
+    def IXH(self):
+        return self.IX >> 8
+
+    @IXH.setter
+    def IXH(self, val):
+        self.IX = (self.IX & 0x00FF) | (val << 8)
+
+    @property
+    def IXL(self):
+        return self.IX & 0xFF
+
+    @IXL.setter
+    def IXL(self, val):
+        self.IX = (self.IX & 0xFF00) | val
+
+    @property
+    def IYH(self):
+        return self.IY >> 8
+
+    @IYH.setter
+    def IYH(self, val):
+        self.IY = (self.IY & 0x00FF) | (val << 8)
+
+    @property
+    def IYL(self):
+        return self.IY & 0xFF
+
+    @IYL.setter
+    def IYL(self, val):
+        self.IY = (self.IY & 0xFF00) | val
+
     def __getitem__(self, reg):
-        if reg in ["BC", "HL", "DE", "AF", "IXH", "IXL", "IYH", "IYL"]:
+        try:
             return getattr(self, reg)
-        else:
-            return super(Registers, self).__getitem__(reg)
-        
+        except AttributeError:
+            raise KeyError(reg)
+
     def __setitem__(self, reg, val):
-        if reg in ["BC", "HL", "DE", "AF", "IXH", "IXL", "IYH", "IYL"]:
-            return setattr(self, reg, val)
-        else:
-            return super(Registers, self).__setitem__(reg, val)
-    
+        setattr(self, reg, val)
+
     @classmethod
     def create(cls):
         return cls()
-        
+
+    def clone(self):
+        """ Return an independent copy of the register values """
+        r = self.create()
+        for name in NAMES:
+            setattr(r, name, getattr(self, name))
+        return r
+
+
+# Longest chain of operations each keeping some flags of the one before
+DEPTH = 4
+
+# F as Registers keeps it, under LazyRegisters' property
+_F = Registers.F
+
+class LazyRegisters(Registers):
+    """ Registers that work out F only when something reads it.
+
+        The ALU helpers left in util (add8, subtract8 and set_f5_f3, for
+        the 16 bit arithmetic and the block compares) hand over what they
+        were given through defer() instead of setting flag bits. Any read
+        of F, directly, through AF or condition, runs the noted operation
+        and keeps the F it gives. Writing F forgets whatever was pending.
+
+        An operation keeping some of the flags from before (set_f5_f3)
+        notes the pending one as well, up to DEPTH deep. """
+    __slots__ = ["_pending"]
+
+    lazy = True
+
+    def __init__(self):
+        self._pending = None
+        super(LazyRegisters, self).__init__()
+
+    @property
+    def F(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            _F.__set__(self, self._flags(pending))
+        return _F.__get__(self)
+
+    @F.setter
+    def F(self, val):
+        self._pending = None
+        _F.__set__(self, val)
+
+    def defer(self, evaluate, x, y, z, full):
+        """ Note that evaluate(x, y, z, prev) gives the flags. full says
+            it sets all eight, otherwise it needs prev, F as it is now. """
+        if full:
+            prev = 0
+            depth = 0
+        else:
+            prev = self._pending
+            if prev is None:
+                prev = _F.__get__(self)
+                depth = 0
+            else:
+                depth = prev[5] + 1
+                if depth == DEPTH:
+                    prev = self.F
+                    depth = 0
+        self._pending = (evaluate, x, y, z, prev, depth)
+
+    def _flags(self, pending):
+        evaluate, x, y, z, prev, depth = pending
+        if depth:
+            prev = self._flags(prev)
+        return evaluate(x, y, z, prev)
+
+
+def reader(reg):
+    """ Return a function reading register reg out of a Registers.
+        Handlers bind these when the instruction tables are built so
+        there is no register name lookup left when they run. """
+    return operator.attrgetter(reg)
+
+def writer(reg):
+    """ Return a function writing register reg of a Registers """
+    if reg == "F":
+        # LazyRegisters has its own
+        def write(registers, val):
+            registers.F = val
+        return write
+    return getattr(Registers, reg).__set__
@@ -0,0 +1,211 @@
+""" Running a machine for a while rather than an instruction at a time,
+    see pacing for holding it to a clock and scheduler for device events """
+from collections import namedtuple
+from time import perf_counter
+
+from . pacing import CLOCK
+
+# Why a run came back
+CYCLES = "cycles"
+PC = "pc"
+PREDICATE = "predicate"
+TIME = "time"
+STOPPED = "stopped"
+
+# T-states run between looks at interrupts, stop() and the clock, when
+# no device event comes sooner
+SLICE = 2000
+
+Result = namedtuple("Result", ["tstates", "reason"])
+
+
+class Runner(object):
+    """ run(), run_until() and run_for() for a machine.
+
+        The machine has registers, instructions, _bus and _recompiler,
+        None to interpret everything, a scheduler and a poll() taking
+        whatever is pending (an interrupt) and returning the T-states
+        that took. Code runs straight up to the scheduler's next event,
+        or SLICE T-states, and poll(), the clock and stop() are looked
+        at in between, never per instruction. A halted CPU, or one going
+        round an idle loop the machine's idle (see idle) finds, skips
+        straight there; run_for() and run_paced() block the host
+        meanwhile. Each run returns a Result, the T-states it took and
+        why it stopped, and adds them to cycles, the T-states the machine
+        has run in all. """
+    _stop = False
+    cycles = 0
+    idle = None
+
+    def stop(self):
+        """ Have the run going on return at its next look, from any thread """
+        self._stop = True
+        if self.idle is not None:
+            self.idle.wake()
+
+    def poll(self):
+        return 0
+
+    def _done(self, taken, reason):
+        self.cycles += taken
+        return Result(taken, reason)
+
+    def _slice(self, taken, tstates, longest=0, hz=None):
+        """ taken T-states into a run, run at least tstates more or up to
+            the next event and run the events due, return how many ran.
+            Halted or idle it may go on for up to longest instead, taking
+            the time to at hz T-states a host second when hz is given. """
+        scheduler = self.scheduler
+        now = self.cycles + taken
+        wait = scheduler.due - now
+        if tstates > wait:
+            tstates = wait
+        if longest > wait:
+            longest = wait
+        registers = self.registers
+        if registers.HALT:
+            ran = self._halted(self._wait(max(tstates, longest), hz))
+        elif longest > tstates and self.idle is not None:
+            ran, loop = self.idle.probe(self)
+            if loop is None:
+                ran += self._execute(tstates - ran)
+            else:
+                period, refresh = loop
+                count = self._wait(longest - ran, hz) // period
+                r = registers.R
+                registers.R = (r + count * refresh) & 0x7F | r & 0x80
+                ran += count * period
+        else:
+            ran = self._execute(tstates)
+        if now + ran >= scheduler.due:
+            scheduler.run_due(now + ran)
+        return ran
+
+    def _execute(self, tstates):
+        """ Run at least tstates T-states, return how many """
+        if self._recompiler is not None:
+            return self._recompiler.run(tstates)
+        step = self.instructions.step
+        bus = self._bus
+        taken = 0
+        while taken < tstates:
+            bus.budget = tstates - taken
+            taken += step(bus)
+        return taken
+
+    def _wait(self, tstates, hz):
+        """ Take the time to tstates at hz, less if woken first, return
+            how many that was """
+        if hz is None or self.idle is None:
+            return tstates
+        seconds = self.idle.wait(tstates / hz)
+        return min(tstates, int(seconds * hz))
+
+    def _halted(self, tstates):
+        """ A halted CPU runs HALT until it is interrupted: run enough of
+            them for tstates without decoding any, 4 T-states and a
+            refresh each """
+        count = (tstates + 3) >> 2 if tstates > 0 else 0
+        registers = self.registers
+        r = registers.R
+        registers.R = (r + count) & 0x7F | r & 0x80
+        return count << 2
+
+    def run(self, cycles):
+        """ Run for at least cycles T-states, stopping at the first
+            instruction boundary after """
+        self._stop = False
+        taken = 0
+        while taken < cycles:
+            if self._stop:
+                return self._done(taken, STOPPED)
+            taken += self.poll()
+            taken += self._slice(taken, min(SLICE, cycles - taken), cycles - taken)
+        return self._done(taken, CYCLES)
+
+    def run_for(self, seconds):
+        """ Run for about seconds of host time """
+        self._stop = False
+        deadline = perf_counter() + seconds
+        taken = 0
+        while True:
+            if self._stop:
+                return self._done(taken, STOPPED)
+            taken += self.poll()
+            left = int((deadline - perf_counter()) * CLOCK)
+            taken += self._slice(taken, SLICE, left, CLOCK)
+            if perf_counter() >= deadline:
+                return self._done(taken, TIME)
+
+    def run_paced(self, pacer, seconds=None):
+        """ Run at the speed pacer keeps to, for seconds of host time or
+            until stop() """
+        self._stop = False
+        deadline = None if seconds is None else perf_counter() + seconds
+        pacer.start(self.cycles)
+        chunk = pacer.chunk
+        hz = pacer.hz or pacer.clock
+        taken = 0
+        while True:
+            target = taken + chunk
+            while taken < target:
+                if self._stop:
+                    return self._done(taken, STOPPED)
+                taken += self.poll()
+                taken += self._slice(taken, min(SLICE, target - taken), target - taken, hz)
+            pacer.pace(self.cycles + taken)
+            if deadline is not None and perf_counter() >= deadline:
+                return self._done(taken, TIME)
+
+    def run_until(self, pc=None, predicate=None, cycles=None):
+        """ Run until PC is pc, predicate(machine) is true before an
+            instruction or cycles T-states have gone by, whichever comes
+            first. With a predicate every instruction is interpreted,
+            otherwise translated blocks run whole unless pc is inside or
+            they would go past cycles. """
+        if pc is None and predicate is None and cycles is None:
+            raise ValueError("run_until needs pc, predicate or cycles")
+        self._stop = False
+        registers = self.registers
+        step = self.instructions.step
+        bus = self._bus
+        memory = bus.memory
+        recompiler = self._recompiler if predicate is None else None
+        block_at = recompiler.block if recompiler is not None else None
+        scheduler = self.scheduler
+        base = self.cycles
+        taken = 0
+        while True:
+            if self._stop:
+                return self._done(taken, STOPPED)
+            taken += self.poll()
+            boundary = taken + SLICE
+            while taken < boundary:
+                here = registers.PC
+                if here == pc:
+                    return self._done(taken, PC)
+                if predicate is not None and predicate(self):
+                    return self._done(taken, PREDICATE)
+                if cycles is not None and taken >= cycles:
+                    return self._done(taken, CYCLES)
+                if base + taken >= scheduler.due:
+                    scheduler.run_due(base + taken)
+                    taken += self.poll()
+                    continue
+                limit = scheduler.due - base
+                if cycles is not None and cycles < limit:
+                    limit = cycles
+                if registers.HALT and predicate is None:
+                    taken += self._halted(min(boundary, limit) - taken)
+                    continue
+                if block_at is not None:
+                    block = block_at(here)
+                    if (block is not None and (pc is None or pc not in block.addresses) and
+                            (cycles is None or taken + block.lead < cycles) and
+                            base + taken + block.lead < scheduler.due):
+                        bus.budget = limit - taken - block.lead
+                        taken += block.run(registers, bus, memory)
+                        continue
+                # with a predicate each time round is an instruction
+                bus.budget = 0 if predicate is not None else limit - taken
+                taken += step(bus)
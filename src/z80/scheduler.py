@@ -0,0 +1,64 @@
+""" Events for devices, due at a T-state of the machine's clock """
+import heapq
+
+# due when nothing is waiting
+NEVER = 1 << 62
+
+
+class Event(object):
+    __slots__ = ["when", "seq", "callback", "args"]
+
+    def __init__(self, when, seq, callback, args):
+        self.when = when
+        self.seq = seq
+        self.callback = callback
+        self.args = args
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+class Scheduler(object):
+    """ A heap of callbacks keyed by the absolute T-state they are due at.
+
+        The run loop runs straight up to due, the earliest of them, then
+        calls run_due(); nothing is looked at in between. Callbacks are
+        called with their arguments, now being the T-state they run at,
+        and may schedule more. Only the thread running the machine adds
+        events. """
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+        self.now = 0
+        self.due = NEVER
+
+    def at(self, when, callback, *args):
+        """ Call callback(*args) once the machine gets to T-state when,
+            return the event for cancel() """
+        self._seq += 1
+        event = Event(when, self._seq, callback, args)
+        heapq.heappush(self._heap, event)
+        if when < self.due:
+            self.due = when
+        return event
+
+    def after(self, delay, callback, *args):
+        """ The same, delay T-states from now """
+        return self.at(self.now + delay, callback, *args)
+
+    def cancel(self, event):
+        # left in the heap, skipped when it comes up
+        event.callback = None
+
+    def run_due(self, now):
+        """ The machine is at T-state now, run everything due by then """
+        self.now = now
+        heap = self._heap
+        while heap and heap[0].when <= now:
+            event = heapq.heappop(heap)
+            if event.callback is not None:
+                event.callback(*event.args)
+        self.due = heap[0].when if heap else NEVER
+
+    def __len__(self):
+        return sum(1 for event in self._heap if event.callback is not None)
@@ -0,0 +1,164 @@
+""" Tracing, for what used to be printed as it happened
+
+    Events belong to a category, each with its own level:
+
+        decode      every instruction fetched, with its disassembly
+        alu         16 bit arithmetic and what it gave
+        io          port reads and writes
+        interrupts  interrupts raised and taken
+        init        the instruction tables being built
+
+    A category keeps a boolean per level, so code emitting an event
+    tests that first and does nothing else while tracing is off:
+
+        if trace.alu.debug:
+            trace.alu.emit(trace.DEBUG, "%04X + %04X = %05X", a, b, res)
+
+    The message and its arguments are kept as they are until a sink takes
+    the event; message can also be a function called with the arguments.
+    Events go to every sink added, stderr, a file or a ring of the latest
+    ones in memory.
+
+        trace.configure("decode,io=info")
+"""
+import collections
+import sys
+import time
+from logging import DEBUG, INFO
+
+
+class Event(object):
+    __slots__ = ["time", "category", "level", "message", "args"]
+
+    def __init__(self, category, level, message, args):
+        self.time = time.perf_counter()
+        self.category = category
+        self.level = level
+        self.message = message
+        self.args = args
+
+    def text(self):
+        """ The message formatted with its arguments """
+        if callable(self.message):
+            return self.message(*self.args)
+        if self.args:
+            return self.message % self.args
+        return self.message
+
+    def __str__(self):
+        return "%s: %s" % (self.category, self.text())
+
+
+class Category(object):
+    """ One kind of event and the level it is traced at """
+    __slots__ = ["name", "level", "info", "debug"]
+
+    def __init__(self, name):
+        self.name = name
+        self.set_level(None)
+
+    def set_level(self, level):
+        """ Trace events at level and above, None for none at all """
+        self.level = level
+        self.info = level is not None and level <= INFO
+        self.debug = level is not None and level <= DEBUG
+
+    def emit(self, level, message, *args):
+        event = Event(self.name, level, message, args)
+        for sink in sinks:
+            sink.write(event)
+
+
+decode = Category("decode")
+alu = Category("alu")
+io = Category("io")
+interrupts = Category("interrupts")
+init = Category("init")
+
+CATEGORIES = dict((category.name, category)
+                  for category in [decode, alu, io, interrupts, init])
+
+LEVELS = {"debug": DEBUG, "info": INFO}
+
+sinks = []
+
+
+class StreamSink(object):
+    """ Writes each event as a line to a stream, stderr unless told """
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, event):
+        stream = self.stream if self.stream is not None else sys.stderr
+        stream.write(str(event) + "\n")
+
+    def close(self):
+        pass
+
+
+class FileSink(StreamSink):
+    """ Writes each event as a line to a file """
+    def __init__(self, path):
+        super(FileSink, self).__init__(open(path, "w"))
+
+    def close(self):
+        self.stream.close()
+
+
+class RingSink(object):
+    """ Keeps the latest size events, formatted only when asked for """
+    def __init__(self, size=1024):
+        self.events = collections.deque(maxlen=size)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def lines(self):
+        return [str(event) for event in self.events]
+
+    def close(self):
+        pass
+
+
+def enable(name, level=DEBUG):
+    CATEGORIES[name].set_level(level)
+
+def disable(name):
+    CATEGORIES[name].set_level(None)
+
+def add_sink(sink):
+    sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    sinks.remove(sink)
+    sink.close()
+
+def reset():
+    """ Turn every category off and close every sink """
+    for category in CATEGORIES.values():
+        category.set_level(None)
+    while sinks:
+        remove_sink(sinks[-1])
+
+def configure(spec, sink=None):
+    """ Enable the categories in spec, "name" or "name=level" separated
+        by commas, "all" for every one, and send events to sink, stderr
+        if there is none yet """
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, level = item.partition("=")
+        level = LEVELS[level] if level else DEBUG
+        if name == "all":
+            for category in CATEGORIES:
+                enable(category, level)
+        elif name in CATEGORIES:
+            enable(name, level)
+        else:
+            raise ValueError("%s Not a known trace category." % name)
+    if sink is not None:
+        add_sink(sink)
+    elif not sinks:
+        add_sink(StreamSink())
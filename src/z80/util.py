@@ -1,3 +1,6 @@
+from . import trace
+from . trace import DEBUG
+
 register_bits = {'A': 7, 'B': 0, 'C': 1, 'D': 2, 'E': 3, 'H': 4, 'L': 5}
 index_bytes = [(0xDD, 'IX'), (0xfd, 'IY')]
 #              i, name, bit, val
@@ -39,6 +42,9 @@ def subtract8(a, b, registers, S=True, N=True, Z=True,
               F3=True, F5=True, H=True, PV=False, C=False):
     """ subtract b from a,  return result and set flags """
     res = a - b
+    if registers.lazy and S and N and Z and F3 and F5 and H and PV == C:
+        registers.defer(_subtract8_flags, a, b, PV, PV)
+        return res & 0xFF
     if S:
         registers.condition.S = (res >> 7) &  0x01
     if N:
@@ -78,6 +84,9 @@ def add8(a, b, registers, S=True, Z=True, H=True,
          PV=True, N=True, C=True, F3=True, F5=True):
     """ add a and b,  return result and set flags """
     res = a + b
+    if registers.lazy and S and Z and H and PV and N and F3 and F5:
+        registers.defer(_add8_flags, a, b, C, C)
+        return res & 0xFF
     if S:
         registers.condition.S = (res >> 7) &  0x01
     if Z:
@@ -105,7 +114,8 @@ def add8(a, b, registers, S=True, Z=True, H=True,
 def add16(a, b, registers):
     """ add a and b,  return result and set flags """
     res = a + b
-    print (a, "+",b,"=",res)
+    if trace.alu.debug:
+        trace.alu.emit(DEBUG, "%04X + %04X = %05X", a, b, res)
     registers.condition.S = (res >> 15) &  0x01
     registers.condition.Z = (res == 0)
     if ((a & 0xFFF) + (b & 0xFFF)) > 0xFFF :
@@ -126,7 +136,8 @@ def add16(a, b, registers):
 def subtract16(a, b, registers):
     """ subtract b from a,  return result and set flags """
     res = a - b
-    print (a, "-", b, "=", res, "(", hex(res), ")")
+    if trace.alu.debug:
+        trace.alu.emit(DEBUG, "%04X - %04X = %05X", a, b, res & 0x1FFFF)
     registers.condition.S = (res >> 15) &  0x01
     registers.condition.N = 1
     registers.condition.Z = (res == 0)
@@ -175,147 +186,65 @@ def parity(n):
         p+=(n >> i) & 0x01
     return not (p % 2) 
 
-def a_and_n(registers, n):
-    registers.A = registers.A & n
-    registers.condition.H = 1
-    registers.condition.N = 0
-    registers.condition.PV = parity(registers.A)
-    registers.condition.C = 0
-    registers.condition.Z = (registers.A==0)
-    registers.condition.S = (registers.A>>7)
-    set_f5_f3_from_a(registers)
-
-
-def a_or_n(registers, n):
-    registers.A = registers.A | n
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(registers.A)
-    registers.condition.C = 0
-    registers.condition.Z = (registers.A==0)
-    registers.condition.S = (registers.A>>7)    
-    set_f5_f3_from_a(registers)    
-    
-def a_xor_n(registers, n):
-    registers.A = registers.A ^ n
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(registers.A)
-    registers.condition.C = 0
-    registers.condition.Z = (registers.A==0)
-    registers.condition.S = (registers.A>>7)    
-    set_f5_f3_from_a(registers)
- 
-def rotate_left_carry(registers, n):
-    c = n >> 7
-    v = (n << 1 | c) & 0xFF
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-def rotate_left(registers, n):
-    c = n >> 7
-    v = (n << 1 | registers.condition.C) & 0xFF
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-    
- 
-def rotate_right_carry(registers, n):
-    c = n & 0x01
-    v = n >> 1 | (c << 7)
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-def rotate_right(registers, n):
-    c = n & 0x01
-    v = n >> 1 | (registers.condition.C << 7)
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-def shift_left(registers, n):
-    c = n >> 7
-    v = (n << 1 ) & 0xFF
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-def shift_left_logical(registers, n):
-    c = n >> 7
-    v = ((n << 1 ) & 0xFF) | 0x01
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-def shift_right(registers, n):
-    c = n & 0x01
-    msb = n >> 7
-    v = n >> 1 | (msb << 7)
-    registers.condition.S = v >> 7
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
-def shift_right_logical(registers, n):
-    c = n & 0x01
-    v = n >> 1
-    registers.condition.S = 0
-    registers.condition.Z = (v == 0)
-    registers.condition.H = 0
-    registers.condition.N = 0
-    registers.condition.PV = parity(v)
-    registers.condition.C = c
-    return v
-
-
 def offset_pc(registers, jump):
-    registers.PC += get_8bit_twos_comp(jump)
-    if registers.PC > 0xFFFF:
-        registers.PC -= 0xFFFF - 1
-    if registers.PC < 0:
-        registers.PC += 0xFFFF + 1
+    registers.PC = (registers.PC + get_8bit_twos_comp(jump)) & 0xFFFF
+
+def rounds(count, budget, tstates):
+    """ How many times a block instruction with count left (0 meaning
+        65536) goes round in budget T-states, tstates a time, the last
+        time round ending at or past it """
+    n = -(-budget // tstates) if budget > tstates else 1
+    count = count or 0x10000
+    return count if n >= count else n
+
+def refresh(registers, n):
+    """ n more opcode fetches """
+    r = registers.R
+    registers.R = (r + n) & 0x7F | r & 0x80
         
 def set_f5_f3(registers, v):
+    if registers.lazy:
+        registers.defer(_f5_f3_flags, v, None, None, False)
+        return
     registers.condition.F5 = v & 0x20
     registers.condition.F3 = v & 0x08
         
 def set_f5_f3_from_a(registers):
     set_f5_f3(registers, registers.A)
-    
\ No newline at end of file
+    
+
+
+# Lazy flags: what LazyRegisters calls to build F when it is read, each
+# gives the F the helper above leaves, from what it was handed and the F
+# from before
+def _add8_flags(a, b, c, prev):
+    res = a + b
+    f = res & 0xA8
+    if not res & 0xFF:
+        f |= 0x40
+    if (a & 0xF) + (b & 0xF) > 0xF:
+        f |= 0x10
+    if (a >> 7) == (b >> 7) and (a >> 7) != ((res & 0xFF) >> 7):
+        f |= 0x04
+    if c:
+        return f | (res >> 8) & 0x01
+    return f | prev & 0x01
+
+def _subtract8_flags(a, b, pv_c, prev):
+    res = a - b
+    f = (res & 0xA8) | 0x02
+    if res == 0:
+        f |= 0x40
+    if (b & 0xF) > (a & 0xF):
+        f |= 0x10
+    if not pv_c:
+        return f | prev & 0x05
+    d = get_8bit_twos_comp(a) - get_8bit_twos_comp(b)
+    if d < -127 or d > 128:
+        f |= 0x04
+    if res & 0x100:
+        f |= 0x01
+    return f
+
+def _f5_f3_flags(v, _, __, prev):
+    return (prev & 0xD7) | (v & 0x28)